@@ -0,0 +1,145 @@
+"""
+Detecção de desconexão em lote para vários clientes.
+
+Em vez de cada cliente tirar seu próprio screenshot e rodar sua própria
+busca, o detector captura um único frame cobrindo todas as janelas
+registradas, converte para tons de cinza uma vez e recorta cada janela como
+uma view (sem cópia). Cada cliente tem uma vigia (scheduler.DisconnectWatch)
+que compara só uma miniatura da sua região nesse frame; o template de
+desconexão é procurado, em paralelo no pool de matching compartilhado,
+apenas nas janelas cuja região mudou (ou que estão sem verificação há
+`full_check_interval` segundos).
+"""
+import time
+
+import template_registry
+from capture import clip_region, crop_view, grab
+from liveness import central_region
+from matcher import MatchJob
+from scheduler import DisconnectWatch
+
+
+def union_region(regions):
+    """Menor retângulo que contém todas as regiões"""
+    left = min(r[0] for r in regions)
+    top = min(r[1] for r in regions)
+    right = max(r[0] + r[2] for r in regions)
+    bottom = max(r[1] + r[3] for r in regions)
+    return (left, top, right - left, bottom - top)
+
+
+class BatchDisconnectDetector:
+    """
+    Procura o diálogo de desconexão em todas as janelas registradas a partir de um frame.
+
+    Com um índice de hotspots, cada janela é restrita à área em volta de onde
+    o diálogo apareceu da última vez (relativa à janela); sem ele, a janela
+    inteira é usada. A cada `full_check_interval` segundos as janelas inteiras
+    são verificadas, caso o diálogo apareça em outro lugar.
+
+    A miniatura de cada cliente é a do hotspot ou, sem ele, a do centro da
+    janela; sem hotspot, as verificações por mudança ficam espaçadas por
+    `cold_check_interval` (o centro da janela muda o tempo todo com o jogo).
+    Como no RegionLocator, a busca do diálogo é em cores por padrão (`color`).
+    """
+
+    def __init__(self, image_path='desconectado.png', confidence=0.9, hotspots=None, pool=None,
+                 full_check_interval=10.0, min_check_interval=0.5, cold_check_interval=3.0,
+                 color=True, clock=time.monotonic):
+        self.image_path = image_path
+        self.confidence = confidence
+        self.hotspots = hotspots
+        self.matcher = template_registry.registry().matcher({image_path: image_path}, pool=pool, color=color)
+        self.full_check_interval = full_check_interval
+        self.min_check_interval = min_check_interval
+        self.cold_check_interval = cold_check_interval
+        self.clock = clock
+        self.checks = 0  # buscas do template feitas (diagnóstico)
+        self._last_full = None
+        self._clients = {}
+        self._watches = {}
+        self._gates = {}     # id -> região amostrada pela vigia nesta passada
+        self._learned = set()  # ids cuja janela já tem hotspot do diálogo
+        self._due = set()    # ids cuja vigia pediu verificação nesta passada
+        self._frame = None   # (frame preparado para a busca, origem) desta passada
+
+    def register(self, client_id, region_provider):
+        """Registra um cliente; `region_provider()` retorna o retângulo atual da janela ou None"""
+        self._clients[client_id] = region_provider
+        self._watches[client_id] = DisconnectWatch(
+            check=lambda: self._due.add(client_id),
+            region_provider=lambda: self._gates.get(client_id),
+            min_check_interval=self.min_check_interval,
+            max_check_interval=float('inf'),  # a verificação periódica é a passada completa de detect()
+            cold_check_interval=self.cold_check_interval,
+            learned=lambda: client_id in self._learned,
+            grab=self._view,
+            clock=self.clock,
+        )
+
+    def unregister(self, client_id):
+        self._clients.pop(client_id, None)
+        self._watches.pop(client_id, None)
+
+    def _view(self, region):
+        prepared, origin = self._frame
+        return crop_view(prepared, origin, region)
+
+    def _search_region(self, window, full):
+        """Região de busca de uma janela: hotspot mais largo (se conhecido) ou a janela inteira"""
+        if self.hotspots is not None and not full:
+            origin, resolution = window[:2], window[2:]
+            regions = self.hotspots.regions(self.image_path, resolution, origin)
+            if regions:
+                return clip_region(regions[-1], window) or window
+        return window
+
+    def detect(self, client_ids=None):
+        """Retorna o conjunto de ids dos clientes cuja janela mostra o diálogo de desconexão"""
+        ids = list(self._clients) if client_ids is None else [c for c in client_ids if c in self._clients]
+        windows = {}
+        for cid in ids:
+            window = clip_region(self._clients[cid]())
+            if window is not None:
+                windows[cid] = window
+        if not windows:
+            return set()
+
+        now = self.clock()
+        full = self._last_full is None or now - self._last_full >= self.full_check_interval
+        if full:
+            self._last_full = now
+        searches = {cid: self._search_region(window, full) for cid, window in windows.items()}
+        hotspots = {cid: self._search_region(window, False) for cid, window in windows.items()}
+        self._learned = {cid for cid, region in hotspots.items() if region != windows[cid]}
+        self._gates = {cid: region if cid in self._learned else central_region(region)
+                       for cid, region in hotspots.items()}
+        frame, origin = grab(union_region(list(searches.values()) + list(self._gates.values())))
+        prepared = self.matcher.prepare_frame(frame)
+
+        # Miniatura de cada cliente: só as regiões que mudaram (ou todas, na verificação completa) são buscadas
+        self._frame = (prepared, origin)
+        self._due = set()
+        for cid in windows:
+            self._watches[cid].poll()
+        if not full:
+            searches = {cid: region for cid, region in searches.items() if cid in self._due}
+        self._frame = None
+
+        ids, jobs = [], []
+        for cid, region in searches.items():
+            view, view_origin = crop_view(prepared, origin, region)
+            if view is not None:
+                ids.append(cid)
+                jobs.append(MatchJob(self.matcher, view, self.image_path, self.confidence, 1, view_origin))
+        self.checks += len(jobs)
+
+        disconnected = set()
+        for cid, candidates in zip(ids, self.matcher.pool.match_batch(jobs)):
+            if candidates:
+                match = candidates[0]
+                disconnected.add(cid)
+                if self.hotspots is not None:
+                    window = windows[cid]
+                    self.hotspots.record(self.image_path, window[2:], match, window[:2])
+        return disconnected
@@ -0,0 +1,448 @@
+"""
+Captura de tela por região e busca de imagens restrita a uma área.
+
+Em vez de capturar e varrer a área de trabalho inteira a cada verificação, as
+buscas tentam primeiro regiões pequenas (a última posição conhecida do
+template e a janela do jogo) e só usam a tela inteira como último recurso.
+Regiões seguem o formato do pyautogui: (left, top, width, height).
+
+A captura em si é feita por um backend plugável (pyautogui, mss ou replay de
+arquivos) e passa por um FrameSource que pode reaproveitar o mesmo frame para
+várias buscas feitas dentro de uma janela de validade configurável.
+"""
+import glob
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+try:
+    import pyautogui
+except Exception:
+    # Sem pyautogui (ou sem display) só o backend de replay pode ser usado
+    pyautogui = None
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+from hotspots import HotspotIndex
+import template_registry
+
+
+class CaptureBackend:
+    """Interface dos backends de captura: imagens BGR em coordenadas de tela"""
+
+    name = 'base'
+
+    def screen_size(self):
+        """(largura, altura) da tela principal"""
+        raise NotImplementedError
+
+    def grab(self, region=None):
+        """Captura a região (já recortada à tela) ou a tela inteira se None"""
+        raise NotImplementedError
+
+
+class PyAutoGuiBackend(CaptureBackend):
+    """Captura via pyautogui.screenshot (PIL -> numpy), uma imagem nova por chamada"""
+
+    name = 'pyautogui'
+
+    def screen_size(self):
+        width, height = pyautogui.size()
+        return int(width), int(height)
+
+    def grab(self, region=None):
+        screenshot = pyautogui.screenshot(region=region)
+        return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+
+
+class MssBackend(CaptureBackend):
+    """
+    Captura via mss, convertendo direto para buffers BGR pré-alocados.
+
+    Um buffer é reaproveitado para cada tamanho de região, então a imagem
+    retornada só é válida até a próxima captura do mesmo tamanho; quem precisar
+    guardá-la deve fazer uma cópia. Cada thread guarda só os `max_buffers`
+    tamanhos usados mais recentemente (hotspots, janelas e regiões têm tamanhos
+    variados) e os buffers de uma thread somem com ela.
+    """
+
+    name = 'mss'
+
+    def __init__(self, max_buffers=4):
+        if mss is None:
+            raise ImportError("Módulo 'mss' não está instalado")
+        self.max_buffers = max_buffers
+        self._local = threading.local()  # instâncias do mss não são compartilháveis entre threads
+
+    def _sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
+    def screen_size(self):
+        monitor = self._sct().monitors[1]
+        return int(monitor['width']), int(monitor['height'])
+
+    def grab(self, region=None):
+        sct = self._sct()
+        if region is None:
+            primary = sct.monitors[1]
+            region = (primary['left'], primary['top'], primary['width'], primary['height'])
+        left, top, width, height = region
+        shot = sct.grab({'left': left, 'top': top, 'width': width, 'height': height})
+        raw = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        buffer = self._buffer(shot.height, shot.width)
+        cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR, dst=buffer)
+        return buffer
+
+    def _buffer(self, height, width):
+        """Buffer BGR da thread atual para o tamanho dado (LRU de `max_buffers` tamanhos)"""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = OrderedDict()
+        key = (height, width)
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = np.empty((height, width, 3), dtype=np.uint8)
+            while len(buffers) > self.max_buffers:
+                buffers.popitem(last=False)
+        else:
+            buffers.move_to_end(key)
+        return buffer
+
+
+class ReplayBackend(CaptureBackend):
+    """
+    Backend de teste: devolve frames gravados (arquivos ou arrays BGR).
+
+    `advance='grab'` passa para o próximo frame a cada captura; `advance='manual'`
+    só avança com next_frame(). Com `loop=False` o último frame é repetido.
+    """
+
+    name = 'replay'
+
+    def __init__(self, frames, advance='manual', loop=False):
+        if isinstance(frames, str):
+            frames = sorted(glob.glob(os.path.join(frames, '*.png')))
+        self._frames = [cv2.imread(f, cv2.IMREAD_COLOR) if isinstance(f, str) else f for f in frames]
+        if not self._frames or any(f is None for f in self._frames):
+            raise ValueError("ReplayBackend precisa de pelo menos um frame válido")
+        self.advance = advance
+        self.loop = loop
+        self.index = 0
+
+    def next_frame(self):
+        if self.index + 1 < len(self._frames):
+            self.index += 1
+        elif self.loop:
+            self.index = 0
+        return self._frames[self.index]
+
+    def screen_size(self):
+        height, width = self._frames[self.index].shape[:2]
+        return width, height
+
+    def grab(self, region=None):
+        frame = self._frames[self.index]
+        if self.advance == 'grab':
+            self.next_frame()
+        if region is None:
+            return frame
+        left, top, width, height = region
+        return frame[top:top + height, left:left + width]
+
+
+def create_backend(name='auto'):
+    """Cria o backend pelo nome: 'auto' (mss se instalado), 'mss' ou 'pyautogui'"""
+    if name == 'mss' or (name == 'auto' and mss is not None):
+        return MssBackend()
+    if name in ('auto', 'pyautogui'):
+        return PyAutoGuiBackend()
+    raise ValueError(f"Backend de captura desconhecido: '{name}'")
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+class FrameSource:
+    """
+    Ponto único de captura, com reaproveitamento do frame mais recente.
+
+    Com `max_age` > 0, uma captura pedida com `share_region` (normalmente a
+    janela do jogo) captura essa região inteira uma vez e as buscas seguintes
+    dentro dela, feitas em até `max_age` segundos, recebem views desse mesmo
+    frame. Com `max_age` = 0 cada captura vai direto ao backend.
+
+    O frame guardado é uma cópia (o MssBackend reaproveita seus buffers na
+    captura seguinte). Depois de qualquer entrada (clique, tecla) a tela pode
+    ter mudado: quem envia a entrada chama invalidate() para a próxima busca
+    capturar de novo.
+    """
+
+    def __init__(self, backend=None, max_age=0.0):
+        self.backend = backend
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._cached = None  # (timestamp, região, imagem)
+
+    def _backend(self):
+        if self.backend is None:
+            self.backend = create_backend()
+        return self.backend
+
+    def screen_size(self):
+        return self._backend().screen_size()
+
+    def invalidate(self):
+        with self._lock:
+            self._cached = None
+
+    def grab(self, region=None, share_region=None):
+        full = (0, 0) + tuple(self.screen_size())
+        region = region or full
+        with self._lock:
+            if self.max_age > 0:
+                cached = self._cached
+                if cached and time.monotonic() - cached[0] <= self.max_age and _contains(cached[1], region):
+                    view, _ = crop_view(cached[2], cached[1][:2], region)
+                    return view
+                if share_region and _contains(share_region, region):
+                    image = self._backend().grab(None if share_region == full else share_region).copy()
+                    self._cached = (time.monotonic(), share_region, image)
+                    view, _ = crop_view(image, share_region[:2], region)
+                    return view
+            image = self._backend().grab(None if region == full else region)
+            if self.max_age > 0:
+                image = image.copy()
+                self._cached = (time.monotonic(), region, image)
+            return image
+
+
+_source = FrameSource()
+
+
+def configure(backend=None, max_age=None):
+    """Troca o backend de captura e/ou a validade (em segundos) do frame compartilhado"""
+    if backend is not None:
+        _source.backend = create_backend(backend) if isinstance(backend, str) else backend
+    if max_age is not None:
+        _source.max_age = max_age
+    _source.invalidate()
+    return _source._backend()
+
+
+def invalidate():
+    """Descarta o frame compartilhado (chamado depois de cada entrada enviada ao jogo)"""
+    _source.invalidate()
+
+
+def screen_region():
+    """Região correspondente à tela principal inteira"""
+    width, height = _source.screen_size()
+    return (0, 0, int(width), int(height))
+
+
+def clip_region(region, bounds=None):
+    """Recorta a região aos limites da tela; retorna None se ficar vazia"""
+    if region is None:
+        return None
+    bounds = bounds or screen_region()
+    left = max(int(region[0]), bounds[0])
+    top = max(int(region[1]), bounds[1])
+    right = min(int(region[0] + region[2]), bounds[0] + bounds[2])
+    bottom = min(int(region[1] + region[3]), bounds[1] + bounds[3])
+    if right <= left or bottom <= top:
+        return None
+    return (left, top, right - left, bottom - top)
+
+
+def crop_view(image, origin, region):
+    """View (sem cópia) de `region` dentro de uma captura que começa em `origin`, e sua origem"""
+    bounds = (origin[0], origin[1], image.shape[1], image.shape[0])
+    region = clip_region(region, bounds)
+    if region is None:
+        return None, None
+    left, top = region[0] - origin[0], region[1] - origin[1]
+    return image[top:top + region[3], left:left + region[2]], (region[0], region[1])
+
+
+def grab(region=None, share_region=None, fresh=False):
+    """
+    Captura a região (ou a tela inteira) como imagem BGR.
+
+    Retorna (imagem, origem), onde origem é o canto (left, top) da captura em
+    coordenadas de tela, usado para converter as posições encontradas. A
+    imagem pode ser uma view de um frame compartilhado: não deve ser alterada.
+    Com `fresh=True` o frame compartilhado é descartado antes (para quem
+    acompanha a tela mudando, em consultas mais próximas que a validade dele).
+    """
+    if fresh:
+        _source.invalidate()
+    region = clip_region(region)
+    share_region = clip_region(share_region)
+    image = _source.grab(region, share_region)
+    origin = (region[0], region[1]) if region else (0, 0)
+    return image, origin
+
+
+def game_window_region(window_title):
+    """Retângulo da primeira janela visível com o título informado, ou None"""
+    if not window_title:
+        return None
+    try:
+        windows = pyautogui.getWindowsWithTitle(window_title)
+    except Exception:
+        # getWindowsWithTitle só existe no Windows; sem ele usa-se a tela inteira
+        return None
+    for window in windows:
+        if getattr(window, 'isMinimized', False) or window.width <= 0 or window.height <= 0:
+            continue
+        return clip_region((window.left, window.top, window.width, window.height))
+    return None
+
+
+# Chamado com (imagem, origem, template, match, tempo_captura, tempo_matching) após cada
+# busca de um RegionLocator
+_search_observer = None
+
+
+def set_search_observer(observer):
+    """Registra quem recebe cada captura analisada (ex: o histórico de frames); None desliga"""
+    global _search_observer
+    _search_observer = observer
+
+
+def _notify(image, origin, image_path, match, capture_time, match_time):
+    if _search_observer is not None:
+        _search_observer(image, origin, image_path, match, capture_time, match_time)
+
+
+class RegionLocator:
+    """
+    Localiza imagens na tela capturando apenas a menor região necessária.
+
+    Ordem de busca: região explícita (se informada) ou janelas crescentes em
+    volta do último acerto do template (índice de hotspots persistido por
+    resolução) e, em seguida, a janela do jogo. A tela inteira só é varrida
+    quando a janela não é encontrada ou quando `full_screen_fallback` é pedido
+    (ex: para imagens que ficam fora da janela do jogo). Um localizador preso a
+    um cliente entre vários (`full_screen=False`) nunca varre a tela inteira:
+    o acerto poderia estar na janela de outro cliente.
+
+    As capturas dentro da janela do jogo usam-na como `share_region`, então
+    várias buscas feitas em sequência podem reaproveitar o mesmo frame.
+
+    Com `color` (padrão) a busca compara os três canais, como o
+    pyautogui.locateOnScreen que ela substitui, e as confianças já ajustadas
+    (0.8/0.9) continuam valendo; `color=False` busca em tons de cinza (cerca
+    de 3x menos trabalho por busca).
+    """
+
+    def __init__(self, window_title=None, hotspots=None, window_provider=None, color=True, full_screen=True):
+        self.window_title = window_title
+        self.color = color
+        self.full_screen = full_screen
+        self.hotspots = hotspots if hotspots is not None else HotspotIndex()
+        # Callable que retorna o retângulo de uma janela específica (ex: um entre
+        # vários clientes com o mesmo título); tem prioridade sobre window_title
+        self.window_provider = window_provider
+        self._matchers = {}
+
+    def set_window_title(self, window_title):
+        self.window_title = window_title
+
+    def window_region(self):
+        """Retângulo da janela do jogo acompanhada por este localizador, ou None"""
+        if self.window_provider is not None:
+            return clip_region(self.window_provider())
+        return game_window_region(self.window_title)
+
+    def _matcher(self, image_path):
+        """Template pré-processado (vem do registro compartilhado, decodificado uma única vez)"""
+        matcher = self._matchers.get(image_path)
+        if matcher is None:
+            matcher = template_registry.registry().matcher({image_path: image_path}, color=self.color)
+            self._matchers[image_path] = matcher
+        return matcher
+
+    def _reference(self):
+        """Janela do jogo (ou None), origem e resolução usadas como referência dos hotspots"""
+        window = self.window_region()
+        reference = window or screen_region()
+        return window, (reference[0], reference[1]), (reference[2], reference[3])
+
+    def hotspot_region(self, image_path):
+        """Janela de busca mais larga em volta do último acerto do template, ou None se ainda não há acerto"""
+        _, origin, resolution = self._reference()
+        bounds = (origin[0], origin[1], resolution[0], resolution[1])
+        regions = [r for r in (clip_region(r, bounds) for r in
+                   self.hotspots.regions(image_path, resolution, origin)) if r]
+        return regions[-1] if regions else None
+
+    def watch_region(self, image_path):
+        """
+        Menor região que cobre onde o template costuma aparecer: a janela de busca
+        mais larga em volta do hotspot, a janela do jogo ou None (tela inteira).
+        """
+        return self.hotspot_region(image_path) or self.window_region()
+
+    def _match_in(self, matcher, image_path, search_region, confidence, window=None):
+        started = time.perf_counter()
+        image, image_origin = grab(search_region, share_region=window)
+        captured = time.perf_counter()
+        match = matcher.match(image, image_path, threshold=confidence, origin=image_origin)
+        _notify(image, image_origin, image_path, match, captured - started, time.perf_counter() - captured)
+        return match
+
+    def _locate_hotspots(self, matcher, image_path, confidence, origin, resolution, window=None):
+        """Busca em janelas crescentes em volta do último acerto (uma única captura)"""
+        bounds = (origin[0], origin[1], resolution[0], resolution[1])
+        hotspot_regions = [r for r in (clip_region(r, bounds) for r in
+                           self.hotspots.regions(image_path, resolution, origin)) if r]
+        if not hotspot_regions:
+            return None
+        # Captura só a maior janela; as menores são views dessa mesma captura
+        started = time.perf_counter()
+        image, image_origin = grab(hotspot_regions[-1], share_region=window)
+        captured = time.perf_counter()
+        match = None
+        for hotspot in hotspot_regions:
+            view, view_origin = crop_view(image, image_origin, hotspot)
+            if view is None:
+                continue
+            match = matcher.match(view, image_path, threshold=confidence, origin=view_origin)
+            if match:
+                break
+        _notify(image, image_origin, image_path, match, captured - started, time.perf_counter() - captured)
+        return match
+
+    def locate(self, image_path, confidence=0.8, region=None, full_screen_fallback=False):
+        """Retorna o Match (centro em coordenadas de tela) do template, ou None"""
+        matcher = self._matcher(image_path)
+        window, origin, resolution = self._reference()
+
+        match = None
+        if region is not None:
+            region = clip_region(region)
+            match = self._match_in(matcher, image_path, region, confidence, window) if region else None
+        else:
+            match = self._locate_hotspots(matcher, image_path, confidence, origin, resolution, window)
+        if not match and window is not None and window != region:
+            match = self._match_in(matcher, image_path, window, confidence, window)
+        if not match and self.full_screen and (window is None or full_screen_fallback):
+            match = self._match_in(matcher, image_path, None, confidence)
+
+        if match:
+            self.hotspots.record(image_path, resolution, match, origin)
+        return match
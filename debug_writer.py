@@ -0,0 +1,226 @@
+"""
+Gravação de screenshots de depuração em segundo plano.
+
+Os screenshots do fluxo de login (teclado do PIN, botão Confirmar, imagens não
+encontradas) eram codificados em PNG dentro do próprio fluxo, atrasando cada
+clique, e se acumulavam no disco sem limite. O ScreenshotWriter recebe a
+imagem (recortada, se pedido) e devolve o controle na hora; uma thread separada
+desenha as marcações, codifica e grava. A fila é limitada e as gravações por
+segundo também: quando qualquer um dos limites é atingido o screenshot é
+descartado, nunca o fluxo atrasado. A pasta tem uma cota; os arquivos mais
+antigos são apagados quando ela é ultrapassada.
+"""
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+import structured_log
+
+_log = structured_log.logger('debug_writer')
+
+# Modos de gravação
+ALWAYS = 'always'          # todos os screenshots
+ON_FAILURE = 'on_failure'  # apenas os marcados como falha
+OFF = 'off'                # nenhum
+
+DEBUG_FOLDER = 'debug_screenshots'
+FORMATS = ('png', 'jpg', 'webp')
+
+# Um screenshot na fila: imagem já recortada (cópia), nome do arquivo e marcações {rótulo: (x, y)}
+_Job = namedtuple('_Job', ['image', 'name', 'positions'])
+
+
+class ScreenshotWriter:
+    """
+    Fila limitada de screenshots gravados por uma thread em segundo plano.
+
+    - `fmt`: 'png', 'jpg' ou 'webp'; `quality` (0-100) vale para jpg/webp e
+      `png_compression` (0-9) para png.
+    - `max_queue`: screenshots aguardando gravação; excedentes são descartados.
+    - `max_per_second`: gravações aceitas por segundo (0 = sem limite).
+    - `quota_mb`: tamanho máximo da pasta; os arquivos mais antigos são apagados.
+    """
+
+    def __init__(self, folder=DEBUG_FOLDER, mode=ON_FAILURE, fmt='png', quality=85, png_compression=3,
+                 max_queue=8, max_per_second=2.0, quota_mb=200, clock=time.monotonic):
+        if mode not in (ALWAYS, ON_FAILURE, OFF):
+            raise ValueError(f"Modo de screenshot inválido: '{mode}'")
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato de screenshot inválido: '{fmt}' (use {', '.join(FORMATS)})")
+        self.folder = folder
+        self.mode = mode
+        self.fmt = fmt
+        self.quality = quality
+        self.png_compression = png_compression
+        self.max_per_second = max_per_second
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.clock = clock
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._tokens = max(1.0, max_per_second)
+        self._last_refill = clock()
+        self._files = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wants(self, failure=False):
+        """True se um screenshot com esse status seria gravado no modo atual"""
+        return self.mode == ALWAYS or (self.mode == ON_FAILURE and failure)
+
+    def _take_token(self):
+        if not self.max_per_second:
+            return True
+        now = self.clock()
+        self._tokens = min(max(1.0, self.max_per_second),
+                           self._tokens + (now - self._last_refill) * self.max_per_second)
+        self._last_refill = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def submit(self, image, name, positions=None, origin=(0, 0), crop=None, failure=False):
+        """
+        Agenda a gravação de `image` (que começa em `origin` na tela) como `name`.
+
+        `crop` (left, top, width, height, em coordenadas da tela) grava só essa
+        parte; `positions` são marcações {rótulo: (x, y)} em coordenadas da tela.
+        Retorna True se o screenshot entrou na fila.
+        """
+        if image is None or not self.wants(failure):
+            return False
+        with self._lock:
+            if not self._take_token():
+                self.dropped += 1
+                return False
+        if crop is not None:
+            left, top = max(0, crop[0] - origin[0]), max(0, crop[1] - origin[1])
+            image = image[top:top + crop[3], left:left + crop[2]]
+            origin = (origin[0] + left, origin[1] + top)
+        if image.size == 0:
+            return False
+        # Cópia: o backend de captura pode reutilizar o buffer da imagem no próximo frame
+        marks = {key: (x - origin[0], y - origin[1]) for key, (x, y) in (positions or {}).items()}
+        try:
+            self._queue.put_nowait(_Job(image.copy(), name, marks))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self._ensure_thread()
+        return True
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='screenshots', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(job)
+            except Exception as e:
+                _log.error("Falha ao gravar screenshot '%s': %s", job.name, e)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _annotate(image, positions):
+        for key, (x, y) in positions.items():
+            x, y = int(x), int(y)
+            cv2.circle(image, (x, y), 15, (0, 255, 0), 3)
+            cv2.line(image, (x - 20, y), (x + 20, y), (0, 255, 0), 2)
+            cv2.line(image, (x, y - 20), (x, y + 20), (0, 255, 0), 2)
+            cv2.putText(image, str(key), (x - 15, y - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    def _encode(self, image):
+        if self.fmt == 'png':
+            params = [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        elif self.fmt == 'jpg':
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        else:
+            params = [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        ok, data = cv2.imencode(f".{self.fmt}", image, params)
+        if not ok:
+            raise ValueError(f"Falha ao codificar a imagem em {self.fmt}")
+        return data
+
+    def _scan(self):
+        """Arquivos já existentes na pasta, para que a cota valha entre execuções"""
+        os.makedirs(self.folder, exist_ok=True)
+        files = {}
+        for entry in os.scandir(self.folder):
+            if entry.is_file():
+                st = entry.stat()
+                files[entry.path] = (st.st_mtime, st.st_size)
+        return files
+
+    def _write(self, job):
+        if self._files is None:
+            self._files = self._scan()
+        if job.positions:
+            self._annotate(job.image, job.positions)
+        data = self._encode(job.image)
+        base = os.path.splitext(os.path.basename(job.name))[0]
+        path = os.path.join(self.folder, f"{base}.{self.fmt}")
+        with open(path, 'wb') as f:
+            f.write(data.tobytes())
+        self._files[path] = (time.time(), len(data))
+        self.written += 1
+        self._rotate(keep=path)
+
+    def _rotate(self, keep=None):
+        total = sum(size for _, size in self._files.values())
+        for path, (_, size) in sorted(self._files.items(), key=lambda item: item[1][0]):
+            if total <= self.quota_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._files[path]
+            total -= size
+
+    def flush(self, timeout=None):
+        """Aguarda a fila esvaziar; retorna True se tudo foi gravado dentro do tempo"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=2.0):
+        """Grava o que estiver na fila e encerra a thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self.flush(timeout)
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+_writer = ScreenshotWriter()
+
+
+def writer():
+    """Gravador compartilhado pelo fluxo de login"""
+    return _writer
+
+
+def configure(**kwargs):
+    """Substitui o gravador compartilhado (os argumentos são os de ScreenshotWriter)"""
+    global _writer
+    old, _writer = _writer, ScreenshotWriter(**kwargs)
+    old.close()
+    return _writer
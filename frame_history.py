@@ -0,0 +1,242 @@
+"""
+Histórico em memória dos últimos frames analisados.
+
+Cada captura analisada durante o login e a digitação do PIN (busca de imagem,
+teclado do PIN, botão Confirmar) é guardada reduzida (e, opcionalmente,
+comprimida em JPEG) junto com o resultado da detecção, em um buffer circular
+com limite de quadros e de memória. Fora desses fluxos (ex: o monitoramento de
+desconexão) nada é guardado. Nada vai para o disco durante a execução normal;
+quando o login ou a digitação do PIN falha, o buffer é gravado como um único
+arquivo .zip com os frames e um manifest.json, mostrando exatamente o que o
+bot viu antes da falha. Pacotes ainda sendo gravados ao sair são concluídos.
+"""
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+
+import cv2
+
+HISTORY_FOLDER = 'falhas_login'
+
+
+class FrameRecord:
+    """Um frame guardado: imagem reduzida (ou JPEG), de onde veio e o que foi detectado nele"""
+
+    __slots__ = ('timestamp', 'label', 'origin', 'size', 'scale', 'data', 'encoded', 'result')
+
+    def __init__(self, timestamp, label, origin, size, scale, data, encoded, result=None):
+        self.timestamp = timestamp
+        self.label = label
+        self.origin = origin      # canto superior esquerdo da captura na tela
+        self.size = size          # largura e altura originais da captura
+        self.scale = scale        # fator aplicado na redução
+        self.data = data          # ndarray reduzido ou bytes JPEG
+        self.encoded = encoded
+        self.result = result
+
+    @property
+    def nbytes(self):
+        return len(self.data) if self.encoded else self.data.nbytes
+
+
+def _jsonable(value):
+    if hasattr(value, '_asdict'):
+        return {k: _jsonable(v) for k, v in value._asdict().items()}
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class FrameRing:
+    """
+    Buffer circular de FrameRecord com limite de quadros (`capacity`) e de memória (`max_mb`).
+
+    Os frames são reduzidos para que o maior lado tenha no máximo `max_side`
+    pixels; com `jpeg_quality` eles também são comprimidos (mais CPU por
+    captura, bem menos memória). Só são guardadas as capturas feitas dentro de
+    `capturing()` na mesma thread.
+    """
+
+    def __init__(self, capacity=40, max_mb=32, max_side=640, jpeg_quality=None,
+                 folder=HISTORY_FOLDER, max_bundles=20, clock=time.time):
+        self.capacity = capacity
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.folder = folder
+        self.max_bundles = max_bundles
+        self.clock = clock
+        self.enabled = capacity > 0
+        self._frames = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._active = threading.local()
+        self._writers = []
+
+    @contextlib.contextmanager
+    def capturing(self):
+        """Guarda as capturas feitas pela thread atual enquanto ativo (pode ser aninhado)"""
+        depth = getattr(self._active, 'depth', 0)
+        self._active.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self._active.depth = depth
+
+    @property
+    def active(self):
+        return getattr(self._active, 'depth', 0) > 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _shrink(self, image):
+        h, w = image.shape[:2]
+        scale = min(1.0, self.max_side / float(max(h, w))) if self.max_side else 1.0
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            image = image.copy()  # o buffer da captura pode ser reutilizado
+        return image, scale
+
+    def record(self, image, origin=(0, 0), label='', result=None):
+        """Guarda uma captura (só dentro de capturing()); retorna o FrameRecord (o resultado pode ser preenchido depois)"""
+        if not self.enabled or not self.active or image is None or image.size == 0:
+            return None
+        small, scale = self._shrink(image)
+        encoded = False
+        if self.jpeg_quality:
+            ok, data = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                small, encoded = data.tobytes(), True
+        entry = FrameRecord(self.clock(), label, tuple(origin), (image.shape[1], image.shape[0]),
+                            scale, small, encoded, result)
+        with self._lock:
+            self._frames.append(entry)
+            self._bytes += entry.nbytes
+            while self._frames and (len(self._frames) > self.capacity or self._bytes > self.max_bytes):
+                self._bytes -= self._frames.popleft().nbytes
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def snapshot(self, clear=True):
+        """Cópia da lista de frames atual (e esvazia o buffer, por padrão)"""
+        with self._lock:
+            frames = list(self._frames)
+            if clear:
+                self._frames.clear()
+                self._bytes = 0
+        return frames
+
+    def _bundle_name(self, reason):
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.clock()))
+        safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in reason)
+        return os.path.join(self.folder, f"falha_{stamp}_{safe}.zip")
+
+    def write_bundle(self, frames, path, reason=''):
+        """Grava os frames e o manifest.json em um único .zip"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        manifest = {'reason': reason, 'frames': []}
+        tmp_path = f"{path}.tmp"
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as bundle:
+            for index, entry in enumerate(frames):
+                if entry.encoded:
+                    name, data = f"{index:03d}.jpg", entry.data
+                else:
+                    ok, encoded = cv2.imencode('.png', entry.data, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                    if not ok:
+                        continue
+                    name, data = f"{index:03d}.png", encoded.tobytes()
+                bundle.writestr(name, data)
+                manifest['frames'].append({
+                    'file': name,
+                    'timestamp': round(entry.timestamp, 3),
+                    'label': entry.label,
+                    'origin': list(entry.origin),
+                    'size': list(entry.size),
+                    'scale': round(entry.scale, 4),
+                    'result': _jsonable(entry.result),
+                })
+            bundle.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        os.replace(tmp_path, path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        """Mantém apenas os `max_bundles` pacotes mais recentes"""
+        try:
+            bundles = sorted((e for e in os.scandir(self.folder) if e.name.endswith('.zip')),
+                             key=lambda e: e.stat().st_mtime)
+        except OSError:
+            return
+        for entry in bundles[:max(0, len(bundles) - self.max_bundles)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def dump(self, reason='', background=True):
+        """
+        Grava o conteúdo do buffer como um pacote e esvazia o buffer.
+
+        Retorna o caminho do pacote (gravado em segundo plano por padrão) ou
+        None se não havia frames.
+        """
+        frames = self.snapshot(clear=True)
+        if not frames:
+            return None
+        path = self._bundle_name(reason)
+        if background:
+            writer = threading.Thread(target=self.write_bundle, args=(frames, path, reason),
+                                      name='historico', daemon=True)
+            with self._lock:
+                self._writers = [w for w in self._writers if w.is_alive()]
+                self._writers.append(writer)
+            writer.start()
+        else:
+            self.write_bundle(frames, path, reason)
+        return path
+
+    def flush(self, timeout=None):
+        """Espera a gravação dos pacotes em andamento (chamado também ao sair)"""
+        with self._lock:
+            writers, self._writers = self._writers, []
+        for writer in writers:
+            writer.join(timeout)
+
+
+_ring = FrameRing()
+
+
+def ring():
+    """Histórico compartilhado pelo fluxo de login"""
+    return _ring
+
+
+def configure(**kwargs):
+    """Substitui o histórico compartilhado (os argumentos são os de FrameRing)"""
+    global _ring
+    old, _ring = _ring, FrameRing(**kwargs)
+    old.flush()
+    return _ring
+
+
+atexit.register(lambda: _ring.flush())
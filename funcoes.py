@@ -1,22 +1,41 @@
 import os
 import time
-import pyautogui
+import contextlib
+import functools
+import threading
 import logging
-import psutil
-import cv2
-import numpy as np
-
-# Configura o logger
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Exibe logs no console
-        # Opcional: logging.FileHandler('digitar_pin.log')  # Salva logs em um arquivo
-    ]
+
+try:
+    import pyautogui
+except Exception:
+    # Sem pyautogui (ou sem display, ex: Linux headless) só o harness de replay funciona:
+    # ele instala sua própria entrada falsa em funcoes.pyautogui
+    pyautogui = None
+
+import matcher
+import template_registry
+import debug_writer
+import frame_history
+import metrics
+import structured_log
+import net_watch
+import process_index
+import relaunch
+import liveness
+import input_backend
+from input_backend import Click, Key, Move, Pause, Text
+from matcher import KeypadLayout, region_signature
+import capture
+from capture import RegionLocator, grab
+from scheduler import DisconnectWatch
+from login_flow import (
+    LoginStep, LoginStateMachine, wait_until,
+    DESCONECTADO, CONFIRMAR, SENHA, SERVIDOR, PIN, SELECAO_PERSONAGEM, EM_JOGO
 )
 
-# Sistema de logs global - pode ser redirecionado pela GUI
+# Logs vão para o logger estruturado do bot (fila + thread própria); pode ser redirecionado pela GUI
+structured_log.setup()
+_logger = structured_log.logger()
 _gui_logger = None
 
 def set_gui_logger(logger):
@@ -24,50 +43,308 @@ def set_gui_logger(logger):
     global _gui_logger
     _gui_logger = logger
 
-def log_info(message):
-    """Log de informação - compatível com GUI e console"""
-    if _gui_logger:
-        _gui_logger.info(message)
-    else:
-        print(f"[funcoes.py INFO] {message}")
+def _log(nivel, message, args, campos, prefixo=''):
+    logger = _gui_logger or _logger
+    if logger.isEnabledFor(nivel):  # nível desligado: nada é formatado
+        logger.log(nivel, prefixo + message, *args, extra={'fields': campos} if campos else None)
+
+def log_info(message, *args, **campos):
+    """Log de informação - compatível com GUI e console (`args` no estilo %, `campos` tipados)"""
+    _log(logging.INFO, message, args, campos)
 
-def log_error(message):
+def log_error(message, *args, **campos):
     """Log de erro - compatível com GUI e console"""
-    if _gui_logger:
-        _gui_logger.error(message)
-    else:
-        print(f"[funcoes.py ERRO] {message}")
+    _log(logging.ERROR, message, args, campos)
 
-def log_status(message):
+def log_status(message, *args, **campos):
     """Log de status - compatível com GUI e console"""
-    if _gui_logger:
-        _gui_logger.info(f"[STATUS] {message}")
-    else:
-        print(f"[funcoes.py STATUS] {message}")
+    _log(logging.INFO, message, args, campos, prefixo='[STATUS] ')
 
-def log_aviso(message):
+def log_aviso(message, *args, **campos):
     """Log de aviso - compatível com GUI e console"""
-    if _gui_logger:
-        _gui_logger.warning(message)
+    _log(logging.WARNING, message, args, campos)
+
+def log_debug(message, *args, **campos):
+    """Log detalhado (buscas individuais, templates do teclado); descartado sem formatar no nível INFO"""
+    _log(logging.DEBUG, message, args, campos)
+
+def log_evento(evento, mensagem=None, nivel=logging.INFO, **campos):
+    """Evento com campos tipados (passo, template, confiança, duração...)"""
+    structured_log.event(_gui_logger or _logger, evento, mensagem, nivel, **campos)
+
+# Esperas interrompíveis - permitem que o runtime pare/reinicie o fluxo em milissegundos
+class OperacaoCancelada(BaseException):
+    """
+    Levantada pelas esperas de funcoes.py quando o cancelamento é pedido.
+    Herda de BaseException para não ser engolida pelos `except Exception` do fluxo.
+    """
+
+_cancelamento = threading.Event()
+
+def cancelar_operacoes():
+    """Faz qualquer espera em andamento (e as próximas) levantar OperacaoCancelada"""
+    _cancelamento.set()
+
+def liberar_operacoes():
+    """Permite novamente as esperas após um cancelamento"""
+    _cancelamento.clear()
+
+def esperar(segundos):
+    """time.sleep interrompível: retorna após `segundos` ou levanta OperacaoCancelada"""
+    if _cancelamento.wait(max(0.0, segundos)):
+        raise OperacaoCancelada()
+
+# Pausa depois do Tab, para o cliente trocar o foco para o campo de senha
+PAUSA_TROCA_CAMPO = 0.05
+# Espera depois de um clique que muda a tela (ex: foco na janela); as telas seguintes são detectadas
+ESPERA_APOS_FOCO = 0.2
+# Depois de cada dígito do PIN: tempo máximo esperando o teclado mudar (redesenho/embaralhamento)
+# e a pausa extra para o redesenho terminar quando a mudança é vista
+ESPERA_TECLADO_PIN = 0.3
+ESPERA_REDESENHO_PIN = 0.1
+# Telas sem imagem própria (ex: lista de servidores) só recebem entrada depois
+# de a janela ficar este tempo sem mudar (a transição de tela terminou)
+ESTABILIDADE_TELA = 0.4
+
+def enviar_acoes(acoes):
+    """
+    Envia uma sequência de ações de entrada (input_backend.Key, Text, Click,
+    Move, Pause) de uma vez, só com os intervalos mínimos do backend; as
+    esperas podem ser canceladas como as demais (veja `esperar`).
+
+    A tela muda com a entrada: o frame compartilhado da captura é descartado,
+    então a próxima busca vê a tela depois da sequência.
+    """
+    try:
+        return input_backend.send(acoes, sleep=lambda segundos: esperar(segundos))
+    finally:
+        capture.invalidate()
+
+def press(key):
+    enviar_acoes([Key(key)])
+
+def click(x, y, button='left'):
+    enviar_acoes([Click(x, y, button)])
+
+# Localizador de imagens por região (janela do jogo / última posição conhecida)
+_localizador = RegionLocator()
+
+def _registrar_busca(image, origin, image_path, match, tempo_captura, tempo_match):
+    """Guarda a captura no histórico de frames (só durante o login/PIN) e registra suas métricas"""
+    template = os.path.basename(image_path)
+    frame_history.ring().record(image, origin, template, match)
+    _registrar_metricas_busca(template, match.confidence if match else None, tempo_captura, tempo_match)
+
+def _registrar_metricas_busca(template, confianca, tempo_captura, tempo_match):
+    m = metrics.metrics()
+    m.observe('ragnarok_capture_seconds', tempo_captura, template=template)
+    m.observe('ragnarok_match_seconds', tempo_match, template=template)
+    m.inc('ragnarok_probes_total', template=template, resultado='encontrado' if confianca is not None else 'ausente')
+    if confianca is not None:
+        m.observe('ragnarok_match_confidence', confianca, template=template)
+    m.event('probe', template=template, capture_ms=round(tempo_captura * 1000, 2),
+            match_ms=round(tempo_match * 1000, 2), confidence=None if confianca is None else round(confianca, 4))
+    log_evento('busca', "Busca de imagem", logging.DEBUG, template=template, confianca=confianca,
+               captura_s=tempo_captura, match_s=tempo_match)
+
+def _registrar_passos_login(historico):
+    """Métricas de cada passo executado pela máquina de estados do login"""
+    m = metrics.metrics()
+    for passo in historico:
+        m.observe('ragnarok_login_step_wait_seconds', passo.wait_time, state=passo.state)
+        m.observe('ragnarok_login_step_action_seconds', passo.action_time, state=passo.state)
+        m.observe('ragnarok_login_step_attempts', passo.attempts, state=passo.state)
+        m.inc('ragnarok_login_steps_total', state=passo.state, ok=str(passo.ok).lower())
+        m.event('login_step', state=passo.state, wait_s=round(passo.wait_time, 3),
+                action_s=round(passo.action_time, 3), attempts=passo.attempts, ok=passo.ok)
+        log_evento('passo_login', "Passo do login", passo=passo.state, espera_s=round(passo.wait_time, 3),
+                   acao_s=round(passo.action_time, 3), consultas=passo.attempts, ok=passo.ok)
+
+capture.set_search_observer(_registrar_busca)
+
+def configurar_log(arquivo=None, arquivo_json=None, nivel='INFO', console=True):
+    """
+    Define as saídas do log: console, arquivo de texto rotativo (`arquivo`) e/ou
+    JSON lines com campos tipados (`arquivo_json`). A gravação acontece em uma
+    thread separada; nível 'DEBUG' inclui cada busca de imagem.
+    """
+    structured_log.setup(level=nivel, console=console, file=arquivo, json_file=arquivo_json)
+    destinos = [d for d in (console and "console", arquivo, arquivo_json) if d]
+    log_info("Log nível %s em: %s", nivel, ', '.join(destinos) or 'nenhuma saída')
+
+def configurar_entrada(backend='auto'):
+    """
+    Escolhe o backend de teclado/mouse: 'auto' (interception se instalado),
+    'interception', 'pyautogui' ou uma instância (ex: input_backend.RecordingBackend).
+    """
+    try:
+        instancia = input_backend.configure(backend)
+    except ImportError as e:
+        log_aviso("Backend de entrada '%s' indisponível (%s). Usando pyautogui.", backend, e)
+        instancia = input_backend.configure('pyautogui')
+    log_info("Teclado e mouse via '%s' (intervalo entre teclas: %.0fms).", instancia.name, instancia.key_gap * 1000)
+
+def configurar_janela_jogo(game_window_title):
+    """Define o título da janela do jogo usado para restringir capturas e buscas"""
+    _localizador.set_window_title(game_window_title)
+    log_info("Buscas de imagem restritas à janela '%s' (tela inteira como fallback).", game_window_title)
+
+def configurar_captura(backend='auto', max_age=0.0):
+    """
+    Escolhe o backend de captura ('auto', 'mss', 'pyautogui' ou uma instância) e
+    por quantos segundos um frame da janela do jogo pode ser reaproveitado.
+    """
+    try:
+        instancia = capture.configure(backend=backend, max_age=max_age)
+    except ImportError as e:
+        log_aviso("Backend de captura '%s' indisponível (%s). Usando pyautogui.", backend, e)
+        instancia = capture.configure(backend='pyautogui', max_age=max_age)
+    log_info("Captura de tela via '%s' (reaproveitamento de frame: %ss).", instancia.name, max_age)
+
+def configurar_matching(threads=None, niveis_piramide=0):
+    """
+    Define quantas threads procuram templates em paralelo (None = número de núcleos, 1 = serial)
+    e a profundidade da busca em pirâmide (0 = somente resolução cheia).
+    """
+    pool = matcher.configure_pool(threads)
+    niveis = matcher.configure_pyramid(niveis_piramide)
+    modo = f"pirâmide de {niveis} nível(is)" if niveis else "resolução cheia"
+    log_info("Template matching com %s thread(s), %s.", pool.max_workers, modo)
+
+def configurar_screenshots(modo=debug_writer.ON_FAILURE, pasta=debug_writer.DEBUG_FOLDER, formato='png',
+                           qualidade=85, por_segundo=2.0, cota_mb=200):
+    """
+    Define quando e como os screenshots de depuração são gravados: modo 'always',
+    'on_failure' ou 'off'; formato 'png', 'jpg' ou 'webp'; cota da pasta em MB.
+    """
+    debug_writer.configure(folder=pasta, mode=modo, fmt=formato, quality=qualidade,
+                           max_per_second=por_segundo, quota_mb=cota_mb)
+    if modo == debug_writer.OFF:
+        log_info("Screenshots de depuração desligados.")
     else:
-        print(f"[funcoes.py AVISO] {message}")
+        log_info("Screenshots de depuração: modo '%s', %s, pasta '%s' (cota %sMB).", modo, formato, pasta, cota_mb)
 
-try:
-    from interception import press as press_interception, click as click_interception
-    def press(key):
-        press_interception(key)
-    def click(x, y, button):
-        click_interception(x, y, button)
-    log_info("Módulo 'interception' importado com sucesso e funções 'press' e 'click' configuradas para usá-lo.")
-except ImportError as e:
-    log_error(f"Não foi possível importar de 'interception': {e}")
-    log_aviso("Funções de 'interception' serão substituídas por 'pyautogui' para compatibilidade.")
-    def press(key):
-        pyautogui.press(key)
-        log_info(f"[FALLBACK] Usando pyautogui.press('{key}').")
-    def click(x, y, button): # Esta é a função pyautogui.click
-        pyautogui.click(x=x, y=y, button=button)
-        log_info(f"[FALLBACK] Usando pyautogui.click({x}, {y}, button='{button}').")
+def configurar_historico(quadros=40, memoria_mb=32, lado_max=640, qualidade_jpeg=None,
+                         pasta=frame_history.HISTORY_FOLDER):
+    """
+    Define o histórico em memória dos últimos frames analisados, gravado em
+    `pasta` apenas quando o login ou o PIN falham (quadros=0 desliga).
+    """
+    frame_history.configure(capacity=quadros, max_mb=memoria_mb, max_side=lado_max,
+                            jpeg_quality=qualidade_jpeg, folder=pasta)
+    if quadros:
+        log_info("Histórico de frames: últimos %s (até %sMB), gravado em '%s' nas falhas.", quadros, memoria_mb, pasta)
+
+def _salvar_historico_em_falha(motivo):
+    """
+    Guarda no histórico os frames analisados pela função decorada e grava o
+    histórico quando ela retorna False. Chamada de dentro de outra função
+    decorada (o PIN dentro do login), deixa a gravação para a de fora, que
+    falha em seguida: um único pacote por falha.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            historico = frame_history.ring()
+            aninhada = historico.active
+            with historico.capturing():
+                resultado = funcao(*args, **kwargs)
+            if not resultado and not aninhada:
+                caminho = historico.dump(motivo)
+                if caminho:
+                    log_aviso("Frames anteriores à falha salvos em: %s", caminho)
+            return resultado
+        return envolvida
+    return decorador
+
+def configurar_metricas(arquivo_eventos=None, arquivo_prometheus=None, intervalo=15.0, porta=None,
+                        eventos_busca=False):
+    """
+    Exporta as métricas de latência: eventos em JSON lines (`arquivo_eventos`,
+    gravado em segundo plano e rotativo), texto do Prometheus regravado a cada
+    `intervalo` segundos (`arquivo_prometheus`) e/ou servido em
+    http://127.0.0.1:<porta>/metrics. `eventos_busca` inclui no arquivo de
+    eventos uma linha por busca de imagem (muitas por segundo).
+    """
+    try:
+        metrics.configure(events_path=arquivo_eventos, textfile=arquivo_prometheus, interval=intervalo, port=porta,
+                          probe_events=eventos_busca)
+    except OSError as e:
+        log_aviso("Não foi possível iniciar a exportação de métricas: %s", e)
+        metrics.configure(events_path=arquivo_eventos, textfile=arquivo_prometheus, interval=intervalo,
+                          probe_events=eventos_busca)
+    destinos = [d for d in (arquivo_eventos, arquivo_prometheus, porta and f"http://127.0.0.1:{porta}/metrics") if d]
+    if destinos:
+        log_info("Métricas exportadas para: %s", ', '.join(str(d) for d in destinos))
+
+def imagens_padrao(pasta_imagens_pin=""):
+    """Todas as imagens procuradas pelo bot (telas do login e teclado do PIN)"""
+    telas = ['desconectado.png', 'ragnarok.png', 'confirmar.png', 'senha.png', 'jogar.png', 'avatar_pin.png']
+    teclado = [os.path.join(pasta_imagens_pin, f"{key}.png") for key in [str(i) for i in range(10)] + ['confirmar']]
+    return telas + [caminho for caminho in teclado if caminho not in telas]
+
+def carregar_templates(imagens=None, pacote=template_registry.PACK_FILE):
+    """
+    Decodifica todas as imagens do bot uma única vez na inicialização.
+
+    Usa o pacote pré-processado `pacote` (mapeado em memória) quando ele está
+    atualizado; caso contrário lê os PNGs e grava o pacote para a próxima vez.
+    """
+    inicio = time.perf_counter()
+    imagens = imagens_padrao() if imagens is None else imagens
+    registro = template_registry.configure(pacote)
+    do_pacote = len(registro)
+    ausentes = registro.preload(imagens)
+    for caminho in ausentes:
+        log_aviso("Template '%s' não encontrado.", caminho)
+    if registro.dirty and pacote:
+        try:
+            registro.save_pack(pacote)
+        except OSError as e:
+            log_aviso("Não foi possível gravar o pacote de templates '%s': %s", pacote, e)
+    log_info("%s templates prontos em %.0fms (%s do pacote '%s').",
+             len(registro), (time.perf_counter() - inicio) * 1000, do_pacote, pacote)
+    return registro
+
+def configurar_runtime(janela_jogo=None, entrada='auto', captura='auto', idade_frame=0.0,
+                       threads_matching=None, niveis_piramide=0,
+                       screenshots=debug_writer.ON_FAILURE, pasta_screenshots=debug_writer.DEBUG_FOLDER,
+                       formato_screenshots='png', cota_screenshots_mb=200,
+                       quadros_historico=40, memoria_historico_mb=32, pasta_historico=frame_history.HISTORY_FOLDER,
+                       arquivo_eventos=None, arquivo_prometheus=None, porta_metricas=None,
+                       imagens=None, pacote=template_registry.PACK_FILE):
+    """
+    Configura de uma vez os subsistemas globais do bot: janela do jogo, teclado
+    e mouse, captura, matching, screenshots de depuração, histórico de frames,
+    métricas e templates. Chamada pelos pontos de entrada (console, GUI e
+    supervisor) depois de `configurar_log` e da inicialização do Interception;
+    `janela_jogo=None` mantém as buscas na tela inteira (o supervisor usa um
+    localizador por cliente).
+    """
+    configurar_entrada(entrada)
+    if janela_jogo:
+        configurar_janela_jogo(janela_jogo)
+    configurar_captura(captura, idade_frame)
+    configurar_matching(threads_matching, niveis_piramide)
+    configurar_screenshots(screenshots, pasta=pasta_screenshots, formato=formato_screenshots,
+                           cota_mb=cota_screenshots_mb)
+    configurar_historico(quadros_historico, memoria_historico_mb, pasta=pasta_historico)
+    configurar_metricas(arquivo_eventos, arquivo_prometheus, porta=porta_metricas)
+    return carregar_templates(imagens, pacote)
+
+@contextlib.contextmanager
+def usar_localizador(localizador):
+    """
+    Direciona temporariamente as buscas de funcoes.py para outro localizador
+    (ex: a janela de um cliente específico durante a reconexão dele).
+    """
+    global _localizador
+    anterior = _localizador
+    _localizador = localizador
+    try:
+        yield localizador
+    finally:
+        _localizador = anterior
 
 # --- NOVA FUNÇÃO PARA FOCAR NO JOGO COM DETECÇÃO DE MOVIMENTO DO MOUSE ---
 def clicar_para_focar_jogo(imagem_alvo_foco, confianca_imagem=0.8, max_tentativas_foco=5, delay_mouse_movido=3):
@@ -76,296 +353,298 @@ def clicar_para_focar_jogo(imagem_alvo_foco, confianca_imagem=0.8, max_tentativa
     Se o mouse for movido durante a tentativa, espera e tenta novamente.
     Retorna True se o clique foi bem-sucedido, False caso contrário.
     """
-    log_info(f"Iniciando 'clicar_para_focar_jogo' em '{imagem_alvo_foco}'.")
+    log_info("Iniciando 'clicar_para_focar_jogo' em '%s'.", imagem_alvo_foco)
     tentativas_foco = 0
     while tentativas_foco < max_tentativas_foco:
         tentativas_foco += 1
-        log_info(f"Tentativa {tentativas_foco}/{max_tentativas_foco} para focar em '{imagem_alvo_foco}'.")
+        log_info("Tentativa %s/%s para focar em '%s'.", tentativas_foco, max_tentativas_foco, imagem_alvo_foco)
         pos_mouse_antes = pyautogui.position()
         coords_alvo = None
         try:
-            coords_alvo = pyautogui.locateCenterOnScreen(imagem_alvo_foco, confidence=confianca_imagem)
+            # A imagem de foco pode ficar fora da área da janela, então a tela inteira é o fallback
+            # (exceto em localizadores presos a um cliente, veja RegionLocator.full_screen)
+            coords_alvo = _localizador.locate(imagem_alvo_foco, confidence=confianca_imagem,
+                                              full_screen_fallback=True)
             if coords_alvo:
-                log_info(f"Imagem '{imagem_alvo_foco}' encontrada em {coords_alvo}.")
+                log_info("Imagem '%s' encontrada em %s.", imagem_alvo_foco, coords_alvo)
                 # Uma pequena pausa para o usuário ter chance de mover o mouse se estiver usando
-                time.sleep(0.2)
+                esperar(0.2)
                 pos_mouse_depois_busca = pyautogui.position()
 
                 if pos_mouse_antes != pos_mouse_depois_busca:
-                    log_aviso(f"Movimento do mouse detectado (Antes: {pos_mouse_antes}, Depois: {pos_mouse_depois_busca}). "
-                              f"Aguardando {delay_mouse_movido}s antes de tentar novamente.")
-                    time.sleep(delay_mouse_movido)
+                    log_aviso("Movimento do mouse detectado (Antes: %s, Depois: %s). "
+                              "Aguardando %ss antes de tentar novamente.",
+                              pos_mouse_antes, pos_mouse_depois_busca, delay_mouse_movido)
+                    esperar(delay_mouse_movido)
                     continue # Próxima iteração do while para tentar novamente
 
                 # Se não houve movimento, prossegue com o clique
-                click(x=coords_alvo.x, y=coords_alvo.y, button='left') # Usa o click do interception
-                log_info(f"Clique (interception) realizado em '{imagem_alvo_foco}' em {coords_alvo} para focar.")
-                time.sleep(1.0) # Pequena pausa após o clique
+                click(x=coords_alvo.x, y=coords_alvo.y, button='left')
+                log_info("Clique realizado em '%s' em %s para focar.", imagem_alvo_foco, coords_alvo)
+                esperar(ESPERA_APOS_FOCO)
                 return True
             else:
-                log_aviso(f"Imagem '{imagem_alvo_foco}' não encontrada na tentativa {tentativas_foco}.")
+                log_aviso("Imagem '%s' não encontrada na tentativa %s.", imagem_alvo_foco, tentativas_foco)
                 if tentativas_foco < max_tentativas_foco:
-                    time.sleep(1) # Espera antes da próxima tentativa de localizar
+                    esperar(1) # Espera antes da próxima tentativa de localizar
         except pyautogui.ImageNotFoundException:
-            log_aviso(f"Imagem '{imagem_alvo_foco}' não encontrada (exceção) na tentativa {tentativas_foco}.")
+            log_aviso("Imagem '%s' não encontrada (exceção) na tentativa %s.", imagem_alvo_foco, tentativas_foco)
             if tentativas_foco < max_tentativas_foco:
-                time.sleep(1)
-        except NameError: # Especificamente para o caso de 'click' do interception não estar definido
-            log_error("A função 'click' do 'interception' não está disponível. Não é possível focar no jogo.")
-            return False # Falha crítica
+                esperar(1)
         except Exception as e:
-            log_error(f"Erro ao tentar focar em '{imagem_alvo_foco}': {type(e).__name__} - {e}")
+            log_error("Erro ao tentar focar em '%s': %s - %s", imagem_alvo_foco, type(e).__name__, e)
             if tentativas_foco < max_tentativas_foco:
-                time.sleep(1)
+                esperar(1)
 
-    log_error(f"Não foi possível focar no jogo clicando em '{imagem_alvo_foco}' após {max_tentativas_foco} tentativas.")
+    log_error("Não foi possível focar no jogo clicando em '%s' após %s tentativas.",
+              imagem_alvo_foco, max_tentativas_foco)
     return False
 
 # --- Funções Auxiliares Existentes (com melhorias e uso do logger) ---
 
-def enviar_enter(): # Mantida conforme a sugestão anterior
-    log_info("Iniciando 'enviar_enter'...")
+def enviar_enter():
     try:
         press('enter')
-        backend_module = getattr(press, '__module__', 'desconhecido')
-        if 'interception' in backend_module:
-             log_info("Enter enviado via 'press(\\'enter\\')' (usando interception).")
-        elif hasattr(pyautogui, 'press') and press.__code__ == pyautogui.press.__code__ :
-            log_info("Enter enviado via 'press(\\'enter\\')' (usando pyautogui).")
-        else:
-            log_info(f"Enter enviado via 'press(\\'enter\\')' (usando backend: {backend_module}).")
+        log_info("Enter enviado.")
     except Exception as e:
-        log_error(f"Falha ao enviar Enter usando a função 'press' configurada: {e}")
-    time.sleep(0.5)
+        log_error("Falha ao enviar Enter: %s", e)
+
+def aguardar_tela_estavel(estabilidade=ESTABILIDADE_TELA, intervalo=0.1, tempo_limite=5.0, tolerancia=2.0):
+    """
+    Espera a janela do jogo ficar `estabilidade` segundos sem mudar (miniatura
+    com diferença média até `tolerancia`), com capturas novas a cada
+    `intervalo`. O tempo é contado pelas esperas (`esperar`). Retorna True se
+    a tela estabilizou antes de `tempo_limite` segundos.
+    """
+    regiao = _localizador.window_region()
+    anterior = region_signature(grab(regiao, fresh=True)[0])
+    parado = total = 0.0
+    while total < tempo_limite:
+        esperar(intervalo)
+        total += intervalo
+        atual = region_signature(grab(regiao, fresh=True)[0])
+        parado = parado + intervalo if float(abs(atual - anterior).mean()) <= tolerancia else 0.0
+        anterior = atual
+        if parado >= estabilidade:
+            return True
+    return False
 
 def preencher_e_logar(senha_digitada):
-    # Esta função não precisa mais se preocupar em ativar a janela
-    log_info("Iniciando 'preencher_e_logar' para a senha...")
+    """Tab para o campo de senha, a senha inteira e Enter, em uma única sequência de entrada"""
+    log_info("Digitando senha: %s", '*' * len(senha_digitada))
     try:
-        press('tab')
-        log_info("Tab enviado para focar no campo de senha.")
-        time.sleep(0.3)
-        log_info(f"Tentando digitar senha: {'*' * len(senha_digitada)}")
-        log_info("Digitando senha caracter por caracter para maior compatibilidade...")
-        for char_senha in senha_digitada:
-            try:
-                press(char_senha)
-                time.sleep(0.1)
-            except Exception as e_char:
-                log_error(f"Falha ao digitar o caracter '{char_senha}': {e_char}")
-        log_info("Senha enviada caracter por caracter.")
-        time.sleep(0.3)
-        press('enter')
-        log_info("Enter enviado para submeter a senha.")
+        duracao = enviar_acoes([Key('tab'), Pause(PAUSA_TROCA_CAMPO), Text(senha_digitada), Key('enter')])
+        log_info("Senha enviada e submetida em %.0fms.", duracao * 1000)
         return True
     except Exception as e:
-        log_error(f"Falha em 'preencher_e_logar': {e}")
+        log_error("Falha em 'preencher_e_logar': %s", e)
         return False
 
-def digitar_pin_numerico(pin_str, pasta_imagens_pin="", confianca_imagem=0.75):
-    log_info(f"Iniciando digitação do PIN com template matching (dígitos: {'*' * len(pin_str)}).")
+def _localizar(image_path, confianca):
+    """Localiza a imagem sem propagar exceções (usada nas consultas de estado do login)"""
+    try:
+        return _localizador.locate(image_path, confidence=confianca)
+    except Exception as e:
+        log_error("Erro ao buscar '%s': %s - %s", image_path, type(e).__name__, e)
+        return None
+
+def find_all_template_matches(screen_image, templates, threshold=0.7, keys=None, origin=(0, 0)):
+    """Encontra a melhor correspondência (após supressão de não-máximos) de cada template na tela"""
+    all_positions = {}
+
+    for key, match in templates.match_all(screen_image, threshold=threshold, keys=keys, origin=origin).items():
+        all_positions[key] = (match.x, match.y, match.confidence)
+        log_debug("%s: encontrado em (%d, %d) com confiança %.3f", key, match.x, match.y, match.confidence)
+
+    for key in (templates.keys() if keys is None else keys):
+        if key not in all_positions:
+            log_debug("%s: nenhuma correspondência encontrada", key)
+
+    return all_positions
+
+def clicar_botao_jogar(image_jogar='jogar.png', confianca=0.8, timeout=20, coords_jogar=None):
+    """
+    Espera o botão 'Jogar' aparecer (consultas adaptativas), clica nele e aguarda
+    a tela de seleção de personagem fechar. Retorna True se o clique foi feito.
+    """
+    if coords_jogar is None:
+        log_info("Procurando botão 'Jogar' ('%s', até %ss)...", image_jogar, timeout)
+        coords_jogar = wait_until(lambda: _localizar(image_jogar, confianca), timeout, sleep=esperar)
+    if not coords_jogar:
+        log_aviso("⚠️ Botão 'Jogar' não foi encontrado em %ss", timeout)
+        return False
+
+    log_info("Botão 'Jogar' encontrado em %s", coords_jogar)
+    # Clica e tira o mouse de cima do botão (300px à direita) na mesma sequência
+    enviar_acoes([Click(coords_jogar.x, coords_jogar.y), Move(coords_jogar.x + 300, coords_jogar.y)])
+    log_info("Clique no botão 'Jogar' realizado com sucesso!")
+
+    # Em vez de uma espera fixa, aguarda a tela de seleção sumir (jogo carregando)
+    if wait_until(lambda: not _localizar(image_jogar, confianca), 10, initial_interval=0.25, sleep=esperar):
+        log_info("Tela de seleção de personagem fechada. Entrando no jogo.")
+    else:
+        log_aviso("'%s' ainda visível 10s após o clique.", image_jogar)
+    return True
+
+@_salvar_historico_em_falha('pin')
+def digitar_pin_numerico(pin_str, pasta_imagens_pin="", confianca_imagem=0.75, clicar_jogar=True):
+    log_info("Iniciando digitação do PIN com template matching (dígitos: %s).", '*' * len(pin_str))
     
     if not pin_str.isdigit() or len(pin_str) < 4:
-        log_error(f"PIN inválido: '{pin_str}'. Deve ter 4 dígitos numéricos.")
+        log_error("PIN inválido: '%s'. Deve ter 4 dígitos numéricos.", pin_str)
         return False
 
-    def capture_screen():
-        """Captura a tela inteira"""
-        screenshot = pyautogui.screenshot()
-        return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+    def capture_screen(region=None):
+        """
+        Captura a região (left, top, width, height); sem região, usa a janela do jogo
+        (ou a tela inteira se ela não for encontrada). Retorna (imagem, origem).
+        """
+        return grab(region or _localizador.window_region())
 
-    def save_screenshot_with_analysis(image, filename, positions=None):
-        """Salva o screenshot com marcações das posições detectadas"""
-        annotated = image.copy()
-        
-        if positions:
-            for key, (x, y) in positions.items():
-                # Desenha um círculo na posição detectada
-                cv2.circle(annotated, (int(x), int(y)), 15, (0, 255, 0), 3)
-                # Desenha cruz para precisão
-                cv2.line(annotated, (int(x)-20, int(y)), (int(x)+20, int(y)), (0, 255, 0), 2)
-                cv2.line(annotated, (int(x), int(y)-20), (int(x), int(y)+20), (0, 255, 0), 2)
-                # Adiciona texto identificando o botão
-                cv2.putText(annotated, str(key), (int(x)-15, int(y)-30), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        
-        cv2.imwrite(filename, annotated)
-        log_info(f"Screenshot com análise salvo: {filename}")
+    def save_screenshot_with_analysis(image, filename, positions=None, origin=(0, 0), crop=None, falha=False):
+        """Agenda o screenshot com marcações das posições detectadas (gravado em segundo plano)"""
+        if debug_writer.writer().submit(image, filename, positions, origin, crop=crop, failure=falha):
+            log_info("Screenshot com análise agendado: %s", filename)
 
     def load_template_images(pasta_imagens_pin):
-        """Carrega as imagens template dos números e botão confirmar"""
-        templates = {}
-        
-        # Carrega imagens dos números 0-9
-        for i in range(10):
-            template_path = os.path.join(pasta_imagens_pin, f"{i}.png")
-            if os.path.exists(template_path):
-                template = cv2.imread(template_path, cv2.IMREAD_COLOR)
-                if template is not None:
-                    templates[str(i)] = template
-                    log_info(f"Template {i}.png carregado: {template.shape}")
-                else:
-                    log_error(f"Erro ao carregar {template_path}")
-            else:
-                log_error(f"Arquivo {template_path} não encontrado")
+        """Monta o matcher dos números e do botão confirmar (decodificados uma única vez pelo registro)"""
+        registro = template_registry.registry()
+        caminhos = {}
         
-        # Carrega imagem do botão Confirmar
-        confirmar_path = os.path.join(pasta_imagens_pin, "confirmar.png")
-        if os.path.exists(confirmar_path):
-            template = cv2.imread(confirmar_path, cv2.IMREAD_COLOR)
-            if template is not None:
-                templates['confirmar'] = template
-                log_info(f"Template confirmar.png carregado: {template.shape}")
+        # Números 0-9 e botão Confirmar; PNGs já lidos (ou vindos do pacote) não são relidos
+        for key in [str(i) for i in range(10)] + ['confirmar']:
+            template_path = os.path.join(pasta_imagens_pin, f"{key}.png")
+            if template_path in registro:
+                caminhos[key] = template_path
+            elif os.path.exists(template_path):
+                try:
+                    template = registro.gray(template_path)
+                    caminhos[key] = template_path
+                    log_info("Template %s.png carregado: %s", key, template.shape)
+                except FileNotFoundError:
+                    log_error("Erro ao carregar %s", template_path)
             else:
-                log_error(f"Erro ao carregar {confirmar_path}")
-        else:
-            log_error(f"Arquivo {confirmar_path} não encontrado")
+                log_error("Arquivo %s não encontrado", template_path)
         
-        log_info(f"Total de templates carregados: {len(templates)}")
-        return templates
+        log_info("Total de templates carregados: %s", len(caminhos))
+        return registro.matcher(caminhos)
 
-    def wait_for_pin_interface(templates, max_wait_time=30, check_interval=2):
-        """Espera a interface do PIN aparecer antes de começar"""
-        log_info(f"Aguardando interface do PIN aparecer (máximo {max_wait_time}s)...")
+    def wait_for_pin_interface(templates, max_wait_time=30, check_interval=0.5):
+        """Espera a interface do PIN aparecer e retorna o layout do teclado (ou None)"""
+        log_info("Aguardando interface do PIN aparecer (máximo %ss)...", max_wait_time)
         
         start_time = time.time()
         attempt = 1
+        digits = [str(i) for i in range(10)]
         
         while time.time() - start_time < max_wait_time:
-            log_info(f"Tentativa {attempt}: Verificando se interface do PIN está visível...")
+            log_info("Tentativa %s: Verificando se interface do PIN está visível...", attempt)
             
-            # Captura tela atual
-            image = capture_screen()
+            # Captura tela atual (uma única conversão para cinza para todos os dígitos)
+            inicio_captura = time.perf_counter()
+            image, origin = capture_screen()
+            inicio_match = time.perf_counter()
             
             # Verifica se pelo menos alguns números estão visíveis
-            found_numbers = []
-            for digit in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']:
-                if digit in templates:
-                    result = cv2.matchTemplate(image, templates[digit], cv2.TM_CCOEFF_NORMED)
-                    _, max_val, _, _ = cv2.minMaxLoc(result)
-                    if max_val >= 0.7:  # Threshold mais baixo para detecção
-                        found_numbers.append(digit)
+            matches = templates.match_all(image, threshold=0.7, keys=digits, origin=origin)
+            found_numbers = sorted(matches)
+            _registrar_metricas_busca('teclado_pin', max((m.confidence for m in matches.values()), default=None),
+                                      inicio_match - inicio_captura, time.perf_counter() - inicio_match)
+            frame_history.ring().record(image, origin, 'teclado_pin', matches)
             
-            log_info(f"Números visíveis: {found_numbers} ({len(found_numbers)} de 10)")
+            log_info("Números visíveis: %s (%s de 10)", found_numbers, len(found_numbers))
             
             # Se encontrou pelo menos 5 números diferentes, a interface provavelmente está visível
             if len(found_numbers) >= 5:
-                log_info(f"Interface do PIN detectada! Encontrados {len(found_numbers)} números visíveis")
+                log_info("Interface do PIN detectada! Encontrados %s números visíveis", len(found_numbers))
+                # O teclado é embaralhado a cada exibição, mas fica fixo durante a digitação:
+                # as posições deste frame valem para todos os dígitos do PIN
+                layout = KeypadLayout.from_matches(matches, image, origin=origin)
+                log_info("Layout do teclado registrado na região %s", layout.region)
                 # Salva screenshot da interface detectada
-                save_screenshot_with_analysis(image, "pin_interface_detected.png")
-                return True
+                save_screenshot_with_analysis(image, "pin_interface_detected.png",
+                                              {key: (m.x, m.y) for key, m in matches.items()}, origin,
+                                              crop=layout.region)
+                return layout
             
-            log_info(f"Interface ainda não visível. Aguardando {check_interval}s...")
-            time.sleep(check_interval)
+            log_info("Interface ainda não visível. Aguardando %ss...", check_interval)
+            esperar(check_interval)
             attempt += 1
         
-        log_error(f"Timeout: Interface do PIN não apareceu em {max_wait_time}s")
-        return False
+        log_error("Timeout: Interface do PIN não apareceu em %ss", max_wait_time)
+        return None
 
-    def find_all_template_matches(screen_image, templates, threshold=0.7):
-        """Encontra todas as correspondências de templates na tela"""
-        all_positions = {}
-        
-        for key, template in templates.items():
-            log_info(f"Procurando todas as instâncias de: {key}")
-            
-            # Template matching
-            result = cv2.matchTemplate(screen_image, template, cv2.TM_CCOEFF_NORMED)
-            
-            # Encontra todas as correspondências acima do threshold
-            locations = np.where(result >= threshold)
-            
-            matches = []
-            template_h, template_w = template.shape[:2]
-            
-            for pt in zip(*locations[::-1]):  # Switch columns and rows
-                center_x = pt[0] + template_w // 2
-                center_y = pt[1] + template_h // 2
-                confidence = result[pt[1], pt[0]]
-                matches.append((center_x, center_y, confidence))
-            
-            if matches:
-                # Ordena por confiança (maior primeiro)
-                matches.sort(key=lambda x: x[2], reverse=True)
-                all_positions[key] = matches
-                log_info(f"{key}: {len(matches)} correspondências encontradas")
-                for i, (x, y, conf) in enumerate(matches[:3]):  # Mostra apenas as 3 melhores
-                    log_info(f"  {i+1}º: ({x}, {y}) confiança {conf:.3f}")
-            else:
-                log_info(f"{key}: nenhuma correspondência encontrada")
-        
-        return all_positions
+    def wait_keypad_settle(layout):
+        """
+        Depois de um clique no teclado: espera a região do teclado mudar (o
+        cliente redesenha ou embaralha os botões) ou, sem mudança, ESPERA_TECLADO_PIN
+        segundos. Cada consulta é uma captura nova, não o frame compartilhado.
+        """
+        esperado = 0.0
+        while esperado < ESPERA_TECLADO_PIN:
+            intervalo = min(0.05, ESPERA_TECLADO_PIN - esperado)
+            esperar(intervalo)
+            esperado += intervalo
+            if not layout.is_current(grab(layout.region, fresh=True)[0]):
+                log_debug("Teclado do PIN mudou %.2fs após o clique; aguardando o redesenho.", esperado)
+                esperar(ESPERA_REDESENHO_PIN)
+                return
 
-    def click_number_with_template_matching(number, step, templates, max_retries=3):
-        """Clica em um número usando template matching com retry"""
-        log_info(f"PASSO {step}: CLICANDO NO NÚMERO {number} (TEMPLATE MATCHING)")
+    def click_number_with_template_matching(number, step, templates, layout, max_retries=3):
+        """Clica em um número usando o layout do teclado, recalculando-o apenas se o teclado mudou"""
+        log_info("PASSO %s: CLICANDO NO NÚMERO %s (LAYOUT DO TECLADO)", step, number)
+        digits = [str(i) for i in range(10)]
         
         for retry in range(max_retries):
             if retry > 0:
-                log_info(f"Tentativa {retry + 1}/{max_retries}")
-                time.sleep(1)  # Aguarda antes de tentar novamente
+                log_info("Tentativa %s/%s", retry + 1, max_retries)
+                esperar(1)  # Aguarda antes de tentar novamente
             
-            # Captura a tela antes do clique
-            log_info("Capturando tela...")
-            image = capture_screen()
-            filename = f"template_step_{step}_attempt_{retry + 1}_before.png"
+            # Confere o layout capturando apenas a região do teclado
+            region_image, region_origin = capture_screen(layout.region)
+            layout_atual = layout.is_current(region_image)
+            frame_history.ring().record(region_image, region_origin, f'teclado_passo_{step}',
+                                        {'layout_atual': layout_atual, 'numero': layout.positions.get(str(number))})
+            if not layout_atual or str(number) not in layout:
+                log_aviso("Teclado do PIN mudou (ou dígito ausente no layout). Recalculando layout...")
+                image, origin = capture_screen()
+                atualizado = layout.refresh(templates, image, keys=digits, origin=origin)
+                frame_history.ring().record(image, origin, f'recalculo_passo_{step}', layout.positions if atualizado else None)
+                if not atualizado:
+                    log_error("Número %s não encontrado na tentativa %s", number, retry + 1)
+                    save_screenshot_with_analysis(image, f"template_step_{step}_attempt_{retry + 1}_before.png",
+                                                  origin=origin, falha=True)
+                    continue
             
-            # Encontra todas as posições dos templates
-            log_info("Analisando templates na imagem...")
-            all_positions = find_all_template_matches(image, templates, threshold=0.7)
+            position = layout.get(str(number))
+            if position is None:
+                log_error("Número %s não encontrado na tentativa %s", number, retry + 1)
+                continue
             
-            # Seleciona a melhor posição para este número
-            if str(number) in all_positions and all_positions[str(number)]:
-                best_match = all_positions[str(number)][0]
-                x, y = best_match[0], best_match[1]
-                confidence = best_match[2]
-                
-                log_info(f"Posição encontrada para {number}: ({x}, {y}) com confiança {confidence:.3f}")
-                
-                # Cria um dicionário com apenas esta posição para o screenshot
-                single_position = {str(number): (x, y)}
-                save_screenshot_with_analysis(image, filename, single_position)
+            x, y = position
+            log_info("Posição do número %s no layout: (%s, %s) confiança %.3f",
+                     number, x, y, layout.positions[str(number)].confidence)
+            
+            try:
+                # Clica e tira o mouse de cima do teclado (300px à direita) na mesma sequência
+                enviar_acoes([Click(x, y), Move(x + 300, y)])
+                log_info("Clique no número %s realizado com sucesso", number)
+                # Só segue para o próximo dígito (que confere o layout) depois do teclado assentar
+                wait_keypad_settle(layout)
                 
-                # Move o mouse e clica usando a função click configurada
-                log_info(f"Movendo mouse para ({x}, {y})")
-                try:
-                    click(x, y, 'left')  # Usa a função click configurada (interception ou pyautogui)
-                    log_info(f"Clique no número {number} realizado com sucesso")
-                    
-                    # === MOVIMENTO DO MOUSE APÓS CLIQUE ===
-                    # Move o mouse 300 pixels para a direita após clicar no número
-                    nova_posicao_x = x + 300
-                    log_info(f"Movendo mouse 300 pixels para a direita: ({x}, {y}) -> ({nova_posicao_x}, {y})")
-                    try:
-                        # Usa pyautogui para mover o mouse (mais confiável para movimento)
-                        pyautogui.moveTo(nova_posicao_x, y)
-                        log_info(f"Mouse movido para ({nova_posicao_x}, {y})")
-                    except Exception as e_move:
-                        log_aviso(f"Erro ao mover mouse para a direita: {e_move}")
-                    
-                    # Aguarda 1 segundo antes de prosseguir
-                    log_info("Aguardando 1 segundo após movimento do mouse...")
-                    time.sleep(1)
-                    
-                    # Aguarda um pouco para a interface atualizar
-                    time.sleep(0.5)
-                    
-                    # Captura a tela após o clique
-                    log_info("Capturando tela após o clique...")
-                    image_after = capture_screen()
+                # Captura apenas a região do teclado após o clique
+                if debug_writer.writer().wants():
+                    image_after, origin_after = capture_screen(layout.region)
                     filename_after = f"template_step_{step}_attempt_{retry + 1}_after.png"
-                    save_screenshot_with_analysis(image_after, filename_after)
-                    
-                    log_info(f"Número {number} clicado com sucesso usando template matching!")
-                    return True
-                except Exception as e_click:
-                    log_error(f"Erro ao clicar no número {number}: {e_click}")
-                    continue
-            else:
-                log_error(f"Número {number} não encontrado na tentativa {retry + 1}")
-                save_screenshot_with_analysis(image, filename)
+                    save_screenshot_with_analysis(image_after, filename_after, origin=origin_after)
+                
+                log_info("Número %s clicado com sucesso usando o layout do teclado!", number)
+                return True
+            except Exception as e_click:
+                log_error("Erro ao clicar no número %s: %s", number, e_click)
+                continue
         
-        log_error(f"Falha ao clicar no número {number} após {max_retries} tentativas")
+        log_error("Falha ao clicar no número %s após %s tentativas", number, max_retries)
         return False
 
     def click_confirmar_with_template_matching(templates, max_retries=3):
@@ -374,27 +653,26 @@ def digitar_pin_numerico(pin_str, pasta_imagens_pin="", confianca_imagem=0.75):
         
         for retry in range(max_retries):
             if retry > 0:
-                log_info(f"Tentativa {retry + 1}/{max_retries}")
-                time.sleep(1)
+                log_info("Tentativa %s/%s", retry + 1, max_retries)
+                esperar(1)
             
             # Captura a tela
             log_info("Capturando tela...")
-            image = capture_screen()
+            image, origin = capture_screen()
             
             # Encontra o botão Confirmar
             log_info("Procurando botão Confirmar...")
-            all_positions = find_all_template_matches(image, {'confirmar': templates['confirmar']}, threshold=0.7)
+            all_positions = find_all_template_matches(image, templates, threshold=0.7, keys=['confirmar'], origin=origin)
+            frame_history.ring().record(image, origin, 'confirmar_pin', all_positions.get('confirmar'))
             
-            if 'confirmar' in all_positions and all_positions['confirmar']:
-                best_match = all_positions['confirmar'][0]
-                x, y = best_match[0], best_match[1]
-                confidence = best_match[2]
+            if 'confirmar' in all_positions:
+                x, y, confidence = all_positions['confirmar']
                 
-                log_info(f"Botão Confirmar encontrado em: ({x}, {y}) com confiança {confidence:.3f}")
+                log_info("Botão Confirmar encontrado em: (%s, %s) com confiança %.3f", x, y, confidence)
                 
                 # Salva screenshot
                 single_position = {'confirmar': (x, y)}
-                save_screenshot_with_analysis(image, f"template_confirmar_attempt_{retry + 1}.png", single_position)
+                save_screenshot_with_analysis(image, f"template_confirmar_attempt_{retry + 1}.png", single_position, origin)
                 
                 # Clica no botão
                 log_info("Clicando em Confirmar")
@@ -403,13 +681,14 @@ def digitar_pin_numerico(pin_str, pasta_imagens_pin="", confianca_imagem=0.75):
                     log_info("Botão Confirmar clicado com sucesso!")
                     return True
                 except Exception as e_click:
-                    log_error(f"Erro ao clicar no botão Confirmar: {e_click}")
+                    log_error("Erro ao clicar no botão Confirmar: %s", e_click)
                     continue
             else:
-                log_error(f"Botão Confirmar não encontrado na tentativa {retry + 1}")
-                save_screenshot_with_analysis(image, f"template_confirmar_not_found_attempt_{retry + 1}.png")
+                log_error("Botão Confirmar não encontrado na tentativa %s", retry + 1)
+                save_screenshot_with_analysis(image, f"template_confirmar_not_found_attempt_{retry + 1}.png",
+                                              origin=origin, falha=True)
         
-        log_error(f"Falha ao clicar no botão Confirmar após {max_retries} tentativas")
+        log_error("Falha ao clicar no botão Confirmar após %s tentativas", max_retries)
         return False
 
     # === FUNÇÃO PRINCIPAL ===
@@ -422,161 +701,105 @@ def digitar_pin_numerico(pin_str, pasta_imagens_pin="", confianca_imagem=0.75):
             log_error("Nenhum template foi carregado! Verifique se as imagens estão no diretório.")
             return False
         
-        # Aguarda a interface do PIN aparecer
-        if not wait_for_pin_interface(templates):
+        # Aguarda a interface do PIN aparecer e localiza o teclado uma única vez
+        layout = wait_for_pin_interface(templates)
+        if layout is None:
             log_error("Interface do PIN não apareceu. Abortando...")
             return False
         
-        log_info(f"Iniciando sequência do código: {pin_str}")
+        log_info("Iniciando sequência do código: %s", pin_str)
         
         # Clica em cada número usando template matching
         success_count = 0
         for i, digit in enumerate(pin_str):
-            if click_number_with_template_matching(digit, i + 1, templates):
+            if click_number_with_template_matching(digit, i + 1, templates, layout):
                 success_count += 1
-                log_info(f"Progresso: {success_count}/{len(pin_str)} números inseridos")
+                log_info("Progresso: %s/%s números inseridos", success_count, len(pin_str))
             else:
-                log_error(f"Falha no dígito {digit} (posição {i + 1})")
-            
-            if i < len(pin_str) - 1:  # Aguarda entre cliques (exceto no último)
-                log_info("Aguardando 2 segundos antes do próximo número...")
-                time.sleep(2)
+                log_error("Falha no dígito %s (posição %s)", digit, i + 1)
         
-        log_info(f"Resultado final: {success_count}/{len(pin_str)} números clicados com sucesso")
+        log_info("Resultado final: %s/%s números clicados com sucesso", success_count, len(pin_str))
         
         if success_count == len(pin_str):
             log_info("Todos os números foram inseridos! Procedendo para confirmação...")
             
-            # Aguarda antes de confirmar
-            log_info("Aguardando 2 segundos antes de confirmar...")
-            time.sleep(2)
-            
             # Clica em Confirmar
             if 'confirmar' in templates and click_confirmar_with_template_matching(templates):
                 log_info("OPERAÇÃO CONCLUÍDA COM SUCESSO TOTAL!")
-                log_info(f"PIN {pin_str} inserido e confirmado!")
-                
-                # === NOVO: CLICAR NO BOTÃO "JOGAR" ===
-                log_info("Passo adicional: Procurando botão 'Jogar'...")
+                log_info("PIN %s inserido e confirmado!", pin_str)
                 
-                # Aguarda um pouco para a tela carregar
-                time.sleep(3)
-                
-                # Procura e clica no botão Jogar
-                jogar_encontrado = False
-                max_tentativas_jogar = 10
-                
-                for tentativa_jogar in range(1, max_tentativas_jogar + 1):
-                    log_info(f"Tentativa {tentativa_jogar}/{max_tentativas_jogar}: Procurando jogar.png...")
-                    
-                    try:
-                        coords_jogar = pyautogui.locateCenterOnScreen('jogar.png', confidence=0.8)
-                        if coords_jogar:
-                            log_info(f"Botão 'Jogar' encontrado em {coords_jogar}")
-                            
-                            # Clica no botão Jogar
-                            click(coords_jogar.x, coords_jogar.y, 'left')
-                            log_info("Clique no botão 'Jogar' realizado com sucesso!")
-                            
-                            # Move o mouse para a direita após clicar
-                            nova_posicao_x = coords_jogar.x + 300
-                            log_info(f"Movendo mouse 300 pixels para a direita após 'Jogar': ({coords_jogar.x}, {coords_jogar.y}) -> ({nova_posicao_x}, {coords_jogar.y})")
-                            try:
-                                pyautogui.moveTo(nova_posicao_x, coords_jogar.y)
-                                log_info(f"Mouse movido para ({nova_posicao_x}, {coords_jogar.y})")
-                            except Exception as e_move_jogar:
-                                log_aviso(f"Erro ao mover mouse após 'Jogar': {e_move_jogar}")
-                            
-                            time.sleep(1)  # Aguarda após movimento
-                            jogar_encontrado = True
-                            break
-                        else:
-                            log_info(f"Botão 'Jogar' não encontrado na tentativa {tentativa_jogar}")
-                            if tentativa_jogar < max_tentativas_jogar:
-                                time.sleep(2)  # Aguarda antes da próxima tentativa
-                    
-                    except pyautogui.ImageNotFoundException:
-                        log_info(f"jogar.png não encontrado (exceção) na tentativa {tentativa_jogar}")
-                        if tentativa_jogar < max_tentativas_jogar:
-                            time.sleep(2)
-                    except Exception as e_jogar:
-                        log_error(f"Erro ao procurar jogar.png na tentativa {tentativa_jogar}: {e_jogar}")
-                        if tentativa_jogar < max_tentativas_jogar:
-                            time.sleep(2)
+                if not clicar_jogar:
+                    # O botão 'Jogar' fica a cargo de quem chamou (ex: máquina de estados do login)
+                    return True
                 
-                if jogar_encontrado:
+                # === CLICAR NO BOTÃO "JOGAR" ===
+                log_info("Passo adicional: Procurando botão 'Jogar'...")
+                if clicar_botao_jogar('jogar.png', confianca=0.8):
                     log_info("✅ SEQUÊNCIA COMPLETA: PIN + Confirmar + Jogar realizada com sucesso!")
                     log_info("📋 RETORNANDO: O sistema pode agora retornar ao monitoramento de desconexão")
-                    
-                    # Aguarda um pouco para o jogo carregar
-                    time.sleep(5)
                     return True
                 else:
-                    log_aviso(f"⚠️ Botão 'Jogar' não foi encontrado após {max_tentativas_jogar} tentativas")
                     log_aviso("PIN foi inserido e confirmado, mas não foi possível clicar em 'Jogar'")
                     return True  # Considera sucesso parcial
                 
             else:
-                log_aviso(f"PIN {pin_str} inserido, mas falha ao clicar em Confirmar")
+                log_aviso("PIN %s inserido, mas falha ao clicar em Confirmar", pin_str)
                 return True  # Considera sucesso parcial
         else:
-            log_error(f"Operação FALHOU. Apenas {success_count} de {len(pin_str)} números foram clicados.")
+            log_error("Operação FALHOU. Apenas %s de %s números foram clicados.", success_count, len(pin_str))
             return False
             
     except Exception as e:
-        log_error(f"Erro inesperado na digitação do PIN: {e}")
+        log_error("Erro inesperado na digitação do PIN: %s", e)
         return False
 
-def encerrar_aplicativo_jogo(game_window_title):
-    # Esta função pode permanecer como está, pois lida com o fechamento geral do app
-    log_info(f"Tentando encerrar o aplicativo com o título '{game_window_title}'...")
-    # ... (restante da função mantida como no seu original)
-    try:
-        game_windows = pyautogui.getWindowsWithTitle(game_window_title)
-        if game_windows:
-            for window in game_windows:
-                try: # Adicionado try-except para falhas individuais ao fechar
-                    window.close()
-                    log_info(f"Janela '{game_window_title}' (PID {window._hWnd}) fechada via pyautogui.close().") # Usar _hWnd se disponível para ID único
-                    time.sleep(0.5)
-                except Exception as e_close:
-                    log_aviso(f"Falha ao tentar fechar uma janela '{game_window_title}': {e_close}")
-        else:
-            log_aviso(f"Nenhuma janela com o título '{game_window_title}' encontrada para fechar via pyautogui.")
+def processos_jogo():
+    """Índice compartilhado dos processos do cliente (PID -> processo, janela -> PID)"""
+    return process_index.shared(net_watch.GAME_PROCESS_NAMES)
 
-        process_names_to_check = ['Ragnarok.exe', 'Ragexe.exe', 'client.exe'] # Mantido
-        
-        found_and_terminated = False
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                if proc.name() is None:
-                    continue
-                for name in process_names_to_check:
-                    if name.lower() in proc.name().lower():
-                        log_info(f"Processo do jogo encontrado: PID={proc.pid}, Nome='{proc.name()}'")
-                        proc.terminate()
-
-                        log_info(f"Processo do jogo (PID {proc.pid}) encerrado via psutil.")
-                        time.sleep(1)
-                        found_and_terminated = True
-                        break
-                if found_and_terminated:
-                    break 
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess) as e_proc:
-                log_aviso(f"Erro ao acessar/terminar processo {proc.pid if proc else 'desconhecido'}: {e_proc}")
-                continue
-            except Exception as e_proc_generic:
-                log_error(f"Erro inesperado com processo {proc.pid if proc else 'desconhecido'} '{proc.name() if proc else ''}': {e_proc_generic}")
-                continue
+def encerrar_aplicativo_jogo(game_window_title, tempo_limite=3.0, tempo_limite_kill=2.0):
+    """
+    Fecha as janelas do jogo e encerra os processos do cliente de uma vez:
+    terminate() em todos, uma única espera de até `tempo_limite` segundos e
+    kill() nos que não saírem (espera de mais `tempo_limite_kill`). Só são
+    encerrados os donos das janelas e os clientes iniciados pelo bot; outros
+    processos com o mesmo nome de executável ficam intactos.
+    """
+    log_info("Tentando encerrar o aplicativo com o título '%s'...", game_window_title)
+    indice = processos_jogo()
+    try:
+        indice.refresh()
+        alvos = set(indice.owned())
+        try:
+            game_windows = pyautogui.getWindowsWithTitle(game_window_title)
+        except Exception as e_windows:
+            log_aviso("Não foi possível enumerar as janelas '%s': %s", game_window_title, e_windows)
+            game_windows = []
+        if not game_windows:
+            log_aviso("Nenhuma janela com o título '%s' encontrada para fechar via pyautogui.", game_window_title)
+        for window in game_windows:
+            pid = indice.pid_for_window(window)
+            if pid is not None:
+                alvos.add(pid)
+            try: # Falha ao fechar uma janela não impede o encerramento pelo processo
+                window.close()
+                log_info("Janela '%s' (hWnd %s, PID %s) fechada.",
+                         game_window_title, getattr(window, '_hWnd', '?'), pid or '?')
+            except Exception as e_close:
+                log_aviso("Falha ao tentar fechar uma janela '%s': %s", game_window_title, e_close)
 
-        if found_and_terminated:
-            log_info("Aplicativo do jogo encerrado com sucesso.")
-            return True
-        else:
-            log_aviso("Não foi possível encontrar ou encerrar o processo do jogo com os nomes verificados via psutil.")
-            return False # Pode retornar False se apenas o fechamento da janela falhou mas o processo não foi encontrado
+        if not alvos:
+            log_aviso("Nenhum processo do jogo iniciado pelo bot ou dono de uma janela do jogo foi encontrado.")
+            return False
+        log_info("Encerrando %s processo(s) do jogo: PIDs %s", len(alvos), sorted(alvos))
+        encerrados, restantes = indice.terminate(alvos, timeout=tempo_limite, kill_timeout=tempo_limite_kill)
+        if restantes:
+            log_error("Processos do jogo não encerrados (acesso negado ou travados): PIDs %s", restantes)
+        if encerrados:
+            log_info("Aplicativo do jogo encerrado com sucesso (%s processo(s)).", len(encerrados))
+        return not restantes
     except Exception as e:
-        log_error(f"Erro ao tentar encerrar o aplicativo do jogo: {e}")
+        log_error("Erro ao tentar encerrar o aplicativo do jogo: %s", e)
         return False
 
 
@@ -590,73 +813,199 @@ def procurar_e_interagir_imagem(image_path, confidence, attempts=1, delay_betwee
     Procura por uma imagem na tela e realiza uma ação.
     NÃO tenta mais ativar a janela internamente. Assume que o jogo já está focado.
     """
-    log_info(f"Procurando por '{image_path}' para '{action}' (confiança: {confidence}, tentativas: {attempts})...")
+    log_info("Procurando por '%s' para '%s' (confiança: %s, tentativas: %s)...",
+             image_path, action, confidence, attempts)
     coords = None
     for tentativa in range(attempts):
         # REMOVIDO: _ativar_janela_local(game_window_title)
         try:
-            coords = pyautogui.locateCenterOnScreen(image_path, confidence=confidence)
+            coords = _localizador.locate(image_path, confidence=confidence)
             if coords:
-                log_info(f"'{image_path}' encontrado em {coords} (tentativa {tentativa + 1}).")
+                log_info("'%s' encontrado em %s (tentativa %s).", image_path, coords, tentativa + 1)
                 if action == 'click':
-                    click(x=coords.x, y=coords.y, button='left') # Usa click do interception
-                    log_info(f"Clique em '{image_path}' realizado.")
+                    click(x=coords.x, y=coords.y, button='left')
+                    log_info("Clique em '%s' realizado.", image_path)
                 elif action == 'press_enter':
                     enviar_enter()
-                    log_info(f"Enter enviado após encontrar '{image_path}'.")
+                    log_info("Enter enviado após encontrar '%s'.", image_path)
                 elif action == 'none':
-                    log_info(f"Ação 'none' para '{image_path}' realizada (apenas localização).")
+                    log_info("Ação 'none' para '%s' realizada (apenas localização).", image_path)
                 else:
-                    log_error(f"Ação '{action}' desconhecida para '{image_path}'.")
+                    log_error("Ação '%s' desconhecida para '%s'.", action, image_path)
                     return False
-                time.sleep(1) # Ajustado para 1s após interação
+                esperar(ESPERA_APOS_FOCO)
                 return True
             else: # (Lógica de imagem não encontrada mantida)
-                log_aviso(f"'{image_path}' não encontrado na tentativa {tentativa + 1}. Nova tentativa em {delay_between_attempts}s...")
-                time.sleep(delay_between_attempts)
+                log_aviso("'%s' não encontrado na tentativa %s. Nova tentativa em %ss...",
+                          image_path, tentativa + 1, delay_between_attempts)
+                esperar(delay_between_attempts)
         # (Restante dos excepts mantidos, especialmente NameError para 'click' ou 'press')
         except pyautogui.ImageNotFoundException:
-            log_aviso(f"'{image_path}' não encontrado (exceção ImageNotFoundException) na tentativa {tentativa + 1}. Nova tentativa em {delay_between_attempts}s...")
-            time.sleep(delay_between_attempts)
-        except NameError:
-            log_error(f"Função 'click' ou 'press' (interception) não importada. Não é possível interagir com '{image_path}'.")
-            return False # Falha crítica
+            log_aviso("'%s' não encontrado (exceção ImageNotFoundException) na tentativa %s. "
+                      "Nova tentativa em %ss...", image_path, tentativa + 1, delay_between_attempts)
+            esperar(delay_between_attempts)
         except Exception as e:
-            log_error(f"Erro ao buscar/interagir com '{image_path}': {type(e).__name__} - {e}. Nova tentativa em {delay_between_attempts}s...")
-            time.sleep(delay_between_attempts)
+            log_error("Erro ao buscar/interagir com '%s': %s - %s. Nova tentativa em %ss...",
+                      image_path, type(e).__name__, e, delay_between_attempts)
+            esperar(delay_between_attempts)
 
-    log_aviso(f"'{image_path}' NÃO foi encontrado após {attempts} tentativas ou a interação falhou.")
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    screenshot_filename = f"debug_image_not_found_{os.path.basename(image_path).replace('.png', '')}_{timestamp}.png"
-    try:
-        pyautogui.screenshot(screenshot_filename)
-        log_info(f"Screenshot de depuração salvo como: {screenshot_filename}")
-    except Exception as e_screenshot:
-        log_error(f"Falha ao salvar screenshot de depuração: {e_screenshot}")
+    log_aviso("'%s' NÃO foi encontrado após %s tentativas ou a interação falhou.", image_path, attempts)
+    if debug_writer.writer().wants(failure=True):
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        screenshot_filename = f"debug_image_not_found_{os.path.basename(image_path).replace('.png', '')}_{timestamp}.png"
+        try:
+            # Só a janela do jogo (tela inteira se ela não for encontrada); a gravação é em segundo plano
+            imagem_debug, origem = grab(_localizador.window_region())
+            if debug_writer.writer().submit(imagem_debug, screenshot_filename, origin=origem, failure=True):
+                log_info("Screenshot de depuração agendado: %s", screenshot_filename)
+        except Exception as e_screenshot:
+            log_error("Falha ao capturar screenshot de depuração: %s", e_screenshot)
     return False
 
-def verificar_desconexao(image_path='desconectado.png', confidence=0.9): # Removido game_window_title
+def verificar_desconexao(image_path='desconectado.png', confidence=0.9, verbose=True, localizador=None): # Removido game_window_title
     """
     Verifica se a tela de desconexão está visível.
     NÃO tenta mais ativar a janela internamente.
+    Com verbose=False só registra no log quando a desconexão é detectada.
+    `localizador` restringe a busca a outra janela (padrão: a janela configurada).
     """
-    log_info(f"Verificando tela de desconexão ('{image_path}')...")
+    localizador = localizador or _localizador
+    if verbose:
+        log_info("Verificando tela de desconexão ('%s')...", image_path)
     # REMOVIDO: if not _ativar_janela_local(game_window_title): ...
     try:
-        coords = pyautogui.locateOnScreen(image_path, confidence=confidence)
+        coords = localizador.locate(image_path, confidence=confidence)
         if coords:
-            log_info(f"Tela de desconexão '{image_path}' DETECTADA.")
+            log_info("Tela de desconexão '%s' DETECTADA.", image_path)
             return True
         else:
-            log_info(f"Tela de desconexão '{image_path}' NÃO detectada.")
+            if verbose:
+                log_info("Tela de desconexão '%s' NÃO detectada.", image_path)
             return False
     except pyautogui.ImageNotFoundException:
-        log_info(f"Tela de desconexão '{image_path}' NÃO detectada (exceção ImageNotFoundException).")
+        if verbose:
+            log_info("Tela de desconexão '%s' NÃO detectada (exceção ImageNotFoundException).", image_path)
+        return False
+    except Exception as e:
+        log_error("Erro inesperado ao verificar tela de desconexão: %s - %s", type(e).__name__, e)
         return False
+
+def criar_vigia_desconexao(image_path='desconectado.png', confidence=0.9, sample_interval=0.5,
+                           max_check_interval=10.0, localizador=None, intervalo_sem_hotspot=3.0):
+    """
+    Cria a vigia de desconexão: amostra a região do diálogo a cada `sample_interval`
+    segundos e só roda verificar_desconexao quando a região muda (ou a cada
+    `max_check_interval` segundos).
+
+    Antes da primeira desconexão não se sabe onde o diálogo aparece: a amostra
+    é o centro da janela do jogo (onde o diálogo costuma abrir), e as
+    verificações por mudança ficam espaçadas por `intervalo_sem_hotspot`
+    segundos, já que o centro da janela muda o tempo todo com o jogo.
+    """
+    def localizador_atual():
+        return localizador or _localizador
+
+    def regiao():
+        loc = localizador_atual()
+        hotspot = loc.hotspot_region(image_path)
+        if hotspot is not None:
+            return hotspot
+        return liveness.central_region(loc.window_region() or capture.screen_region())
+
+    return DisconnectWatch(
+        check=lambda: verificar_desconexao(image_path, confidence, verbose=False,
+                                           localizador=localizador_atual()),
+        region_provider=regiao,
+        sample_interval=sample_interval,
+        min_check_interval=sample_interval,
+        max_check_interval=max_check_interval,
+        cold_check_interval=max(sample_interval, intervalo_sem_hotspot),
+        learned=lambda: localizador_atual().hotspot_region(image_path) is not None,
+    )
+
+def criar_vigia_conexao(portas=None, tolerancia=3.0, armar_apos=10.0, processos=net_watch.GAME_PROCESS_NAMES, pid=None):
+    """
+    Cria a vigia das conexões TCP do cliente: informa a desconexão assim que a
+    sessão estabelecida com o servidor (portas remotas `portas`, None = qualquer)
+    some por mais de `tolerancia` segundos, sem captura de tela. A vigia só
+    arma depois de uma conexão durar `armar_apos` segundos.
+    """
+    if not portas:
+        log_aviso("Vigia de conexão sem portas do servidor: qualquer conexão do cliente conta como sessão do jogo.")
+    return net_watch.ConnectionWatch(pid=pid, process_names=processos, ports=portas, grace=tolerancia,
+                                     arm_after=armar_apos)
+
+def criar_relancador(executavel, argumentos=(), pasta=None, titulo_janela='Ragnarok', tempo_janela=60.0):
+    """
+    Cria o relançador do cliente: inicia `executavel` (na sua pasta, ou em
+    `pasta`) e espera até `tempo_janela` segundos pela janela `titulo_janela`.
+    """
+    config = relaunch.LaunchConfig(executavel, tuple(argumentos), pasta)
+    # O cliente pode ter qualquer nome de executável (servidores privados): ele passa a contar como cliente
+    processos_jogo().add_names(os.path.basename(executavel))
+    return relaunch.ClientLauncher(config, titulo_janela, window_timeout=tempo_janela,
+                                   processes=processos_jogo(), sleep=esperar)
+
+def relancar_cliente(relancador, senha, pin, **login_kwargs):
+    """
+    Inicia o cliente de novo e faz o login a partir da tela de confirmação.
+    Retorna True se o login terminou com sucesso.
+    """
+    log_info("🚀 Relançando o cliente: %s", relancador.config.executable)
+    try:
+        iniciado = relancador.start()
+    except OSError as e:
+        log_error("Não foi possível iniciar o cliente '%s': %s", relancador.config.executable, e)
+        return False
+    if iniciado is None:
+        log_error("A janela '%s' não apareceu em %.0fs.", relancador.window_title, relancador.window_timeout)
+        return False
+    log_evento('relancamento', f"Janela do cliente pronta em {iniciado.seconds:.1f}s (PID {iniciado.pid}).",
+               pid=iniciado.pid, duracao_s=round(iniciado.seconds, 3))
+    try:
+        iniciado.window.activate()
+    except Exception as e:
+        log_aviso("Não foi possível ativar a janela do cliente: %s", e)
+    login_kwargs.setdefault('pasta_imagens_pin', '')
+    return iniciar_processo_login_completo(senha=senha, pin=pin, estado_inicial=CONFIRMAR, **login_kwargs)
+
+def criar_vigia_travamento(congelado_s=30.0, tela_s=10.0, localizador=None):
+    """
+    Cria a vigia de travamento: amostra o centro da janela do jogo e o uso de
+    CPU do cliente, e acusa o cliente congelado há `congelado_s` segundos ou
+    com tela preta/branca há `tela_s` segundos. Sem a janela do jogo nada é
+    amostrado (o cliente é considerado vivo).
+    """
+    def regiao():
+        return liveness.central_region((localizador or _localizador).window_region())
+
+    return liveness.LivenessMonitor(regiao, pid_provider=lambda: processos_jogo().find(),
+                                    freeze_seconds=congelado_s, blank_seconds=tela_s)
+
+def focar_janela_jogo(localizador=None):
+    """Traz a janela do jogo para a frente (sem cliques); retorna True se conseguiu"""
+    titulo = (localizador or _localizador).window_title
+    try:
+        janelas = pyautogui.getWindowsWithTitle(titulo) if titulo else []
+        if not janelas:
+            log_aviso("Janela '%s' não encontrada para focar.", titulo)
+            return False
+        janelas[0].activate()
+        return True
     except Exception as e:
-        log_error(f"Erro inesperado ao verificar tela de desconexão: {type(e).__name__} - {e}")
+        log_aviso("Não foi possível focar a janela '%s': %s", titulo, e)
         return False
 
+# Tempo máximo (segundos) esperando a tela de cada estado do login
+TIMEOUTS_LOGIN = {
+    CONFIRMAR: 40,
+    SENHA: 15,
+    SERVIDOR: 10,
+    PIN: 20,
+    SELECAO_PERSONAGEM: 20,
+}
+
+@_salvar_historico_em_falha('login')
 def iniciar_processo_login_completo(senha, pin, pasta_imagens_pin,
                                    image_confirm='confirmar.png',
                                    image_senha_screen='senha.png',
@@ -664,66 +1013,68 @@ def iniciar_processo_login_completo(senha, pin, pasta_imagens_pin,
                                    image_ragnarok_focus='ragnarok.png', # Imagem para foco geral/reset UI
                                    image_jogar='jogar.png',            # Imagem do botão "Jogar" ou similar
                                    confianca_geral=0.8,
-                                   confianca_foco=0.8):              # Confiança para a imagem de foco
+                                   confianca_foco=0.8,               # Confiança para a imagem de foco
+                                   timeouts=None,                    # Sobrescreve TIMEOUTS_LOGIN por estado
+                                   estado_inicial=DESCONECTADO):     # CONFIRMAR logo após relançar o cliente
+    """
+    Executa o login como uma máquina de estados:
+    desconectado -> confirmar -> senha -> servidor -> PIN -> seleção de personagem -> em jogo.
+    Cada transição acontece assim que a tela do estado é detectada (sem esperas fixas).
+    """
     log_info(">>> Iniciando PROCESSO DE LOGIN COMPLETO <<<")
+    limites = dict(TIMEOUTS_LOGIN, **(timeouts or {}))
 
-    # PASSO 1: Confirmar (inicial) - Geralmente após abrir o patcher/jogo.
-    # A função procurar_e_interagir_imagem já não faz mais o refoco interno com ragnarok.png.
-    # O refoco inicial é feito em main.py após a desconexão.
-    log_info("Passo 1: Confirmar (após 60 segundos de espera)")
-    time.sleep(10)
-    if not procurar_e_interagir_imagem(image_path=image_confirm, 
-                                     confidence=confianca_geral, 
-                                     attempts=10, 
-                                     action='press_enter'):
-        log_error("Falha no Passo 1 (confirmar inicial). Login abortado.")
-        return False
-    time.sleep(2) # Pausa para a próxima tela carregar
-
-    # PASSO 2: Tela de Senha e Preenchimento
-    log_info("Passo 2: Tela de Senha e Preenchimento")
-    if not procurar_e_interagir_imagem(image_path=image_senha_screen, 
-                                     confidence=confianca_geral, 
-                                     attempts=5, 
-                                     action='none'): # Apenas localizar
-        log_error(f"Tela de senha ('{image_senha_screen}') não encontrada. Login abortado.")
-        return False
-    
-    if not preencher_e_logar(senha): # preencher_e_logar usa 'press' e 'enviar_enter'
-        log_error("Falha ao preencher/submeter senha. Login abortado.")
-        return False
-    time.sleep(3) # Pausa para processar login/servidor
-
-    # PASSO 2.5: Enter para confirmar o servidor (após digitar a senha)
-    log_info("Passo 2.5: Enter para confirmar o servidor (após senha)")
-    enviar_enter()
-    time.sleep(3) # Pausa para carregar tela de PIN
-
-    # PASSO 2.8: Aguardar avatar_pin.png aparecer antes de digitar o PIN
-    log_info("Passo 2.8: Aguardando avatar_pin.png aparecer...")
-    if not procurar_e_interagir_imagem(image_path='avatar_pin.png', 
-                                     confidence=confianca_geral, 
-                                     attempts=10, 
-                                     delay_between_attempts=2,
-                                     action='none'): # Apenas detectar, não clicar
-        log_error("Avatar PIN não detectado. Prosseguindo com digitação do PIN mesmo assim...")
-    else:
-        log_info("Avatar PIN detectado! Aguardando 2 segundos antes de iniciar digitação...")
-        time.sleep(2) # Aguarda 2 segundos após detectar avatar_pin.png
+    def visivel(imagem):
+        return lambda: _localizar(imagem, confianca_geral)
 
-    # PASSO 3: Digitação do PIN
-    log_info("Passo 3: Digitação do PIN")
-    if not digitar_pin_numerico(pin, pasta_imagens_pin, confianca_imagem=confianca_geral):
-        log_error("Falha ao digitar o PIN. Login abortado.")
+    def confirmar(_):
+        enviar_enter()
+        return True
+
+    def preencher_senha(_):
+        # preencher_e_logar usa 'press' e 'enviar_enter'
+        return preencher_e_logar(senha)
+
+    def confirmar_servidor(_):
+        # A tela de senha some antes da lista de servidores aceitar entrada: o Enter
+        # só vai depois de a janela parar de mudar (fim da transição)
+        if not aguardar_tela_estavel():
+            log_aviso("Tela de servidor ainda em transição após a espera; enviando Enter mesmo assim.")
+        enviar_enter()
+        return True
+
+    def digitar_pin(_):
+        # O PIN é digitado e confirmado aqui; o botão 'Jogar' é o próximo estado
+        return digitar_pin_numerico(pin, pasta_imagens_pin, confianca_imagem=confianca_geral, clicar_jogar=False)
+
+    def jogar(coords_jogar):
+        if not coords_jogar:
+            log_aviso("PIN foi inserido e confirmado, mas não foi possível clicar em 'Jogar'")
+            return True  # Considera sucesso parcial
+        return clicar_botao_jogar(image_jogar, confianca_geral, coords_jogar=coords_jogar)
+
+    passos = [
+        LoginStep(DESCONECTADO, None, None, 0, CONFIRMAR),
+        LoginStep(CONFIRMAR, visivel(image_confirm), confirmar, limites[CONFIRMAR], SENHA),
+        LoginStep(SENHA, visivel(image_senha_screen), preencher_senha, limites[SENHA], SERVIDOR),
+        # A tela de servidor não tem imagem própria: ela aparece quando a tela de senha some
+        LoginStep(SERVIDOR, lambda: not _localizar(image_senha_screen, confianca_geral),
+                  confirmar_servidor, limites[SERVIDOR], PIN, optional=True),
+        LoginStep(PIN, visivel('avatar_pin.png'), digitar_pin, limites[PIN], SELECAO_PERSONAGEM, optional=True),
+        LoginStep(SELECAO_PERSONAGEM, visivel(image_jogar), jogar, limites[SELECAO_PERSONAGEM], EM_JOGO,
+                  optional=True),
+    ]
+
+    maquina = LoginStateMachine(passos, initial=estado_inicial, final=EM_JOGO, log=log_info, sleep=esperar)
+    inicio = time.monotonic()
+    try:
+        sucesso = maquina.run()
+    finally:
+        _registrar_passos_login(maquina.history)
+    if not sucesso:
+        log_error("Login abortado no estado '%s' após %.1fs.", maquina.state, time.monotonic() - inicio)
         return False
-    
-    # A função digitar_pin_numerico agora faz TUDO:
-    # - Digita o PIN
-    # - Clica em Confirmar  
-    # - Clica em Jogar
-    # - Retorna para o main.py continuar o monitoramento
-    
-    log_info(">>> PROCESSO DE LOGIN COMPLETO CONCLUÍDO COM SUCESSO! <<<")
-    log_info("A função digitar_pin_numerico completou PIN + Confirmar + Jogar")
+
+    log_info(">>> PROCESSO DE LOGIN COMPLETO CONCLUÍDO COM SUCESSO em %.1fs! <<<", time.monotonic() - inicio)
     log_info("Retornando para o main.py continuar o monitoramento de desconexão")
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,94 @@
+"""
+Índice persistente de posições (hotspots) onde cada template foi encontrado.
+
+Diálogos como 'desconectado.png' ou 'confirmar.png' aparecem quase sempre no
+mesmo ponto da janela do jogo. O índice guarda a última posição de cada
+template, relativa à janela e separada por resolução, para que as próximas
+buscas comecem por uma janela pequena em volta desse ponto e só aumentem a
+área aos poucos quando não encontrarem nada.
+"""
+import json
+import os
+import threading
+
+HOTSPOTS_FILE = 'hotspots.json'
+
+# Margem (em pixels) adicionada em volta do último acerto em cada etapa da busca
+DEFAULT_WIDEN_STEPS = (8, 48, 160)
+
+
+class HotspotIndex:
+    """Posições por template e resolução, salvas em JSON a cada mudança relevante"""
+
+    def __init__(self, path=HOTSPOTS_FILE, widen_steps=DEFAULT_WIDEN_STEPS, min_shift=4):
+        self.path = path
+        self.widen_steps = widen_steps
+        self.min_shift = min_shift
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Arquivo corrompido não pode impedir o monitoramento: recomeça vazio
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _key(template, resolution):
+        name = os.path.basename(template)
+        return f"{name}@{resolution[0]}x{resolution[1]}"
+
+    def get(self, template, resolution):
+        """Entrada {'x', 'y', 'w', 'h'} (centro relativo à janela) ou None"""
+        return self._entries.get(self._key(template, resolution))
+
+    def record(self, template, resolution, match, origin=(0, 0)):
+        """Registra um acerto; `origin` é o canto da janela do jogo na tela"""
+        entry = {'x': match.x - origin[0], 'y': match.y - origin[1],
+                 'w': match.width, 'h': match.height}
+        key = self._key(template, resolution)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous and abs(previous['x'] - entry['x']) < self.min_shift \
+                    and abs(previous['y'] - entry['y']) < self.min_shift:
+                return
+            self._entries[key] = entry
+            self._save()
+
+    def forget(self, template=None):
+        with self._lock:
+            if template is None:
+                self._entries.clear()
+            else:
+                prefix = f"{os.path.basename(template)}@"
+                for key in [k for k in self._entries if k.startswith(prefix)]:
+                    del self._entries[key]
+            self._save()
+
+    def regions(self, template, resolution, origin=(0, 0)):
+        """Regiões de busca em volta do último acerto, da menor para a maior"""
+        entry = self.get(template, resolution)
+        if not entry:
+            return []
+        center_x, center_y = entry['x'] + origin[0], entry['y'] + origin[1]
+        regions = []
+        for margin in self.widen_steps:
+            half_w = entry['w'] // 2 + margin
+            half_h = entry['h'] // 2 + margin
+            regions.append((center_x - half_w, center_y - half_h, 2 * half_w, 2 * half_h))
+        return regions
@@ -0,0 +1,335 @@
+"""
+Entrada (teclado e mouse) enviada em sequências de ações.
+
+Quem automatiza descreve a sequência inteira, por exemplo
+`[Key('tab'), Text(senha), Key('enter')]` ou `[Click(x, y), Move(x + 300, y)]`,
+e send() a transforma em eventos de baixo nível (tecla pressionada/solta,
+botão pressionado/solto, movimento) entregues ao backend um atrás do outro.
+Entre dois eventos só existe o menor intervalo seguro do backend (tempo de
+tecla pressionada, intervalo entre teclas, acomodação do cursor), sem as
+pausas padrão do pyautogui nem esperas fixas por caractere; o intervalo vale
+também entre sequências enviadas em chamadas diferentes.
+
+Se a espera entre dois eventos for interrompida (ex: OperacaoCancelada ao
+parar/reiniciar o bot), as teclas e os botões que ficaram pressionados são
+soltos, do último para o primeiro, antes de a exceção seguir adiante.
+
+Backends: 'interception' (driver, preferido pelo jogo), 'pyautogui' e
+RecordingBackend, que só registra os eventos (e opcionalmente os repassa a
+outro objeto, ex: o cenário do harness de replay).
+"""
+import threading
+import time
+from collections import namedtuple
+
+# Ações de uma sequência
+Key = namedtuple('Key', ['key'])                                   # uma tecla (pressiona e solta)
+Text = namedtuple('Text', ['text'])                                # um texto, caractere por caractere
+Move = namedtuple('Move', ['x', 'y'])                              # move o cursor
+Click = namedtuple('Click', ['x', 'y', 'button'], defaults=('left',))  # move e clica
+Pause = namedtuple('Pause', ['seconds'])                           # pausa explícita (ex: troca de campo)
+
+# Caracteres que pedem shift no layout US, e a tecla de base de cada símbolo
+_SHIFT_SYMBOLS = dict(zip('!@#$%^&*()_+{}|:"<>?~', '1234567890-=[]\\;\',./`'))
+
+
+class InputBackend:
+    """
+    Backend de entrada: eventos de baixo nível e os intervalos mínimos entre eles.
+
+    - `key_hold`: segundos entre pressionar e soltar uma tecla/botão (o jogo
+      lê a entrada uma vez por frame, então precisa ver o estado pressionado);
+    - `key_gap`: segundos entre soltar uma tecla e pressionar a próxima;
+    - `move_settle`: segundos entre mover o cursor e clicar.
+    `shift_wrap`: se True, caracteres maiúsculos/símbolos são enviados como
+    shift + tecla de base (backends que não fazem isso sozinhos).
+    """
+
+    name = 'base'
+    key_hold = 0.0
+    key_gap = 0.0
+    move_settle = 0.0
+    shift_wrap = False
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+    def mouse_down(self, button):
+        raise NotImplementedError
+
+    def mouse_up(self, button):
+        raise NotImplementedError
+
+    def move_to(self, x, y):
+        raise NotImplementedError
+
+
+class InterceptionBackend(InputBackend):
+    """Eventos pelo driver interception (o interception.auto_capture_devices já deve ter rodado)"""
+
+    name = 'interception'
+    key_hold = 0.02
+    key_gap = 0.02
+    move_settle = 0.02
+    shift_wrap = True
+
+    def __init__(self):
+        import interception
+        self._lib = interception
+
+    def key_down(self, key):
+        self._lib.key_down(key)
+
+    def key_up(self, key):
+        self._lib.key_up(key)
+
+    def mouse_down(self, button):
+        self._lib.mouse_down(button)
+
+    def mouse_up(self, button):
+        self._lib.mouse_up(button)
+
+    def move_to(self, x, y):
+        self._lib.move_to(x, y)
+
+
+class PyAutoGuiBackend(InputBackend):
+    """Eventos pelo pyautogui, sem a pausa automática (`PAUSE`) depois de cada chamada"""
+
+    name = 'pyautogui'
+    key_hold = 0.02
+    key_gap = 0.02
+    move_settle = 0.02
+
+    def __init__(self):
+        import pyautogui
+        self._lib = pyautogui
+
+    def key_down(self, key):
+        self._lib.keyDown(key, _pause=False)
+
+    def key_up(self, key):
+        self._lib.keyUp(key, _pause=False)
+
+    def mouse_down(self, button):
+        self._lib.mouseDown(button=button, _pause=False)
+
+    def mouse_up(self, button):
+        self._lib.mouseUp(button=button, _pause=False)
+
+    def move_to(self, x, y):
+        self._lib.moveTo(x, y, _pause=False)
+
+
+# Evento registrado: instante, tipo ('key_down', 'key_up', 'mouse_down', 'mouse_up', 'move') e argumento
+Event = namedtuple('Event', ['time', 'kind', 'arg'])
+
+
+class RecordingBackend(InputBackend):
+    """
+    Backend falso: registra os eventos em `events`, sem intervalos entre eles.
+
+    Com `target`, cada tecla solta vira `target.press(tecla)` e cada botão
+    solto vira `target.click(x, y)` na posição atual do cursor.
+    """
+
+    name = 'gravacao'
+
+    def __init__(self, target=None, clock=time.monotonic):
+        self.target = target
+        self.clock = clock
+        self.events = []
+        self.position = (0, 0)
+
+    def _record(self, kind, arg):
+        self.events.append(Event(self.clock(), kind, arg))
+
+    def key_down(self, key):
+        self._record('key_down', key)
+
+    def key_up(self, key):
+        self._record('key_up', key)
+        if self.target is not None:
+            self.target.press(key)
+
+    def mouse_down(self, button):
+        self._record('mouse_down', button)
+
+    def mouse_up(self, button):
+        self._record('mouse_up', button)
+        if self.target is not None:
+            self.target.click(*self.position)
+
+    def move_to(self, x, y):
+        self.position = (x, y)
+        self._record('move', (x, y))
+
+    def held(self):
+        """Teclas e botões pressionados e ainda não soltos: [('key', tecla) ou ('mouse', botão)]"""
+        pressed = []
+        for event in self.events:
+            kind, _, state = event.kind.partition('_')
+            if state == 'down':
+                pressed.append((kind, event.arg))
+            elif state == 'up' and (kind, event.arg) in pressed:
+                pressed.remove((kind, event.arg))
+        return pressed
+
+    def keys(self):
+        """Teclas completas (soltas), em ordem"""
+        return [e.arg for e in self.events if e.kind == 'key_up']
+
+    def clicks(self):
+        """Posições (x, y) dos cliques, em ordem"""
+        position, result = (0, 0), []
+        for event in self.events:
+            if event.kind == 'move':
+                position = event.arg
+            elif event.kind == 'mouse_up':
+                result.append(position)
+        return result
+
+    def clear(self):
+        self.events.clear()
+
+
+def create_backend(name='auto'):
+    """Cria o backend pelo nome: 'auto' (interception se instalado), 'interception' ou 'pyautogui'"""
+    if name == 'auto':
+        try:
+            return InterceptionBackend()
+        except ImportError:
+            return PyAutoGuiBackend()
+    if name == 'interception':
+        return InterceptionBackend()
+    if name == 'pyautogui':
+        return PyAutoGuiBackend()
+    raise ValueError(f"Backend de entrada desconhecido: {name}")
+
+
+def _key_strokes(backend, key):
+    """Eventos de uma tecla: (função, argumento, intervalo mínimo antes do próximo evento)"""
+    base = key
+    shifted = False
+    if backend.shift_wrap and len(key) == 1:
+        if key.isupper():
+            base, shifted = key.lower(), True
+        elif key in _SHIFT_SYMBOLS:
+            base, shifted = _SHIFT_SYMBOLS[key], True
+    if shifted:
+        yield backend.key_down, 'shift', backend.key_gap
+    yield backend.key_down, base, backend.key_hold
+    yield backend.key_up, base, backend.key_gap
+    if shifted:
+        yield backend.key_up, 'shift', backend.key_gap
+
+
+def expand(backend, actions):
+    """
+    Converte as ações em eventos do backend: itens (função, argumentos, intervalo),
+    onde o intervalo é o mínimo antes do evento seguinte (função None = só pausa).
+    """
+    for action in actions:
+        if isinstance(action, (Key, Text)):
+            for key in ([action.key] if isinstance(action, Key) else action.text):
+                for fn, arg, delay in _key_strokes(backend, key):
+                    yield fn, (arg,), delay
+        elif isinstance(action, Move):
+            yield backend.move_to, (action.x, action.y), backend.move_settle
+        elif isinstance(action, Click):
+            yield backend.move_to, (action.x, action.y), backend.move_settle
+            yield backend.mouse_down, (action.button,), backend.key_hold
+            yield backend.mouse_up, (action.button,), backend.key_gap
+        elif isinstance(action, Pause):
+            yield None, (), action.seconds
+        else:
+            raise TypeError(f"Ação de entrada desconhecida: {action!r}")
+
+
+class InputSender:
+    """
+    Envia sequências de ações por um backend, respeitando os intervalos mínimos.
+
+    Uma trava garante que duas sequências (de threads diferentes) nunca se
+    misturam; o intervalo que sobra depois do último evento é guardado para
+    valer também entre chamadas consecutivas. Nenhuma tecla ou botão fica
+    pressionado se o envio for interrompido no meio.
+    """
+
+    def __init__(self, backend=None, sleep=time.sleep, clock=time.monotonic):
+        self.backend = backend
+        self.sleep = sleep
+        self.clock = clock
+        self.events = 0
+        self._lock = threading.Lock()
+        self._next_at = 0.0  # instante mínimo do próximo evento
+
+    def _backend(self):
+        if self.backend is None:
+            self.backend = create_backend()
+        return self.backend
+
+    def reset(self):
+        self._next_at = 0.0
+
+    def send(self, actions, sleep=None):
+        """Envia as ações em ordem; retorna os segundos gastos (incluindo os intervalos)"""
+        sleep = sleep or self.sleep
+        backend = self._backend()
+        releases = {backend.key_down: backend.key_up, backend.mouse_down: backend.mouse_up}
+        with self._lock:
+            started = self.clock()
+            pending = self._next_at - started  # o que falta do intervalo da sequência anterior
+            held = []  # (função que solta, argumentos) de cada tecla/botão pressionado
+            try:
+                for fn, args, delay in expand(backend, actions):
+                    if fn is None:
+                        pending = max(pending, 0.0) + delay
+                        continue
+                    if pending > 0:
+                        sleep(pending)
+                    fn(*args)
+                    self.events += 1
+                    if fn in releases:
+                        held.append((releases[fn], args))
+                    elif (fn, args) in held:
+                        held.remove((fn, args))
+                    pending = delay
+            finally:
+                self._release(held)
+                self._next_at = self.clock() + max(pending, 0.0)
+            return self.clock() - started
+
+    def _release(self, held):
+        """Solta o que ficou pressionado por um envio interrompido, do último para o primeiro"""
+        for fn, args in reversed(held):
+            try:
+                fn(*args)
+                self.events += 1
+            except Exception:
+                pass  # solta o restante mesmo que uma tecla falhe
+
+
+_sender = InputSender()
+
+
+def configure(backend=None, sleep=None):
+    """Troca o backend de entrada (nome ou instância) e/ou a função de espera; retorna o backend"""
+    if backend is not None:
+        _sender.backend = create_backend(backend) if isinstance(backend, str) else backend
+    if sleep is not None:
+        _sender.sleep = sleep
+    _sender.reset()
+    return _sender._backend()
+
+
+def sender():
+    return _sender
+
+
+def send(actions, sleep=None):
+    """Envia uma sequência de ações pelo backend configurado"""
+    return _sender.send(actions, sleep)
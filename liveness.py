@@ -0,0 +1,226 @@
+"""
+Detecção de cliente travado (congelado, tela preta ou branca).
+
+Um cliente travado nunca mostra o diálogo de desconexão. O LivenessMonitor
+amostra uma região central da janela, reduzida a uma miniatura em tons de
+cinza (matcher.region_signature), e guarda por amostra a diferença média para
+a miniatura anterior, o brilho, o desvio padrão e o uso de CPU do processo do
+cliente em buffers numpy de tamanho fixo (anel). Cada amostra custa uma
+captura pequena, um resize e algumas operações em 32x32 pixels, então dá para
+amostrar todos os clientes a cada segundo.
+
+- congelado: nenhuma diferença acima de `change_tolerance` durante
+  `freeze_seconds`, com o processo parado (CPU ~0, deadlock) ou preso em um
+  núcleo (laço infinito). Sem PID conhecido, só a imagem decide, e esse
+  congelamento não é confirmado (`confirmed`): a escalada para em devolver o
+  foco, sem reiniciar (a tela de login ou um personagem AFK na cidade também
+  ficam parados). Uma cena parada com CPU normal não é travamento;
+- tela preta/branca: miniatura quase uniforme, muito escura ou muito clara,
+  durante `blank_seconds`.
+
+A Escalation transforma o estado em ações: primeiro devolver o foco à
+janela, depois reiniciar o cliente, com um intervalo entre elas para o
+cliente se recuperar.
+"""
+import time
+
+import numpy as np
+import psutil
+
+from capture import grab as grab_region
+from matcher import region_signature
+
+# Estados do cliente
+VIVO = 'vivo'
+CONGELADO = 'congelado'
+TELA_PRETA = 'tela_preta'
+TELA_BRANCA = 'tela_branca'
+
+# Ações da escalada
+REFOCAR = 'refocar'
+REINICIAR = 'reiniciar'
+
+
+def central_region(window, fraction=0.5):
+    """Retângulo central com `fraction` da largura e da altura da janela"""
+    if window is None:
+        return None
+    left, top, width, height = window
+    w, h = max(1, int(width * fraction)), max(1, int(height * fraction))
+    return (left + (width - w) // 2, top + (height - h) // 2, w, h)
+
+
+class LivenessMonitor:
+    """
+    Estatísticas móveis de uma região da janela do jogo e do processo do cliente.
+
+    `history` amostras ficam guardadas; com uma amostra por segundo, o buffer
+    precisa cobrir `freeze_seconds` (o padrão cobre dois minutos).
+    sample() retorna o estado atual (VIVO, CONGELADO, TELA_PRETA ou TELA_BRANCA);
+    `confirmed` é False quando o congelamento veio só da imagem (sem CPU do processo).
+    """
+
+    def __init__(self, region_provider, pid_provider=None, size=32, history=128,
+                 freeze_seconds=30.0, change_tolerance=1.0, blank_seconds=10.0,
+                 dark_level=12, bright_level=243, flat_std=4.0, cpu_idle=0.5, cpu_busy=90.0,
+                 grab=grab_region, clock=time.monotonic):
+        self.region_provider = region_provider
+        self.pid_provider = pid_provider or (lambda: None)
+        self.size = size
+        self.freeze_seconds = freeze_seconds
+        self.change_tolerance = change_tolerance
+        self.blank_seconds = blank_seconds
+        self.dark_level = dark_level
+        self.bright_level = bright_level
+        self.flat_std = flat_std
+        self.cpu_idle = cpu_idle
+        self.cpu_busy = cpu_busy  # percentual de um núcleo
+        self.grab = grab
+        self.clock = clock
+        self.times = np.full(history, -np.inf)
+        self.diffs = np.zeros(history, dtype=np.float32)
+        self.means = np.zeros(history, dtype=np.float32)
+        self.stds = np.zeros(history, dtype=np.float32)
+        self.cpu = np.full(history, np.nan, dtype=np.float32)
+        self._delta = np.empty((size, size), dtype=np.int16)
+        self.samples = 0
+        self.state = VIVO
+        self.confirmed = True
+        self._proc = None
+        self.reset()
+
+    def reset(self):
+        """Esquece as amostras (ex: depois de refocar ou reiniciar o cliente)"""
+        self.times.fill(-np.inf)
+        self.cpu.fill(np.nan)
+        self._previous = None
+        self._pos = 0
+        self.state = VIVO
+        self.confirmed = True
+
+    def _cpu_percent(self):
+        pid = self.pid_provider()
+        if pid is None:
+            self._proc = None
+            return np.nan
+        try:
+            if self._proc is None or self._proc.pid != pid:
+                self._proc = psutil.Process(pid)
+                self._proc.cpu_percent(None)  # primeira leitura só inicia a contagem
+                return np.nan
+            # Percentual de um núcleo desde a amostra anterior (sem bloquear)
+            return self._proc.cpu_percent(None)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            self._proc = None
+            return np.nan
+
+    def sample(self, image=None):
+        """Registra uma amostra (capturando a região, ou usando `image` já capturada)"""
+        now = self.clock()
+        if image is None:
+            region = self.region_provider()
+            if region is None:
+                # Sem janela do jogo não há o que amostrar (e a área de trabalho parada não é travamento)
+                self.reset()
+                return self.state
+            image, _ = self.grab(region)
+        thumb = region_signature(image, self.size)
+        if self._previous is None:
+            diff = np.inf  # primeira amostra conta como mudança
+        else:
+            np.subtract(thumb, self._previous, out=self._delta)
+            np.abs(self._delta, out=self._delta)
+            diff = self._delta.mean()
+        self._previous = thumb
+
+        i = self._pos
+        self.times[i] = now
+        self.diffs[i] = diff
+        self.means[i] = thumb.mean()
+        self.stds[i] = thumb.std()
+        self.cpu[i] = self._cpu_percent()
+        self._pos = (i + 1) % len(self.times)
+        self.samples += 1
+        self.state = self._evaluate(now)
+        return self.state
+
+    def _window(self, now, seconds):
+        """Máscara das amostras dos últimos `seconds`, ou None se o buffer ainda não cobre o período"""
+        valid = self.times[np.isfinite(self.times)]
+        if valid.size == 0 or valid.min() > now - seconds:
+            return None  # ainda não há amostras tão antigas quanto o período (ou elas não cabem)
+        return self.times >= now - seconds
+
+    def _evaluate(self, now):
+        self.confirmed = True
+        blank = self._window(now, self.blank_seconds)
+        if blank is not None and blank.any() and (self.stds[blank] <= self.flat_std).all():
+            if (self.means[blank] <= self.dark_level).all():
+                return TELA_PRETA
+            if (self.means[blank] >= self.bright_level).all():
+                return TELA_BRANCA
+
+        recent = self._window(now, self.freeze_seconds)
+        if recent is None or not recent.any() or self.diffs[recent].max() > self.change_tolerance:
+            return VIVO
+        cpu = self.cpu[recent]
+        cpu = cpu[~np.isnan(cpu)]
+        if cpu.size == 0:
+            self.confirmed = False  # sem PID: só a imagem parada, que pode ser uma tela estática normal
+            return CONGELADO
+        average = float(cpu.mean())
+        if average <= self.cpu_idle or average >= self.cpu_busy:
+            return CONGELADO
+        return VIVO
+
+    def stats(self):
+        """Resumo das amostras guardadas (para logs e diagnóstico)"""
+        valid = np.isfinite(self.times)
+        diffs = self.diffs[valid]
+        diffs = diffs[np.isfinite(diffs)]
+        cpu = self.cpu[valid]
+        cpu = cpu[~np.isnan(cpu)]
+        return {
+            'amostras': int(valid.sum()),
+            'diferenca_media': round(float(diffs.mean()), 3) if diffs.size else None,
+            'diferenca_max': round(float(diffs.max()), 3) if diffs.size else None,
+            'brilho': round(float(self.means[valid].mean()), 1) if valid.any() else None,
+            'cpu_media': round(float(cpu.mean()), 1) if cpu.size else None,
+        }
+
+
+class Escalation:
+    """
+    Escalada de ações enquanto o cliente continua travado.
+
+    next(estado) retorna a próxima ação (REFOCAR, REINICIAR...) ou None: a
+    primeira ação sai assim que o cliente é dado como travado; as seguintes só
+    depois de `cooldown` segundos sem recuperação. A última ação se repete.
+    Um estado VIVO volta a escalada ao começo. Um estado não confirmado
+    (`confirmed=False`, ex: congelamento só pela imagem) só recebe a primeira
+    ação, uma única vez até voltar a VIVO.
+    """
+
+    def __init__(self, steps=(REFOCAR, REINICIAR), cooldown=20.0, clock=time.monotonic):
+        self.steps = tuple(steps)
+        self.cooldown = cooldown
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.level = 0
+        self._next_at = None
+
+    def next(self, state, confirmed=True):
+        if state == VIVO:
+            self.reset()
+            return None
+        if not confirmed and self.level:
+            return None
+        now = self.clock()
+        if self._next_at is not None and now < self._next_at:
+            return None
+        action = self.steps[min(self.level, len(self.steps) - 1)]
+        self.level += 1
+        self._next_at = now + self.cooldown
+        return action
@@ -0,0 +1,109 @@
+"""
+Área de log da GUI alimentada em lotes.
+
+As mensagens chegam de qualquer thread por `post()`, que só guarda a linha já
+formatada em uma fila limitada. Um tick no loop do Tk (a cada `interval_ms`)
+junta até `max_per_tick` mensagens em um único insert no widget e apaga as
+linhas excedentes pelo índice, usando a contagem de linhas mantida aqui em vez
+de ler o texto de volta. Rajadas de log (ex: durante a digitação do PIN) custam
+um insert por tick; se a GUI não der conta, as mensagens mais antigas da fila
+são descartadas e uma linha avisa quantas foram omitidas.
+"""
+import threading
+import time
+from collections import deque
+
+
+class LogView:
+    """
+    Fila de mensagens + atualização periódica de um tk.Text/ScrolledText.
+
+    - `max_lines`: linhas mantidas no widget;
+    - `max_per_tick`: mensagens inseridas por tick (o resto fica para o próximo,
+      agendado com `busy_interval_ms`);
+    - `max_pending`: mensagens aguardando; acima disso as mais antigas são descartadas.
+    """
+
+    def __init__(self, max_lines=1000, max_per_tick=200, max_pending=5000,
+                 interval_ms=100, busy_interval_ms=10):
+        self.max_lines = max_lines
+        self.max_per_tick = max_per_tick
+        self.interval_ms = interval_ms
+        self.busy_interval_ms = busy_interval_ms
+        self.dropped = 0
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._lines = 0
+        self._root = None
+        self._text = None
+        self._job = None
+
+    def post(self, level, message):
+        """Enfileira uma mensagem (pode ser chamado de qualquer thread; não toca no widget)"""
+        line = f"[{time.strftime('%H:%M:%S')}] {message}"
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(line)
+
+    def attach(self, root, text):
+        """Passa a exibir as mensagens em `text` e inicia os ticks no loop de `root`"""
+        self._root = root
+        self._text = text
+        self._lines = int(text.index('end-1c').split('.')[0]) - 1
+        self._schedule(self.interval_ms)
+
+    def detach(self):
+        if self._job is not None and self._root is not None:
+            self._root.after_cancel(self._job)
+        self._job = None
+        self._root = self._text = None
+
+    def _schedule(self, delay_ms):
+        self._job = self._root.after(delay_ms, self._tick)
+
+    def _take(self):
+        with self._lock:
+            count = min(self.max_per_tick, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(count)]
+            dropped, self.dropped = self.dropped, 0
+            remaining = len(self._pending)
+        if dropped:
+            batch.insert(0, f"[{time.strftime('%H:%M:%S')}] ... {dropped} mensagens de log omitidas")
+        return batch, remaining
+
+    def _tick(self):
+        self._job = None
+        if self._text is None:
+            return
+        batch, remaining = self._take()
+        if batch:
+            self._write(batch)
+        self._schedule(self.busy_interval_ms if remaining else self.interval_ms)
+
+    def _write(self, batch):
+        text = self._text
+        # Só acompanha o fim se o usuário não tiver rolado para cima
+        at_bottom = text.yview()[1] >= 0.999
+        chunk = '\n'.join(batch) + '\n'
+        text.config(state='normal')
+        text.insert('end', chunk)
+        self._lines += chunk.count('\n')
+        excess = self._lines - self.max_lines
+        if excess > 0:
+            text.delete('1.0', f'{excess + 1}.0')
+            self._lines -= excess
+        text.config(state='disabled')
+        if at_bottom:
+            text.see('end')
+
+    def clear(self):
+        """Apaga o widget e as mensagens pendentes"""
+        with self._lock:
+            self._pending.clear()
+            self.dropped = 0
+        if self._text is not None:
+            self._text.config(state='normal')
+            self._text.delete('1.0', 'end')
+            self._text.config(state='disabled')
+        self._lines = 0
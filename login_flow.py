@@ -0,0 +1,120 @@
+"""
+Máquina de estados do processo de login.
+
+Cada estado do login (desconectado -> confirmar -> senha -> servidor -> PIN ->
+seleção de personagem -> em jogo) tem uma detecção, uma ação e um tempo
+máximo. A transição acontece assim que a tela do estado é detectada, com
+consultas curtas que vão espaçando aos poucos, em vez de esperas fixas.
+"""
+import time
+from collections import namedtuple
+
+# Estados do login
+DESCONECTADO = 'desconectado'
+CONFIRMAR = 'confirmar'
+SENHA = 'senha'
+SERVIDOR = 'servidor'
+PIN = 'pin'
+SELECAO_PERSONAGEM = 'selecao_personagem'
+EM_JOGO = 'em_jogo'
+
+
+def wait_until(condition, timeout, initial_interval=0.1, max_interval=1.0, backoff=1.5,
+               sleep=time.sleep, clock=time.monotonic):
+    """
+    Consulta `condition` até ela retornar um valor verdadeiro ou o tempo acabar.
+
+    O intervalo entre consultas começa em `initial_interval` e cresce por
+    `backoff` até `max_interval`, então telas rápidas são detectadas quase na
+    hora e telas lentas não ficam consumindo CPU. Retorna o valor da condição
+    ou None no timeout.
+    """
+    deadline = clock() + timeout
+    interval = initial_interval
+    while True:
+        result = condition()
+        if result:
+            return result
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return None
+        sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+
+# Um passo do login:
+# - detect(): retorna algo verdadeiro quando a tela do estado está visível (None = sem detecção)
+# - action(detectado): executa o passo e retorna True/False
+# - timeout: segundos máximos esperando a detecção
+# - next: próximo estado
+# - optional: se True, um timeout na detecção não aborta (a ação roda mesmo assim)
+LoginStep = namedtuple('LoginStep', ['state', 'detect', 'action', 'timeout', 'next', 'optional'],
+                       defaults=(False,))
+
+# Registro de uma transição: estado, segundos esperando a tela, segundos na ação, sucesso
+# e quantas consultas à tela foram feitas até a detecção (ou o timeout)
+StepRecord = namedtuple('StepRecord', ['state', 'wait_time', 'action_time', 'ok', 'attempts'], defaults=(0,))
+
+
+class LoginStateMachine:
+    """Executa os passos do login a partir de `initial` até chegar em `final`"""
+
+    def __init__(self, steps, initial=DESCONECTADO, final=EM_JOGO, log=None,
+                 poll_interval=0.1, max_poll_interval=1.0, sleep=time.sleep, clock=time.monotonic):
+        self.steps = {step.state: step for step in steps}
+        self.initial = initial
+        self.final = final
+        self.log = log or (lambda message: None)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.sleep = sleep
+        self.clock = clock
+        self.state = initial
+        self.history = []
+
+    def _wait(self, step):
+        """Espera a tela do passo; retorna (detectado, consultas feitas)"""
+        if step.detect is None:
+            return True, 0
+        attempts = 0
+
+        def detect():
+            nonlocal attempts
+            attempts += 1
+            return step.detect()
+
+        detected = wait_until(detect, step.timeout, self.poll_interval, self.max_poll_interval,
+                              sleep=self.sleep, clock=self.clock)
+        return detected, attempts
+
+    def run(self):
+        """Executa a máquina; retorna True se chegou ao estado final"""
+        self.state = self.initial
+        self.history = []
+        while self.state != self.final:
+            step = self.steps.get(self.state)
+            if step is None:
+                self.log(f"[LOGIN] Estado '{self.state}' sem passo configurado. Login abortado.")
+                return False
+
+            started = self.clock()
+            detected, attempts = self._wait(step)
+            waited = self.clock() - started
+            if not detected:
+                if not step.optional:
+                    self.log(f"[LOGIN] Timeout de {step.timeout}s no estado '{self.state}'. Login abortado.")
+                    self.history.append(StepRecord(self.state, waited, 0.0, False, attempts))
+                    return False
+                self.log(f"[LOGIN] Estado '{self.state}' não detectado em {step.timeout}s. Prosseguindo mesmo assim...")
+
+            action_started = self.clock()
+            ok = step.action(detected) if step.action else True
+            action_time = self.clock() - action_started
+            self.history.append(StepRecord(self.state, waited, action_time, bool(ok), attempts))
+            if not ok:
+                self.log(f"[LOGIN] Ação do estado '{self.state}' falhou. Login abortado.")
+                return False
+
+            self.log(f"[LOGIN] {self.state} -> {step.next} (espera {waited:.1f}s, ação {action_time:.1f}s)")
+            self.state = step.next
+        return True
@@ -1,17 +1,27 @@
-import pyautogui
-import time
+import asyncio
 import keyboard 
 import os       
 
+from runtime import ReconnectRuntime
 from funcoes import (
-    verificar_desconexao,
-    iniciar_processo_login_completo,
-    clicar_para_focar_jogo, 
+    cancelar_operacoes,
+    configurar_log,
+    configurar_runtime,
+    criar_vigia_conexao,
+    criar_relancador,
+    criar_vigia_travamento,
+    imagens_padrao,
     log_error,
     log_info,
     log_aviso
 )
 
+# --- Logs (console + arquivo, gravados por uma thread em segundo plano) ---
+LOG_LEVEL = 'INFO'                 # 'DEBUG' inclui cada busca de imagem e cada template do teclado do PIN
+LOG_FILE = 'logs/ragnarok.log'     # Arquivo de texto rotativo (None = só console)
+LOG_JSON_FILE = None               # Ex: 'logs/ragnarok.jsonl' para eventos com campos tipados
+configurar_log(LOG_FILE, LOG_JSON_FILE, LOG_LEVEL)
+
 # === INICIALIZAÇÃO DO INTERCEPTION ===
 # Necessário para que os cliques do PIN funcionem corretamente
 try:
@@ -26,6 +36,9 @@ except Exception as e:
     log_error(f"Erro ao inicializar Interception: {e}")
     log_aviso("Continuando com PyAutoGUI como fallback.")
 
+# --- Teclado e mouse ---
+INPUT_BACKEND = 'auto'       # 'auto' (interception se instalado), 'interception' ou 'pyautogui'
+
 IMAGE_DISCONNECT = 'desconectado.png'
 IMAGE_CONFIRM = 'confirmar.png'     
 IMAGE_SENHA = 'senha.png'         
@@ -34,7 +47,25 @@ IMAGE_RAGNAROK_FOCUS = 'ragnarok.png'
 IMAGE_JOGAR = 'jogar.png'
 IMAGE_PIN_FOLDER = '' 
 
-GAME_WINDOW_TITLE = 'Ragnarok'
+GAME_WINDOW_TITLE = 'Ragnarok'  # Restringe capturas e buscas de imagem à janela do jogo (tela inteira como fallback)
+
+# --- Captura de Tela ---
+CAPTURE_BACKEND = 'auto'     # 'auto' (mss se instalado), 'mss' ou 'pyautogui'
+CAPTURE_FRAME_MAX_AGE = 0.25 # Segundos em que um frame da janela do jogo pode ser reaproveitado entre buscas
+MATCH_THREADS = None         # Threads para procurar vários templates em paralelo (None = núcleos da CPU, 1 = serial)
+PYRAMID_LEVELS = 0           # Busca coarse-to-fine: 0 = desligada, 2-3 para telas grandes (veja relatorio_piramide.py)
+
+# --- Screenshots de Depuração (gravados em segundo plano, com cota de disco) ---
+DEBUG_SCREENSHOTS = 'on_failure'  # 'always', 'on_failure' (só falhas) ou 'off'
+DEBUG_SCREENSHOT_FORMAT = 'png'   # 'png', 'jpg' ou 'webp'
+DEBUG_SCREENSHOT_QUOTA_MB = 200   # Tamanho máximo da pasta; os arquivos mais antigos são apagados
+FRAME_HISTORY_SIZE = 40           # Últimos frames analisados mantidos em memória (0 = desligado)
+FRAME_HISTORY_MB = 32             # Memória máxima do histórico; salvo em 'falhas_login' só quando o login/PIN falha
+
+# --- Métricas de Latência (para ajustar os timeouts de cada passo a partir de dados) ---
+METRICS_EVENTS_FILE = 'metricas/eventos.jsonl'  # Um evento JSON por passo/reconexão, rotativo (None = desligado)
+METRICS_PROMETHEUS_FILE = 'metricas/ragnarok.prom'  # Texto do Prometheus regravado periodicamente (None = desligado)
+METRICS_HTTP_PORT = None          # Ex: 9109 para servir http://127.0.0.1:9109/metrics
 
 SENHA_DO_USUARIO = "5555"  
 PIN_DO_USUARIO = "1234"     
@@ -43,128 +74,113 @@ PIN_DO_USUARIO = "1234"
 CONFIANCA_IMAGEM_GERAL = 0.8 # Confiança padrão para a maioria das buscas de imagem
 CONFIANCA_IMAGEM_FOCO = 0.8  # Confiança específica para a imagem de foco (ragnarok.png)
 CONFIANCA_DESCONEXAO = 0.9 # Confiança mais alta para detectar a tela de desconexão
-MONITOR_INTERVAL_SECONDS = 10 # Intervalo entre verificações quando o jogo está conectado
-RETRY_DELAY_LOGIN_FAIL = 20 # Tempo de espera antes de tentar um novo ciclo de login após uma falha completa
-
-# --- Variável Global e Função para Atalho de Teclado (Interrupção/Reset Manual) ---
-_return_to_main_loop_flag = False
+MONITOR_SAMPLE_INTERVAL = 0.5 # Intervalo entre amostras baratas da região de desconexão
+MONITOR_INTERVAL_SECONDS = 10 # Intervalo máximo entre verificações completas (template matching) quando o jogo está conectado
+RETRY_DELAY_LOGIN_FAIL = 20 # Espera base antes de tentar um novo ciclo de login após uma falha completa
+RETRY_DELAY_MAX = 300 # Espera máxima após falhas seguidas (cresce exponencialmente, com jitter)
+
+# --- Vigia da conexão TCP do cliente (detecta a queda antes do diálogo aparecer) ---
+SOCKET_WATCH = True          # False = só a detecção por imagem
+GAME_SERVER_PORTS = (6900, 6121, 5121)  # Portas do login/char/mapa do servidor; None = qualquer conexão (inclui anti-cheat, web...)
+SOCKET_WATCH_GRACE = 3.0     # Segundos sem sessão antes de acusar a queda (troca de char/mapa reconecta)
+SOCKET_WATCH_ARM = 10.0      # Segundos que uma conexão precisa durar para a vigia armar
+
+# --- Relançamento do cliente (quando o processo do jogo fecha ou trava) ---
+GAME_EXECUTABLE = None       # Ex: r'C:\Gravity\Ragnarok\Ragexe.exe'; None = não relança
+GAME_ARGS = ()               # Argumentos do executável (ex: ('1rag1',))
+GAME_WINDOW_TIMEOUT = 60     # Segundos máximos esperando a janela do cliente relançado
+
+# --- Vigia de travamento (cliente congelado ou com tela preta/branca) ---
+LIVENESS_WATCH = True        # False = desligada
+LIVENESS_INTERVAL = 1.0      # Segundos entre amostras do centro da janela e da CPU do cliente
+FREEZE_SECONDS = 30          # Tela parada (com CPU parada ou presa em 100%) por este tempo = congelado
+BLANK_SCREEN_SECONDS = 10    # Tela preta/branca por este tempo = travado
+ESCALATION_COOLDOWN = 20     # Segundos entre refocar a janela e reiniciar o cliente (precisa de GAME_EXECUTABLE)
+
+# --- Runtime e Atalho de Teclado (Interrupção/Reset Manual) ---
+_runtime = None
 
 def set_return_flag_callback():
-    """Callback para o atalho de teclado. Sinaliza para reiniciar o loop principal."""
-    global _return_to_main_loop_flag
-    _return_to_main_loop_flag = True
-    # Usar print diretamente aqui pois as funções de log são de funcoes.py
-    print(f"\n[{time.strftime('%H:%M:%S')}] [ATALHO] Ctrl+N detectado. Reiniciando loop principal na próxima iteração.")
+    """Callback para o atalho de teclado. Reinicia o ciclo de verificação imediatamente."""
+    log_info("[ATALHO] Ctrl+N detectado. Reiniciando ciclo de verificação.")
+    if _runtime is not None:
+        _runtime.request_reset() # Interrompe um login em andamento sem esperar os sleeps
 
 # Registrar o atalho de teclado
 try:
     keyboard.add_hotkey('ctrl+n', set_return_flag_callback)
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Atalho 'Ctrl+N' registrado para reiniciar o loop de monitoramento.")
+    log_info("Atalho 'Ctrl+N' registrado para reiniciar o loop de monitoramento.")
 except Exception as e_hotkey:
-    print(f"[{time.strftime('%H:%M:%S')}] [ERRO] Não foi possível registrar o atalho 'Ctrl+N': {e_hotkey}. "
-          "O programa continuará sem o atalho. Verifique as permissões se necessário.")
+    log_error(f"Não foi possível registrar o atalho 'Ctrl+N': {e_hotkey}. "
+              "O programa continuará sem o atalho. Verifique as permissões se necessário.")
 
 # --- Função Principal de Monitoramento ---
 def monitorar_bot():
     """Função principal que monitora o estado do jogo e orquestra o processo de login."""
-    print("="*60)
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Iniciando monitoramento principal do bot...")
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Pressione Ctrl+N para forçar o reinício do ciclo de verificação.")
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Pressione Ctrl+C no terminal para encerrar o bot.")
-    print("="*60)
-
-    while True:
-        try:
-            global _return_to_main_loop_flag
-            if _return_to_main_loop_flag:
-                _return_to_main_loop_flag = False # Reseta a flag
-                print(f"[{time.strftime('%H:%M:%S')}] [INFO] Reiniciando ciclo principal devido ao atalho Ctrl+N.")
-                time.sleep(1) # Pequena pausa
-                continue # Volta ao início do while True
-
-            # PASSO 1: Verificar se está desconectado
-            # A função verificar_desconexao é simples e não tenta focar a janela
-            if verificar_desconexao(image_path=IMAGE_DISCONNECT, confidence=CONFIANCA_DESCONEXAO):
-                print(f"[{time.strftime('%H:%M:%S')}] [STATUS] Tela de desconexão ('{IMAGE_DISCONNECT}') detectada.")
-                
-                # PASSO 1.1: Tentar focar no jogo clicando em 'ragnarok.png' UMA VEZ após detectar desconexão.
-                # Isso prepara o jogo para o processo de login.
-                print(f"[{time.strftime('%H:%M:%S')}] [INFO] Tentando focar/ativar o jogo clicando em '{IMAGE_RAGNAROK_FOCUS}'...")
-                if not clicar_para_focar_jogo(imagem_alvo_foco=IMAGE_RAGNAROK_FOCUS, 
-                                            confianca_imagem=CONFIANCA_IMAGEM_FOCO):
-                    # Usar a função log_error importada de funcoes.py
-                    log_error(f"Falha crítica ao tentar focar no jogo com '{IMAGE_RAGNAROK_FOCUS}' após desconexão. "
-                              f"Verifique se a imagem está visível. Aguardando {RETRY_DELAY_LOGIN_FAIL}s antes de tentar novamente o ciclo.")
-                    time.sleep(RETRY_DELAY_LOGIN_FAIL)
-                    continue # Tenta o ciclo de verificação de desconexão novamente
-
-                print(f"[{time.strftime('%H:%M:%S')}] [INFO] Foco no jogo realizado (ou tentativa). Iniciando processo de login completo...")
-                
-                # PASSO 2: Se desconectado e o foco inicial foi tentado, iniciar o processo de login completo.
-                login_sucesso = iniciar_processo_login_completo(
-                    senha=SENHA_DO_USUARIO, 
-                    pin=PIN_DO_USUARIO, 
-                    pasta_imagens_pin=IMAGE_PIN_FOLDER,
-                    image_confirm=IMAGE_CONFIRM, 
-                    image_senha_screen=IMAGE_SENHA,
-                    image_name=IMAGE_NAME,
-                    image_ragnarok_focus=IMAGE_RAGNAROK_FOCUS, # Passa para uso interno no login (ex: antes de 'jogar.png')
-                    image_jogar=IMAGE_JOGAR,
-                    confianca_geral=CONFIANCA_IMAGEM_GERAL,
-                    confianca_foco=CONFIANCA_IMAGEM_FOCO
-                )
-
-                if login_sucesso:
-                    print(f"[{time.strftime('%H:%M:%S')}] [STATUS] Login completo bem-sucedido. Retornando ao monitoramento de desconexão.")
-                    time.sleep(MONITOR_INTERVAL_SECONDS)
-                else:
-                    print(f"[{time.strftime('%H:%M:%S')}] [ERRO] Processo de login completo falhou. "
-                          f"Aguardando {RETRY_DELAY_LOGIN_FAIL}s antes de tentar novamente o ciclo.")
-                    time.sleep(RETRY_DELAY_LOGIN_FAIL)
-                continue # Volta ao início do while True para reavaliar o estado
-
-            else:
-                # Se não estiver desconectado, apenas aguarda e monitora.
-                print(f"[{time.strftime('%H:%M:%S')}] [STATUS] Jogo aparentemente conectado. Monitorando desconexão a cada {MONITOR_INTERVAL_SECONDS}s.")
-                time.sleep(MONITOR_INTERVAL_SECONDS) 
-                continue 
-
-        except pyautogui.FailSafeException:
-            print(f"\n[{time.strftime('%H:%M:%S')}] [EMERGÊNCIA] Fail-safe do PyAutoGUI ativado (mouse no canto superior esquerdo). Encerrando o bot.")
-            break 
-        except KeyboardInterrupt:
-            print(f"\n[{time.strftime('%H:%M:%S')}] [INFO] Monitoramento interrompido pelo usuário (Ctrl+C). Encerrando o bot.")
-            break 
-        except Exception as e_main_loop:
-            print(f"[{time.strftime('%H:%M:%S')}] [ERRO FATAL] Erro inesperado no loop principal de monitoramento: {type(e_main_loop).__name__} - {e_main_loop}")
-            print(f"[{time.strftime('%H:%M:%S')}] [INFO] Stack trace do erro:", exc_info=True) # Adiciona stack trace para depuração
-            print(f"[{time.strftime('%H:%M:%S')}] [INFO] Aguardando 30 segundos antes de tentar reiniciar o ciclo...")
-            time.sleep(30) # Uma pausa mais longa para erros inesperados graves
-            continue 
-        finally:
-            # Esta seção finally não é estritamente necessária aqui dentro do loop,
-            # mas o unhook do teclado é bom ao final do programa.
-            pass
-
-    # Código a ser executado quando o loop principal é quebrado (ex: Ctrl+C, FailSafe)
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Loop de monitoramento principal finalizado.")
+    global _runtime
+    log_info("=" * 60)
+    log_info("Iniciando monitoramento principal do bot...")
+    log_info("Pressione Ctrl+N para forçar o reinício do ciclo de verificação.")
+    log_info("Pressione Ctrl+C no terminal para encerrar o bot.")
+    log_info("=" * 60)
+
+    # Monitoramento, login e atalho rodam como tarefas de um loop asyncio; capturas e
+    # template matching rodam em uma thread auxiliar, e todas as esperas são canceláveis
+    _runtime = ReconnectRuntime(
+        senha=SENHA_DO_USUARIO,
+        pin=PIN_DO_USUARIO,
+        image_disconnect=IMAGE_DISCONNECT,
+        confidence=CONFIANCA_DESCONEXAO,
+        image_focus=IMAGE_RAGNAROK_FOCUS,
+        confidence_focus=CONFIANCA_IMAGEM_FOCO,
+        sample_interval=MONITOR_SAMPLE_INTERVAL,
+        max_check_interval=MONITOR_INTERVAL_SECONDS,
+        retry_base=RETRY_DELAY_LOGIN_FAIL,
+        retry_max=RETRY_DELAY_MAX,
+        net_watch=criar_vigia_conexao(GAME_SERVER_PORTS, SOCKET_WATCH_GRACE, SOCKET_WATCH_ARM) if SOCKET_WATCH else None,
+        launcher=criar_relancador(GAME_EXECUTABLE, GAME_ARGS, titulo_janela=GAME_WINDOW_TITLE,
+                                  tempo_janela=GAME_WINDOW_TIMEOUT) if GAME_EXECUTABLE else None,
+        liveness=criar_vigia_travamento(FREEZE_SECONDS, BLANK_SCREEN_SECONDS) if LIVENESS_WATCH else None,
+        liveness_interval=LIVENESS_INTERVAL,
+        escalation_cooldown=ESCALATION_COOLDOWN,
+        login_kwargs=dict(
+            pasta_imagens_pin=IMAGE_PIN_FOLDER,
+            image_confirm=IMAGE_CONFIRM,
+            image_senha_screen=IMAGE_SENHA,
+            image_name=IMAGE_NAME,
+            image_ragnarok_focus=IMAGE_RAGNAROK_FOCUS, # Passa para uso interno no login (ex: antes de 'jogar.png')
+            image_jogar=IMAGE_JOGAR,
+            confianca_geral=CONFIANCA_IMAGEM_GERAL,
+            confianca_foco=CONFIANCA_IMAGEM_FOCO
+        )
+    )
+    try:
+        asyncio.run(_runtime.run())
+    except KeyboardInterrupt:
+        cancelar_operacoes() # Interrompe a thread de automação se estiver no meio de um login
+        log_info("Monitoramento interrompido pelo usuário (Ctrl+C). Encerrando o bot.")
+    finally:
+        _runtime = None
+
+    # Código a ser executado quando o loop principal é encerrado (ex: Ctrl+C, FailSafe)
+    log_info("Loop de monitoramento principal finalizado.")
     try:
         keyboard.unhook_all() # Remove todos os atalhos registrados
-        print(f"[{time.strftime('%H:%M:%S')}] [INFO] Atalhos de teclado desregistrados.")
+        log_info("Atalhos de teclado desregistrados.")
     except Exception as e_unhook_final:
-        print(f"[{time.strftime('%H:%M:%S')}] [AVISO] Erro ao tentar desregistrar atalhos na finalização: {e_unhook_final}")
+        log_aviso(f"Erro ao tentar desregistrar atalhos na finalização: {e_unhook_final}")
 
 # --- Bloco de Execução Principal ---
 if __name__ == "__main__":
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Iniciando script...")
+    log_info("Iniciando script...")
 
     # Validações iniciais críticas
     if SENHA_DO_USUARIO == "Sua Senha" or not SENHA_DO_USUARIO:
-        print(f"[{time.strftime('%H:%M:%S')}] [ERRO FATAL] SENHA_DO_USUARIO não foi configurada. Edite o script e defina sua senha.")
+        log_error("ERRO FATAL: SENHA_DO_USUARIO não foi configurada. Edite o script e defina sua senha.")
         exit()
     if PIN_DO_USUARIO == "Seu Pin" or not (PIN_DO_USUARIO.isdigit() and len(PIN_DO_USUARIO) == 4) :
-        print(f"[{time.strftime('%H:%M:%S')}] [ERRO FATAL] PIN_DO_USUARIO ('{PIN_DO_USUARIO}') é inválido ou não configurado. "
-              "Deve ser uma string de 4 dígitos numéricos.")
+        log_error(f"ERRO FATAL: PIN_DO_USUARIO ('{PIN_DO_USUARIO}') é inválido ou não configurado. "
+                  "Deve ser uma string de 4 dígitos numéricos.")
         exit()
 
     # Verificar se as imagens principais existem (opcional, mas bom para debug inicial)
@@ -176,21 +192,41 @@ if __name__ == "__main__":
         "Botão Jogar": IMAGE_JOGAR,
         "Nome Personagem": IMAGE_NAME
     }
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Verificando existência das imagens críticas...")
+    log_info("Verificando existência das imagens críticas...")
     todas_imagens_ok = True
     for nome_amigavel, caminho_imagem in imagens_criticas.items():
         if not os.path.exists(caminho_imagem):
-            print(f"[{time.strftime('%H:%M:%S')}] [ERRO FATAL] Imagem crítica '{nome_amigavel}' ('{caminho_imagem}') não encontrada na pasta do script.")
+            log_error(f"ERRO FATAL: Imagem crítica '{nome_amigavel}' ('{caminho_imagem}') não encontrada na pasta do script.")
             todas_imagens_ok = False
     if not todas_imagens_ok:
-        print(f"[{time.strftime('%H:%M:%S')}] [ERRO FATAL] Uma ou mais imagens críticas não foram encontradas. O bot não pode iniciar.")
+        log_error("ERRO FATAL: Uma ou mais imagens críticas não foram encontradas. O bot não pode iniciar.")
         exit()
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Todas as imagens críticas verificadas com sucesso.")
+    log_info("Todas as imagens críticas verificadas com sucesso.")
+
+    # Configura entrada, captura, matching, depuração e métricas, e decodifica todas as
+    # imagens uma única vez (ou mapeia o pacote pré-processado)
+    configurar_runtime(
+        janela_jogo=GAME_WINDOW_TITLE,
+        entrada=INPUT_BACKEND,
+        captura=CAPTURE_BACKEND,
+        idade_frame=CAPTURE_FRAME_MAX_AGE,
+        threads_matching=MATCH_THREADS,
+        niveis_piramide=PYRAMID_LEVELS,
+        screenshots=DEBUG_SCREENSHOTS,
+        formato_screenshots=DEBUG_SCREENSHOT_FORMAT,
+        cota_screenshots_mb=DEBUG_SCREENSHOT_QUOTA_MB,
+        quadros_historico=FRAME_HISTORY_SIZE,
+        memoria_historico_mb=FRAME_HISTORY_MB,
+        arquivo_eventos=METRICS_EVENTS_FILE,
+        arquivo_prometheus=METRICS_PROMETHEUS_FILE,
+        porta_metricas=METRICS_HTTP_PORT,
+        imagens=imagens_padrao(IMAGE_PIN_FOLDER)
+    )
     
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Senha configurada (comprimento: {len(SENHA_DO_USUARIO)}).")
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] PIN configurado (comprimento: {len(PIN_DO_USUARIO)}).")
+    log_info(f"Senha configurada (comprimento: {len(SENHA_DO_USUARIO)}).")
+    log_info(f"PIN configurado (comprimento: {len(PIN_DO_USUARIO)}).")
 
     # Inicia o monitoramento principal do bot
     monitorar_bot()
     
-    print(f"[{time.strftime('%H:%M:%S')}] [INFO] Script finalizado.")
\ No newline at end of file
+    log_info("Script finalizado.")
\ No newline at end of file
@@ -2,22 +2,46 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import threading
 import time
 import os
-import logging
-from logging.handlers import RotatingFileHandler
 from PIL import Image, ImageTk
-import queue
 
 # Importa as funções do sistema
+from runtime import ReconnectRuntime
+from log_view import LogView
+import structured_log
 from funcoes import (
-    verificar_desconexao,
-    iniciar_processo_login_completo,
-    clicar_para_focar_jogo,
+    configurar_log,
+    configurar_runtime,
+    criar_vigia_conexao,
+    criar_relancador,
+    criar_vigia_travamento,
     set_gui_logger
 )
 
+GAME_WINDOW_TITLE = 'Ragnarok'
+CAPTURE_BACKEND = 'auto'     # 'auto' (mss se instalado), 'mss' ou 'pyautogui'
+INPUT_BACKEND = 'auto'       # Teclado/mouse: 'auto' (interception se instalado), 'interception' ou 'pyautogui'
+CAPTURE_FRAME_MAX_AGE = 0.25 # Segundos em que um frame da janela do jogo pode ser reaproveitado
+MATCH_THREADS = None         # Threads de template matching (None = núcleos da CPU, 1 = serial)
+PYRAMID_LEVELS = 0           # Busca coarse-to-fine (0 = desligada; veja relatorio_piramide.py)
+DEBUG_SCREENSHOTS = 'on_failure'  # Screenshots de depuração: 'always', 'on_failure' ou 'off'
+MONITOR_SAMPLE_INTERVAL = 0.5 # Intervalo entre amostras baratas da região de desconexão
+MONITOR_INTERVAL_SECONDS = 10 # Intervalo máximo entre verificações completas
+RETRY_DELAY_LOGIN_FAIL = 20  # Espera base após falha de login (cresce exponencialmente, com jitter)
+RETRY_DELAY_MAX = 300
+RUNTIME_STOP_TIMEOUT = 5     # Espera máxima pelo runtime anterior ao iniciar de novo ou fechar a janela
+RUNTIME_POLL_MS = 100        # Intervalo (ms) entre as verificações do fim do runtime, sem bloquear a interface
+SOCKET_WATCH = True          # Detecta a queda pela conexão TCP do cliente, antes do diálogo
+GAME_SERVER_PORTS = (6900, 6121, 5121)  # Portas do login/char/mapa (None = qualquer conexão, inclusive anti-cheat/web)
+GAME_EXECUTABLE = None       # Executável do cliente para relançar após um crash (None = não relança)
+GAME_WINDOW_TIMEOUT = 60     # Segundos máximos esperando a janela do cliente relançado
+LIVENESS_WATCH = True        # Detecta cliente congelado ou com tela preta/branca (refoca, depois reinicia)
+FREEZE_SECONDS = 30          # Tela parada por este tempo (com CPU parada ou em 100%) = congelado
+LOG_MAX_LINES = 1000         # Linhas mantidas na área de logs
+LOG_LEVEL = 'INFO'           # 'DEBUG' inclui cada busca de imagem no arquivo de log
+
+
 class RagnarokReconnectGUI:
     def __init__(self, root):
         self.root = root
@@ -27,8 +51,9 @@ class RagnarokReconnectGUI:
         
         # Variáveis de controle
         self.is_running = False
-        self.monitor_thread = None
-        self.log_queue = queue.Queue()
+        self.runtime = None
+        self._pending_start = None  # after() que aguarda o runtime anterior terminar
+        self.log_view = LogView(max_lines=LOG_MAX_LINES)
         
         # Configurar sistema de logs
         self.setup_logging()
@@ -42,8 +67,11 @@ class RagnarokReconnectGUI:
         # Inicializar Interception
         self.init_interception()
         
-        # Monitorar logs
-        self.check_log_queue()
+        # Configurar captura, matching, depuração, métricas e templates
+        self.setup_runtime()
+        
+        # Exibir os logs em lotes (um insert por tick)
+        self.log_view.attach(self.root, self.log_text)
         
         # Protocolo de fechamento
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -51,34 +79,16 @@ class RagnarokReconnectGUI:
     def setup_logging(self):
         """Configura o sistema de logs com rotação de arquivos"""
         # Criar diretório se não existir
-        log_dir = r"C:\Reconnect"
+        self.log_dir = log_dir = r"C:\Reconnect"
         os.makedirs(log_dir, exist_ok=True)
         
         # Nome do arquivo com timestamp
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         log_file = os.path.join(log_dir, f"log_{timestamp}.txt")
         
-        # Configurar logging com rotação (10MB)
-        self.logger = logging.getLogger("RagnarokReconnect")
-        self.logger.setLevel(logging.INFO)
-        
-        # Remover handlers existentes
-        for handler in self.logger.handlers[:]:
-            self.logger.removeHandler(handler)
-        
-        # Handler rotativo para arquivo
-        file_handler = RotatingFileHandler(
-            log_file, 
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5,
-            encoding='utf-8'
-        )
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
+        # Log estruturado: arquivo rotativo (10MB) gravado por uma thread em segundo plano
+        configurar_log(log_file, nivel=LOG_LEVEL, console=False)
+        self.logger = structured_log.logger("gui")
         
         # Configurar o logger do funcoes.py para usar o mesmo sistema
         set_gui_logger(self.logger)
@@ -235,6 +245,22 @@ class RagnarokReconnectGUI:
         except Exception as e:
             self.log_error(f"❌ Erro ao inicializar Interception: {e}")
 
+    def setup_runtime(self):
+        """Configura os subsistemas do bot (mesma função usada pelo main.py), com os arquivos na pasta de logs"""
+        configurar_runtime(
+            janela_jogo=GAME_WINDOW_TITLE,
+            entrada=INPUT_BACKEND,
+            captura=CAPTURE_BACKEND,
+            idade_frame=CAPTURE_FRAME_MAX_AGE,
+            threads_matching=MATCH_THREADS,
+            niveis_piramide=PYRAMID_LEVELS,
+            screenshots=DEBUG_SCREENSHOTS,
+            pasta_screenshots=os.path.join(self.log_dir, "screenshots"),
+            pasta_historico=os.path.join(self.log_dir, "falhas_login"),
+            arquivo_eventos=os.path.join(self.log_dir, "metricas", "eventos.jsonl"),
+            arquivo_prometheus=os.path.join(self.log_dir, "metricas", "ragnarok.prom")
+        )
+
     def validate_pin(self, event=None):
         """Valida o PIN digitado"""
         pin = self.pin_var.get()
@@ -276,9 +302,48 @@ class RagnarokReconnectGUI:
         self.stop_button.config(state='normal')
         self.status_label.config(text="Sistema Ativo", foreground='green')
         
-        # Iniciar thread de monitoramento
-        self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
-        self.monitor_thread.start()
+        # Garante que um runtime parado anteriormente já terminou, sem bloquear a interface
+        self._start_when_stopped(senha, pin, time.monotonic() + RUNTIME_STOP_TIMEOUT)
+
+    def _start_when_stopped(self, senha, pin, deadline):
+        """Inicia o runtime assim que o anterior terminar (verificado com after(), até `deadline`)"""
+        self._pending_start = None
+        if self.runtime is not None and not self.runtime.join(0):
+            if time.monotonic() < deadline:
+                self._pending_start = self.root.after(RUNTIME_POLL_MS, self._start_when_stopped, senha, pin, deadline)
+                return
+            self.log_warning("⚠️ O runtime anterior ainda não terminou; iniciando um novo mesmo assim.")
+
+        # Iniciar runtime de monitoramento (loop asyncio em thread própria; Parar é imediato)
+        self.runtime = ReconnectRuntime(
+            senha=senha,
+            pin=pin,
+            image_disconnect='desconectado.png',
+            confidence=0.9,
+            image_focus='ragnarok.png',
+            confidence_focus=0.8,
+            sample_interval=MONITOR_SAMPLE_INTERVAL,
+            max_check_interval=MONITOR_INTERVAL_SECONDS,
+            retry_base=RETRY_DELAY_LOGIN_FAIL,
+            retry_max=RETRY_DELAY_MAX,
+            net_watch=criar_vigia_conexao(GAME_SERVER_PORTS) if SOCKET_WATCH else None,
+            launcher=criar_relancador(GAME_EXECUTABLE, titulo_janela=GAME_WINDOW_TITLE,
+                                      tempo_janela=GAME_WINDOW_TIMEOUT) if GAME_EXECUTABLE else None,
+            liveness=criar_vigia_travamento(FREEZE_SECONDS) if LIVENESS_WATCH else None,
+            login_kwargs=dict(
+                pasta_imagens_pin="",
+                image_confirm='confirmar.png',
+                image_senha_screen='senha.png',
+                image_name='jogar.png',
+                image_ragnarok_focus='ragnarok.png',
+                image_jogar='jogar.png',
+                confianca_geral=0.8,
+                confianca_foco=0.8
+            ),
+            log_info=self.log_info,
+            log_error=self.log_error
+        )
+        self.runtime.start_in_thread()
         
         self.log_info("🚀 Sistema iniciado com sucesso!")
         self.log_info(f"👤 Usuário: {'*' * len(senha)}")
@@ -287,6 +352,11 @@ class RagnarokReconnectGUI:
     def stop_system(self):
         """Para o sistema de monitoramento"""
         self.is_running = False
+        if self._pending_start is not None:  # Parar antes do runtime anterior terminar: não inicia mais
+            self.root.after_cancel(self._pending_start)
+            self._pending_start = None
+        if self.runtime is not None:
+            self.runtime.request_stop()  # Não bloqueia a interface; as esperas são canceladas na hora
         self.start_button.config(state='normal')
         self.stop_button.config(state='normal')
         self.status_label.config(text="Sistema Parado", foreground='red')
@@ -297,118 +367,41 @@ class RagnarokReconnectGUI:
         """Alerta que a instalação de drivers ainda não está implementada"""
         messagebox.showinfo("Atenção", "Não implementado ainda")
 
-    def monitor_loop(self):
-        """Loop principal de monitoramento (executa em thread separada)"""
-        self.log_info("🔍 Iniciando monitoramento de desconexão...")
-        
-        while self.is_running:
-            try:
-                # Verificar desconexão
-                if verificar_desconexao(image_path='desconectado.png', confidence=0.9):
-                    self.log_info("🔌 Desconexão detectada! Iniciando processo de reconexão...")
-                    
-                    # Tentar focar no jogo
-                    if not clicar_para_focar_jogo(imagem_alvo_foco='ragnarok.png', confianca_imagem=0.8):
-                        self.log_error("❌ Falha ao focar no jogo. Tentando novamente em 20s...")
-                        time.sleep(20)
-                        continue
-                    
-                    # Executar processo de login
-                    senha = self.senha_var.get()
-                    pin = self.pin_var.get()
-                    
-                    login_sucesso = iniciar_processo_login_completo(
-                        senha=senha,
-                        pin=pin,
-                        pasta_imagens_pin="",
-                        image_confirm='confirmar.png',
-                        image_senha_screen='senha.png',
-                        image_name='jogar.png',
-                        image_ragnarok_focus='ragnarok.png',
-                        image_jogar='jogar.png',
-                        confianca_geral=0.8,
-                        confianca_foco=0.8
-                    )
-                    
-                    if login_sucesso:
-                        self.log_info("✅ Reconexão realizada com sucesso!")
-                    else:
-                        self.log_error("❌ Falha na reconexão. Tentando novamente em 20s...")
-                        time.sleep(20)
-                        continue
-                else:
-                    # Sistema conectado, monitorar normalmente
-                    pass
-                
-                # Aguardar antes da próxima verificação
-                time.sleep(10)
-                
-            except Exception as e:
-                self.log_error(f"❌ Erro no loop de monitoramento: {e}")
-                time.sleep(30)  # Aguarda mais tempo em caso de erro
-        
-        self.log_info("⏹️ Loop de monitoramento finalizado")
-
-    def check_log_queue(self):
-        """Verifica a fila de logs e atualiza a interface"""
-        try:
-            while True:
-                level, message = self.log_queue.get_nowait()
-                self.add_log_to_display(level, message)
-        except queue.Empty:
-            pass
-        
-        # Reagendar verificação
-        self.root.after(100, self.check_log_queue)
-
-    def add_log_to_display(self, level, message):
-        """Adiciona uma mensagem de log à exibição"""
-        timestamp = time.strftime("%H:%M:%S")
-        
-        formatted_message = f"[{timestamp}] {message}\n"
-        
-        self.log_text.config(state='normal')
-        self.log_text.insert(tk.END, formatted_message)
-        
-        # Manter apenas as últimas 1000 linhas
-        lines = self.log_text.get('1.0', tk.END).split('\n')
-        if len(lines) > 1000:
-            self.log_text.delete('1.0', f'{len(lines)-1000}.0')
-        
-        self.log_text.config(state='disabled')
-        self.log_text.see(tk.END)
-
     def clear_logs(self):
         """Limpa a área de logs"""
-        self.log_text.config(state='normal')
-        self.log_text.delete('1.0', tk.END)
-        self.log_text.config(state='disabled')
+        self.log_view.clear()
 
     def log_info(self, message):
         """Log de informação"""
         self.logger.info(message)
-        self.log_queue.put(('INFO', message))
+        self.log_view.post('INFO', message)
 
     def log_warning(self, message):
         """Log de aviso"""
         self.logger.warning(message)
-        self.log_queue.put(('WARNING', message))
+        self.log_view.post('WARNING', message)
 
     def log_error(self, message):
         """Log de erro"""
         self.logger.error(message)
-        self.log_queue.put(('ERROR', message))
+        self.log_view.post('ERROR', message)
 
     def on_closing(self):
         """Chamado quando a janela é fechada"""
         if self.is_running:
             if messagebox.askokcancel("Fechar", "O sistema está em execução. Deseja realmente sair?"):
                 self.stop_system()
-                time.sleep(1)  # Aguarda thread terminar
-                self.root.destroy()
+                self._destroy_when_stopped(time.monotonic() + RUNTIME_STOP_TIMEOUT)
         else:
             self.root.destroy()
 
+    def _destroy_when_stopped(self, deadline):
+        """Fecha a janela quando o runtime terminar (normalmente em milissegundos) ou após `deadline`"""
+        if self.runtime is not None and not self.runtime.join(0) and time.monotonic() < deadline:
+            self.root.after(RUNTIME_POLL_MS, self._destroy_when_stopped, deadline)
+            return
+        self.root.destroy()
+
 def main():
     """Função principal"""
     # Verificar se está sendo executado como script principal
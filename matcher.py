@@ -0,0 +1,471 @@
+"""
+Motor de template matching usado na digitação do PIN e nas buscas de imagem.
+
+Os templates são pré-processados uma única vez (tons de cinza e, opcionalmente,
+reduzidos) e cada captura de tela é convertida uma única vez, de forma que
+vários templates possam ser procurados no mesmo frame sem repetir trabalho.
+As buscas de vários templates rodam em paralelo em um pool de threads
+compartilhado (o OpenCV libera o GIL durante o matchTemplate).
+
+No modo pirâmide (coarse-to-fine), o frame e o template são reduzidos pela
+metade `pyramid_levels` vezes; a busca completa roda só no nível reduzido e,
+em resolução cheia, apenas uma pequena janela em volta de cada candidato é
+verificada. Para templates grandes e telas 4K isso corta a maior parte do custo.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Resultado de uma correspondência: centro (coordenadas da tela) e confiança
+Match = namedtuple('Match', ['x', 'y', 'confidence', 'width', 'height'])
+
+
+def to_gray(image):
+    """Converte uma imagem BGR/BGRA/cinza para tons de cinza (sem cópia se já for cinza)"""
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def to_bgr(image):
+    """Converte uma imagem BGR/BGRA/cinza para BGR (sem cópia se já for BGR)"""
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+
+# Uma busca do lote: template `key` de `matcher` em um frame já preparado por esse matcher
+MatchJob = namedtuple('MatchJob', ['matcher', 'frame', 'key', 'threshold', 'max_candidates', 'origin'],
+                      defaults=(0.7, 1, (0, 0)))
+
+
+def _run_job(job):
+    return job.matcher._candidates(job.frame, job.key, job.threshold, job.max_candidates, job.origin)
+
+
+class MatchPool:
+    """
+    Executa lotes de buscas (frame, template) em paralelo e devolve todos os resultados de uma vez.
+
+    Com `max_workers=1` (ou lotes de uma busca) tudo roda na thread atual,
+    sem custo de agendamento.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='matching')
+            return self._executor
+
+    def map(self, fn, items):
+        """Aplica `fn` a cada item em paralelo; retorna a lista de resultados na mesma ordem"""
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [fn(item) for item in items]
+        return list(self._pool().map(fn, items))
+
+    def match_batch(self, jobs):
+        """Roda os MatchJob e retorna, na mesma ordem, a lista de candidatos (Match) de cada um"""
+        return self.map(_run_job, jobs)
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool():
+    """Pool de matching usado por padrão por todos os TemplateMatcher"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = MatchPool()
+        return _shared_pool
+
+
+def configure_pool(max_workers=None):
+    """Redefine o tamanho do pool compartilhado (None = número de núcleos, 1 = serial)"""
+    global _shared_pool
+    with _shared_lock:
+        old, _shared_pool = _shared_pool, MatchPool(max_workers)
+    if old is not None:
+        old.close()
+    return _shared_pool
+
+
+# Profundidade padrão da pirâmide para matchers criados sem `pyramid_levels` (0 = desligado)
+_default_pyramid_levels = 0
+
+# Menor lado (em pixels) que o template pode ter no nível reduzido; abaixo disso a
+# correlação perde detalhe demais e um nível menos profundo é usado
+MIN_COARSE_TEMPLATE = 12
+
+
+def configure_pyramid(levels=0):
+    """Define a profundidade padrão da pirâmide (0 = busca somente em resolução cheia)"""
+    global _default_pyramid_levels
+    _default_pyramid_levels = max(0, int(levels or 0))
+    return _default_pyramid_levels
+
+
+def build_pyramid(image, levels):
+    """[imagem, metade, um quarto, ...] com até `levels` reduções (cv2.pyrDown)"""
+    pyramid = [image]
+    for _ in range(levels):
+        if min(pyramid[-1].shape[:2]) < 2:
+            break
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+def _peaks(result, threshold, count, tw, th):
+    """Até `count` picos (valor, x, y) acima de `threshold`, zerando a vizinhança de cada um"""
+    peaks = []
+    for _ in range(count):
+        _, max_val, _, (px, py) = cv2.minMaxLoc(result)
+        if max_val < threshold:
+            break
+        peaks.append((float(max_val), px, py))
+        y0, x0 = max(0, py - th // 2), max(0, px - tw // 2)
+        result[y0:py + th // 2 + 1, x0:px + tw // 2 + 1] = -1.0
+    return peaks
+
+
+def _overlap(a, b):
+    """Interseção sobre união de duas correspondências (caixas centradas em x, y)"""
+    ax1, ay1 = a.x - a.width / 2, a.y - a.height / 2
+    bx1, by1 = b.x - b.width / 2, b.y - b.height / 2
+    iw = min(ax1 + a.width, bx1 + b.width) - max(ax1, bx1)
+    ih = min(ay1 + a.height, by1 + b.height) - max(ay1, by1)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(a.width * a.height + b.width * b.height - inter)
+
+
+class TemplateMatcher:
+    """
+    Conjunto de templates pré-processados para busca em um único frame.
+
+    Cada template é convertido para tons de cinza (e redimensionado por `scale`)
+    apenas na construção; com `color` a busca é feita nos três canais BGR (como
+    o pyautogui.locateOnScreen), mais lenta porém mais fiel em templates
+    pequenos ou de pouco contraste. As buscas aceitam um frame BGR ou já convertido e
+    retornam as coordenadas sempre na escala original da tela; `origin` desloca
+    os resultados quando o frame é apenas uma região da tela. Sem `pool`, as
+    buscas de vários templates usam o pool compartilhado; sem `pyramid_levels`,
+    vale a profundidade configurada em `configure_pyramid`. No modo pirâmide os
+    candidatos do nível reduzido entram com `threshold - coarse_margin`.
+    """
+
+    def __init__(self, templates, scale=1.0, method=cv2.TM_CCOEFF_NORMED, pool=None,
+                 pyramid_levels=None, coarse_margin=0.2, color=False):
+        self.scale = scale
+        self.method = method
+        self.color = color
+        self._pool = pool
+        self.pyramid_levels = pyramid_levels
+        self.coarse_margin = coarse_margin
+        self._templates = {}
+        self._template_pyramids = {}
+        for key, image in templates.items():
+            self.add_template(key, image)
+
+    @classmethod
+    def from_folder(cls, folder, keys, scale=1.0):
+        """Carrega `<folder>/<key>.png` para cada chave; arquivos ausentes são ignorados"""
+        templates = {}
+        for key in keys:
+            path = os.path.join(folder, f"{key}.png")
+            image = cv2.imread(path, cv2.IMREAD_GRAYSCALE) if os.path.exists(path) else None
+            if image is not None:
+                templates[key] = image
+        return cls(templates, scale=scale)
+
+    def add_template(self, key, image, pyramid=None):
+        """
+        Adiciona (ou substitui) um template já decodificado. `pyramid` são os
+        níveis reduzidos já calculados (sem o nível 0), aproveitados quando
+        `scale` é 1.0 (e devem estar no mesmo formato, cinza ou BGR, da busca).
+        """
+        template = to_bgr(image) if self.color else to_gray(image)
+        original_h, original_w = template.shape[:2]
+        if self.scale != 1.0:
+            template = cv2.resize(template, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            pyramid = None
+        self._templates[key] = (template, original_w, original_h)
+        if pyramid:
+            self._template_pyramids[key] = [template] + list(pyramid)
+        else:
+            self._template_pyramids.pop(key, None)
+
+    @property
+    def pool(self):
+        return self._pool or shared_pool()
+
+    @property
+    def levels(self):
+        """Profundidade efetiva da pirâmide"""
+        return _default_pyramid_levels if self.pyramid_levels is None else self.pyramid_levels
+
+    def keys(self):
+        return list(self._templates.keys())
+
+    def __contains__(self, key):
+        return key in self._templates
+
+    def __len__(self):
+        return len(self._templates)
+
+    def template_size(self, key):
+        """Largura e altura originais (em pixels da tela) do template"""
+        _, w, h = self._templates[key]
+        return w, h
+
+    def prepare_frame(self, frame):
+        """Converte o frame para o formato de busca (cinza ou BGR, e escala configurada)"""
+        prepared = to_bgr(frame) if self.color else to_gray(frame)
+        if self.scale != 1.0:
+            prepared = cv2.resize(prepared, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return prepared
+
+    def _template_pyramid(self, key, levels):
+        pyramid = self._template_pyramids.get(key)
+        if pyramid is None or len(pyramid) <= levels:
+            pyramid = build_pyramid(self._templates[key][0], levels)
+            self._template_pyramids[key] = pyramid
+        return pyramid
+
+    def _coarse_level(self, key, prepared):
+        """Nível da pirâmide a usar: o mais profundo em que template e frame ainda são úteis"""
+        levels = self.levels
+        if levels <= 0:
+            return 0
+        th, tw = self._templates[key][0].shape[:2]
+        level = 0
+        while (level < levels and min(th, tw) >> (level + 1) >= MIN_COARSE_TEMPLATE
+               and min(prepared.shape[:2]) >> (level + 1) >= min(th, tw) >> (level + 1)):
+            level += 1
+        return level
+
+    def _locations(self, prepared, key, threshold, max_candidates):
+        """(confiança, x, y) do canto superior esquerdo dos melhores picos no frame preparado"""
+        template = self._templates[key][0]
+        th, tw = template.shape[:2]
+        level = self._coarse_level(key, prepared)
+        if level == 0:
+            result = cv2.matchTemplate(prepared, template, self.method)
+            return _peaks(result, threshold, max_candidates, tw, th)
+
+        # Busca completa somente no nível reduzido, com limiar mais frouxo
+        frame_small = build_pyramid(prepared, level)[level]
+        template_small = self._template_pyramid(key, level)[level]
+        coarse = cv2.matchTemplate(frame_small, template_small, self.method)
+        sh, sw = template_small.shape[:2]
+        factor = 1 << level
+        pad = factor * 2
+
+        # Refinamento em resolução cheia, apenas numa janela em volta de cada candidato
+        refined = {}
+        for _, cx, cy in _peaks(coarse, threshold - self.coarse_margin, max_candidates * 2, sw, sh):
+            x0, y0 = max(0, cx * factor - pad), max(0, cy * factor - pad)
+            x1 = min(prepared.shape[1], cx * factor + tw + pad)
+            y1 = min(prepared.shape[0], cy * factor + th + pad)
+            if x1 - x0 < tw or y1 - y0 < th:
+                continue
+            result = cv2.matchTemplate(prepared[y0:y1, x0:x1], template, self.method)
+            _, max_val, _, (px, py) = cv2.minMaxLoc(result)
+            if max_val >= threshold:
+                location = (x0 + px, y0 + py)
+                refined[location] = max(float(max_val), refined.get(location, -1.0))
+        best = sorted(((conf, x, y) for (x, y), conf in refined.items()), reverse=True)
+        return best[:max_candidates]
+
+    def _candidates(self, prepared, key, threshold, max_candidates, origin=(0, 0)):
+        """Melhores correspondências do template, em coordenadas da tela"""
+        template, original_w, original_h = self._templates[key]
+        th, tw = template.shape[:2]
+        if prepared.shape[0] < th or prepared.shape[1] < tw:
+            return []
+
+        candidates = []
+        for confidence, px, py in self._locations(prepared, key, threshold, max_candidates):
+            center_x = int((px + tw / 2) / self.scale) + origin[0]
+            center_y = int((py + th / 2) / self.scale) + origin[1]
+            candidates.append(Match(center_x, center_y, confidence, original_w, original_h))
+        return candidates
+
+    def match(self, frame, key, threshold=0.7, prepared=False, origin=(0, 0)):
+        """Melhor correspondência de um único template, ou None"""
+        image = frame if prepared else self.prepare_frame(frame)
+        candidates = self._candidates(image, key, threshold, 1, origin)
+        return candidates[0] if candidates else None
+
+    def match_all(self, frame, threshold=0.7, keys=None, prepared=False,
+                  max_candidates=3, overlap_threshold=0.3, origin=(0, 0)):
+        """
+        Procura vários templates no mesmo frame e retorna {chave: Match}.
+
+        Aplica supressão de não-máximos entre templates: se dois templates
+        disputam a mesma região (ex: '8' e '0' no mesmo botão), fica o de maior
+        confiança e o outro usa seu próximo melhor candidato, se houver.
+        """
+        image = frame if prepared else self.prepare_frame(frame)
+        keys = self.keys() if keys is None else [k for k in keys if k in self._templates]
+
+        # Um matchTemplate por template, todos em paralelo sobre o mesmo frame preparado
+        jobs = [MatchJob(self, image, key, threshold, max_candidates, origin) for key in keys]
+        ranked = []
+        for key, candidates in zip(keys, self.pool.match_batch(jobs)):
+            ranked.extend((key, candidate) for candidate in candidates)
+        ranked.sort(key=lambda item: item[1].confidence, reverse=True)
+
+        accepted = {}
+        for key, candidate in ranked:
+            if key in accepted:
+                continue
+            if any(_overlap(candidate, other) > overlap_threshold for other in accepted.values()):
+                continue
+            accepted[key] = candidate
+        return accepted
+
+
+def region_signature(image, size=32):
+    """Assinatura barata de uma região: miniatura em tons de cinza (size x size)"""
+    return cv2.resize(to_gray(image), (size, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class KeypadLayout:
+    """
+    Posições dos botões do teclado do PIN para uma exibição da tela.
+
+    O Ragnarok embaralha o teclado sempre que a tela do PIN é exibida, mas o
+    layout não muda enquanto o PIN é digitado. O layout guarda o centro de cada
+    botão e uma assinatura da região do teclado; enquanto a assinatura não
+    mudar, os cliques usam as posições guardadas sem novo template matching.
+    """
+
+    def __init__(self, positions, region, signature, tolerance=4.0, margin=20):
+        self.positions = positions      # {chave: Match}
+        self.region = region            # (left, top, width, height) na tela
+        self.signature = signature
+        self.tolerance = tolerance      # diferença média máxima da miniatura (0-255)
+        self.margin = margin
+
+    @staticmethod
+    def _bounding_region(matches, frame_shape, margin, origin=(0, 0)):
+        left = min(m.x - m.width // 2 for m in matches) - margin
+        top = min(m.y - m.height // 2 for m in matches) - margin
+        right = max(m.x + m.width // 2 for m in matches) + margin
+        bottom = max(m.y + m.height // 2 for m in matches) + margin
+        left, top = max(origin[0], left), max(origin[1], top)
+        right = min(origin[0] + frame_shape[1], right)
+        bottom = min(origin[1] + frame_shape[0], bottom)
+        return (int(left), int(top), int(right - left), int(bottom - top))
+
+    @staticmethod
+    def crop(frame, region, origin=(0, 0)):
+        """Recorte (view, sem cópia) da região da tela dentro de um frame que começa em `origin`"""
+        left, top, width, height = region
+        left, top = left - origin[0], top - origin[1]
+        return frame[top:top + height, left:left + width]
+
+    @classmethod
+    def from_matches(cls, matches, frame, margin=20, tolerance=4.0, origin=(0, 0)):
+        """Constrói o layout a partir de correspondências já calculadas no `frame`"""
+        if not matches:
+            return None
+        region = cls._bounding_region(list(matches.values()), frame.shape, margin, origin)
+        signature = region_signature(cls.crop(frame, region, origin))
+        return cls(dict(matches), region, signature, tolerance, margin)
+
+    @classmethod
+    def detect(cls, matcher, frame, keys, threshold=0.7, margin=20, tolerance=4.0, origin=(0, 0)):
+        """Localiza todos os `keys` em um único frame e constrói o layout (ou None)"""
+        matches = matcher.match_all(frame, threshold=threshold, keys=keys, origin=origin)
+        return cls.from_matches(matches, frame, margin, tolerance, origin)
+
+    def refresh(self, matcher, frame, keys, threshold=0.7, origin=(0, 0)):
+        """Recalcula o layout no lugar a partir de um novo frame"""
+        matches = matcher.match_all(frame, threshold=threshold, keys=keys, origin=origin)
+        if not matches:
+            return False
+        region = self._bounding_region(list(matches.values()), frame.shape, self.margin, origin)
+        self.positions = dict(matches)
+        self.region = region
+        self.signature = region_signature(self.crop(frame, region, origin))
+        return True
+
+    def is_current(self, region_image):
+        """True se a captura da região do teclado ainda corresponde ao layout guardado"""
+        if region_image is None or region_image.size == 0:
+            return False
+        diff = np.abs(region_signature(region_image) - self.signature)
+        return float(diff.mean()) <= self.tolerance
+
+    def get(self, key):
+        """Centro (x, y) do botão `key`, ou None se ele não foi localizado"""
+        match = self.positions.get(key)
+        return (match.x, match.y) if match else None
+
+    def __contains__(self, key):
+        return key in self.positions
+
+
+def pyramid_report(templates, frames, depths=(0, 1, 2, 3), threshold=0.7, repeat=3):
+    """
+    Compara a busca em resolução cheia com o modo pirâmide em várias profundidades.
+
+    Para cada profundidade retorna um dicionário com o tempo médio por frame
+    (ms, todos os templates, uma thread), quantos templates foram encontrados,
+    quantos coincidem com a busca completa (mesmo centro, até 2 px) e o maior
+    erro de posição observado.
+    """
+    serial = MatchPool(1)
+    prepared = [to_gray(frame) for frame in frames]
+    reference = None
+    rows = []
+    for depth in depths:
+        matcher = TemplateMatcher(templates, pool=serial, pyramid_levels=depth)
+        results = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            results = [matcher.match_all(frame, threshold=threshold, prepared=True) for frame in prepared]
+        elapsed = (time.perf_counter() - started) / (repeat * max(1, len(prepared)))
+        if reference is None:
+            reference = results
+
+        found = agree = 0
+        max_error = 0
+        for got, expected in zip(results, reference):
+            found += len(got)
+            for key, match in got.items():
+                base = expected.get(key)
+                if base is None:
+                    continue
+                error = max(abs(match.x - base.x), abs(match.y - base.y))
+                max_error = max(max_error, error)
+                agree += error <= 2
+        rows.append({'depth': depth, 'ms': elapsed * 1000.0, 'found': found,
+                     'expected': sum(len(r) for r in reference), 'agree': agree, 'max_error': max_error})
+    return rows
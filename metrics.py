@@ -0,0 +1,299 @@
+"""
+Métricas de latência do monitoramento e da reconexão.
+
+Cada busca de imagem (tempo de captura, tempo de matching, confiança), cada
+passo do login (tempo esperando a tela, tempo da ação, consultas feitas,
+sucesso) e cada reconexão completa são registrados em contadores e
+histogramas. Os valores agregados podem ser exportados no formato texto do
+Prometheus (arquivo atualizado periodicamente e/ou endpoint HTTP local) e cada
+evento pode ser gravado em um log JSON lines, para ajustar os timeouts de cada
+passo a partir de dados reais.
+
+O log de eventos não faz I/O em quem registra: o evento vai para uma fila e
+uma thread própria o formata e grava em um arquivo rotativo. Os eventos de
+cada busca de imagem ('probe', várias por segundo no monitoramento) ficam de
+fora, a menos que sejam pedidos; as buscas continuam nos histogramas.
+"""
+import atexit
+import contextlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import QueueListener, RotatingFileHandler
+
+import structured_log
+
+_log = structured_log.logger('metrics')
+
+# Limites (em segundos) dos histogramas de tempo
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONFIDENCE_BUCKETS = (0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0)
+
+# Tipos de evento que não vão para o log de eventos por padrão (um por busca de imagem)
+SKIPPED_EVENTS = ('probe',)
+
+# Nomes e descrições das métricas do bot
+DESCRIPTIONS = {
+    'ragnarok_capture_seconds': ('Tempo de captura de tela por busca de imagem', TIME_BUCKETS),
+    'ragnarok_match_seconds': ('Tempo de template matching por busca de imagem', TIME_BUCKETS),
+    'ragnarok_match_confidence': ('Confiança das correspondências encontradas', CONFIDENCE_BUCKETS),
+    'ragnarok_probes_total': ('Buscas de imagem por template e resultado', None),
+    'ragnarok_login_step_wait_seconds': ('Tempo esperando a tela de cada passo do login', TIME_BUCKETS),
+    'ragnarok_login_step_action_seconds': ('Tempo da ação de cada passo do login', TIME_BUCKETS),
+    'ragnarok_login_step_attempts': ('Consultas até a tela de cada passo do login aparecer', (1, 2, 3, 5, 10, 20, 50, 100)),
+    'ragnarok_login_steps_total': ('Passos do login por estado e resultado', None),
+    'ragnarok_detect_seconds': ('Limite superior do tempo até detectar a desconexão', TIME_BUCKETS),
+    'ragnarok_reconnect_seconds': ('Duração de cada tentativa de reconexão', TIME_BUCKETS),
+    'ragnarok_reconnects_total': ('Tentativas de reconexão por resultado', None),
+}
+
+
+class Histogram:
+    """Histograma cumulativo no estilo do Prometheus"""
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # o último é +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class _EventFormatter(logging.Formatter):
+    """Formata na thread de gravação o evento (dicionário) guardado no registro"""
+
+    def format(self, record):
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class Metrics:
+    """
+    Contadores, histogramas e log de eventos, seguros para uso de várias threads.
+
+    Sem `events_path` os eventos são ignorados; as agregações ficam sempre em
+    memória (custo de um dicionário por observação). O arquivo de eventos roda
+    ao passar de `events_max_bytes`, guardando `events_backups` arquivos
+    antigos; os tipos em `skip_events` não são gravados.
+    """
+
+    def __init__(self, events_path=None, descriptions=DESCRIPTIONS, clock=time.time,
+                 events_max_bytes=10 * 1024 * 1024, events_backups=3, skip_events=SKIPPED_EVENTS):
+        self.events_path = events_path
+        self.events_max_bytes = events_max_bytes
+        self.events_backups = events_backups
+        self.skip_events = frozenset(skip_events)
+        self.descriptions = dict(descriptions)
+        self.clock = clock
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._events = None  # (fila, listener, arquivo)
+        self._exporter = None
+        self._server = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1.0, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                buckets = self.descriptions.get(name, ('', None))[1] or TIME_BUCKETS
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observa em `name` a duração do bloco"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name, **labels):
+        return self._counters.get(self._key(name, labels), 0.0)
+
+    def histogram(self, name, **labels):
+        return self._histograms.get(self._key(name, labels))
+
+    def _event_queue(self):
+        with self._lock:
+            if self._events is None:
+                directory = os.path.dirname(self.events_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                output = RotatingFileHandler(self.events_path, maxBytes=self.events_max_bytes,
+                                             backupCount=self.events_backups, encoding='utf-8')
+                output.setFormatter(_EventFormatter())
+                events = queue.SimpleQueue()
+                listener = QueueListener(events, output)
+                listener.start()
+                self._events = (events, listener, output)
+            return self._events[0]
+
+    def event(self, kind, **fields):
+        """Enfileira uma linha JSON com o evento (se houver arquivo de eventos e o tipo não for ignorado)"""
+        if not self.events_path or kind in self.skip_events:
+            return
+        record = {'ts': round(self.clock(), 3), 'event': kind}
+        record.update(fields)
+        self._event_queue().put(logging.makeLogRecord({'msg': record}))
+
+    def render(self):
+        """Todas as métricas no formato texto do Prometheus"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h.buckets, list(h.cumulative()), h.sum, h.count))
+                                for key, h in self._histograms.items())
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                description = self.descriptions.get(name, ('',))[0]
+                if description:
+                    lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (_, cumulative, total, count) in histograms:
+            header(name, 'histogram')
+            for bound, running in cumulative:
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_bound(bound)))} {running}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Grava o texto do Prometheus de forma atômica (para o textfile collector, por exemplo)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_textfile(self, path, interval=15.0):
+        """Regrava `path` a cada `interval` segundos em uma thread em segundo plano"""
+        stop = threading.Event()
+
+        def run():
+            while True:
+                stopped = stop.wait(interval)
+                try:
+                    self.write_textfile(path)
+                except OSError as e:
+                    _log.error("Falha ao gravar '%s': %s", path, e)
+                if stopped:
+                    return
+
+        self._exporter = stop
+        threading.Thread(target=run, name='metricas', daemon=True).start()
+        return stop
+
+    def serve(self, port=9109, host='127.0.0.1'):
+        """Endpoint HTTP local (GET /metrics) servido em uma thread em segundo plano"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metricas-http', daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._exporter is not None:
+            self._exporter.set()
+            self._exporter = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        with self._lock:
+            events, self._events = self._events, None
+        if events is not None:
+            _, listener, output = events
+            listener.stop()  # grava o que ainda estiver na fila
+            output.close()
+
+
+_metrics = Metrics()
+
+
+def metrics():
+    """Métricas compartilhadas por todo o bot"""
+    return _metrics
+
+
+atexit.register(lambda: _metrics.close())
+
+
+def configure(events_path=None, textfile=None, interval=15.0, port=None, probe_events=False):
+    """Substitui as métricas compartilhadas e inicia as exportações pedidas"""
+    global _metrics
+    skip = () if probe_events else SKIPPED_EVENTS
+    old, _metrics = _metrics, Metrics(events_path, skip_events=skip)
+    old.close()
+    if textfile:
+        _metrics.start_textfile(textfile, interval)
+    if port:
+        _metrics.serve(port)
+    return _metrics
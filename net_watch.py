@@ -0,0 +1,137 @@
+"""
+Detecção de desconexão pelas conexões TCP do processo do jogo.
+
+O diálogo 'desconectado.png' só aparece (e só é encontrado pelo matching)
+algum tempo depois de a conexão cair. A ConnectionWatch consulta a tabela de
+conexões do próprio processo do cliente (psutil net_connections) e acompanha
+a sessão estabelecida com o servidor (char/map): quando ela deixa de existir,
+a desconexão é informada na hora, sem nenhuma captura de tela.
+
+Limitação: uma queda de rede sem FIN/RST (cabo desligado, por exemplo) só
+aparece quando o TCP do sistema desiste da conexão; nesses casos o detector
+por imagem continua sendo a garantia. O mesmo vale quando o sistema nega a
+leitura das conexões do processo (ex: jogo rodando como administrador no
+Windows): a vigia avisa uma vez e passa a responder None.
+"""
+import time
+
+import psutil
+
+import process_index
+import structured_log
+from process_index import GAME_PROCESS_NAMES
+
+_log = structured_log.logger('net_watch')
+
+
+def find_game_pid(process_names=GAME_PROCESS_NAMES):
+    """PID de um processo cujo nome é um dos nomes do cliente, ou None"""
+    return process_index.shared(process_names).find()
+
+
+def _tcp_connections(proc):
+    # psutil >= 6 usa net_connections(); versões antigas só têm connections()
+    method = getattr(proc, 'net_connections', None) or proc.connections
+    return method(kind='tcp')
+
+
+class ConnectionWatch:
+    """
+    Vigia a sessão TCP estabelecida do processo do jogo.
+
+    poll() retorna True (a sessão caiu), False (sessão estabelecida) ou None
+    (processo não encontrado ou ainda sem sessão conhecida). A vigia só "arma"
+    depois de ver uma mesma conexão estabelecida por `arm_after` segundos
+    (conexões curtas, como as do login ou de serviços auxiliares do cliente,
+    não contam); a queda é informada uma única vez até reset() (chamado após
+    a reconexão).
+
+    - `pid`: processo a vigiar (padrão: procurado por `process_names`);
+    - `ports`: portas remotas do servidor (None = qualquer porta, o que inclui
+      conexões que não são do jogo, como anti-cheat e páginas web);
+    - `grace`: segundos sem sessão antes de informar a queda (cobre a troca
+      de servidor de char/mapa, em que o cliente fecha uma conexão e abre outra);
+    - `arm_after`: segundos que uma conexão precisa durar para armar a vigia.
+    """
+
+    def __init__(self, pid=None, process_names=GAME_PROCESS_NAMES, ports=None, grace=3.0,
+                 arm_after=10.0, clock=time.monotonic):
+        self.pid = pid
+        self.fixed_pid = pid is not None
+        self.process_names = process_names
+        self.ports = set(ports) if ports else None
+        self.grace = grace
+        self.arm_after = arm_after
+        self.clock = clock
+        self.polls = 0
+        self.session = frozenset()  # conexões (local, remoto) da sessão atual
+        self.dropped_at = None      # momento em que a sessão deixou de ser vista
+        self._first_seen = {}       # conexão -> primeiro momento em que foi vista estabelecida
+        self._proc = None
+        self._denied_warned = False
+        self.reset()
+
+    def reset(self):
+        """Esquece a sessão anterior; a vigia volta a armar na próxima sessão estabelecida"""
+        self.armed = False
+        self.reported = False
+        self.dropped_at = None
+        self.session = frozenset()
+        self._first_seen = {}
+
+    def _process(self):
+        if self._proc is not None and self._proc.is_running():
+            return self._proc
+        self._proc = None
+        pid = self.pid if self.fixed_pid else find_game_pid(self.process_names)
+        if pid is None:
+            return None
+        try:
+            self._proc = psutil.Process(pid)
+            self.pid = pid
+        except psutil.NoSuchProcess:
+            return None
+        return self._proc
+
+    def established(self):
+        """Conexões estabelecidas com o servidor (filtradas por porta), ou None sem processo ou sem permissão"""
+        proc = self._process()
+        if proc is None:
+            return None
+        try:
+            connections = _tcp_connections(proc)
+        except (psutil.NoSuchProcess, psutil.ZombieProcess):
+            self._proc = None
+            return None
+        except psutil.AccessDenied:
+            if not self._denied_warned:
+                self._denied_warned = True
+                _log.warning("Sem permissão para ler as conexões do processo %s; a desconexão será "
+                             "detectada só pela imagem.", proc.pid)
+            return None
+        return frozenset(
+            (tuple(c.laddr), tuple(c.raddr)) for c in connections
+            if c.status == psutil.CONN_ESTABLISHED and c.raddr
+            and (self.ports is None or c.raddr[1] in self.ports))
+
+    def poll(self):
+        self.polls += 1
+        now = self.clock()
+        session = self.established()
+        if session is None:
+            return None
+        self._first_seen = {c: self._first_seen.get(c, now) for c in session}
+        if session:
+            self.session = session
+            self.dropped_at = None
+            if not self.armed and any(now - seen >= self.arm_after for seen in self._first_seen.values()):
+                self.armed = True
+            return False if self.armed else None
+        if not self.armed:
+            return None
+        if self.dropped_at is None:
+            self.dropped_at = now
+        if self.reported or now - self.dropped_at < self.grace:
+            return None
+        self.reported = True
+        return True
@@ -0,0 +1,223 @@
+"""
+Índice dos processos do cliente do jogo.
+
+Percorrer `psutil.process_iter` e comparar o nome de cada processo custa uma
+consulta ao sistema por processo, a cada busca. O ProcessIndex guarda o
+conjunto de PIDs já vistos e só consulta o nome dos PIDs novos: cada refresh
+é um `psutil.pids()` mais uma diferença de conjuntos, e saber se um PID é do
+cliente (ou qual PID é dono de uma janela) é uma consulta a um dicionário.
+
+O encerramento é feito em lote: terminate() em todos os clientes do bot, uma
+única espera com `psutil.wait_procs` e kill() só nos que não saíram a tempo.
+Clientes do bot são os processos donos de uma janela do jogo já consultada e
+os iniciados pelo próprio bot (track()); outros processos com o mesmo nome
+não são encerrados.
+"""
+import os
+import sys
+import threading
+import time
+
+import psutil
+
+# Nomes dos executáveis do cliente (exatos, sem diferenciar maiúsculas)
+GAME_PROCESS_NAMES = ('Ragnarok.exe', 'Ragexe.exe', 'client.exe')
+
+
+def _window_pid_win32(hwnd):
+    import ctypes
+    from ctypes import wintypes
+    pid = wintypes.DWORD()
+    ctypes.windll.user32.GetWindowThreadProcessId(wintypes.HWND(hwnd), ctypes.byref(pid))
+    return pid.value or None
+
+
+def window_pid(window):
+    """PID do processo dono da janela (pygetwindow/pyautogui), ou None fora do Windows"""
+    hwnd = getattr(window, '_hWnd', None)
+    if hwnd is None or sys.platform != 'win32':
+        return None
+    return _window_pid_win32(hwnd)
+
+
+class ProcessIndex:
+    """
+    Índice PID -> processo do cliente, atualizado de forma incremental.
+
+    - `process_names`: nomes dos executáveis do cliente (comparados com o
+      nome inteiro do processo, sem diferenciar maiúsculas);
+    - `max_age`: segundos em que o índice é reaproveitado sem refresh nas
+      consultas (`refresh()` explícito sempre atualiza).
+
+    Um cliente que saiu (mesmo que o PID já tenha sido reaproveitado pelo
+    sistema) é descartado no refresh, e o PID volta a ser consultado. O índice
+    é usado ao mesmo tempo pelo loop do supervisor, pelos relançamentos e
+    pelas reconexões: refresh, consultas e encerramento passam por uma trava.
+    """
+
+    def __init__(self, process_names=GAME_PROCESS_NAMES, max_age=1.0, clock=time.monotonic):
+        self.process_names = tuple(process_names)
+        self._names = {os.path.basename(name).lower() for name in self.process_names}
+        self.max_age = max_age
+        self.clock = clock
+        self.clients = {}      # pid -> psutil.Process
+        self._known = set()    # todos os PIDs já vistos (clientes ou não)
+        self._windows = {}     # hWnd -> pid
+        self.launched = set()  # PIDs iniciados pelo bot (track())
+        self.refreshed_at = None
+        self.lookups = 0       # consultas de nome feitas ao sistema (diagnóstico)
+        self._lock = threading.RLock()
+
+    def matches(self, name):
+        return os.path.basename(name or '').lower() in self._names
+
+    def add_names(self, *names):
+        """Inclui executáveis do cliente (ex: o configurado para relançar); os PIDs já vistos são consultados de novo"""
+        names = {os.path.basename(name).lower() for name in names if name} - self._names
+        if not names:
+            return
+        with self._lock:
+            self._names |= names
+            self.process_names += tuple(sorted(names))
+            self._known &= set(self.clients)
+            self.refreshed_at = None
+
+    def track(self, pid):
+        """Registra um processo iniciado pelo bot: passa a ser cliente (qualquer que seja o nome) e pode ser encerrado"""
+        try:
+            proc = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return
+        with self._lock:
+            self.clients[pid] = proc
+            self._known.add(pid)
+            self.launched.add(pid)
+
+    def rebuild(self):
+        with self._lock:
+            self.clients.clear()
+            self._known.clear()
+            self._windows.clear()
+            self.launched.clear()
+            return self.refresh()
+
+    def refresh(self):
+        """Consulta só os PIDs novos e descarta os que saíram; retorna os PIDs dos clientes"""
+        with self._lock:
+            pids = set(psutil.pids())
+            # Clientes que saíram, inclusive os cujo PID já foi reaproveitado por outro processo
+            for pid in [pid for pid, proc in self.clients.items() if pid not in pids or not proc.is_running()]:
+                del self.clients[pid]
+                self._known.discard(pid)
+            self._known &= pids
+            self.launched &= set(self.clients)
+            for pid in pids - self._known:
+                try:
+                    proc = psutil.Process(pid)
+                    self.lookups += 1
+                    if self.matches(proc.name()):
+                        self.clients[pid] = proc
+                except psutil.NoSuchProcess:
+                    continue  # saiu entre pids() e a consulta
+                except (psutil.AccessDenied, psutil.ZombieProcess):
+                    pass
+                self._known.add(pid)
+            if self._windows:
+                self._windows = {hwnd: pid for hwnd, pid in self._windows.items() if pid in pids}
+            self.refreshed_at = self.clock()
+            return list(self.clients)
+
+    def _fresh(self):
+        if self.refreshed_at is None or self.clock() - self.refreshed_at >= self.max_age:
+            self.refresh()
+
+    def pids(self):
+        """PIDs dos clientes em execução"""
+        with self._lock:
+            self._fresh()
+            return [pid for pid, proc in self.clients.items() if proc.is_running()]
+
+    def find(self):
+        """PID de um cliente em execução, ou None"""
+        pids = self.pids()
+        return pids[0] if pids else None
+
+    def __contains__(self, pid):
+        with self._lock:
+            self._fresh()
+            proc = self.clients.get(pid)
+        return proc is not None and proc.is_running()
+
+    def owned(self):
+        """PIDs dos clientes do bot em execução: donos de janelas do jogo ou iniciados por track()"""
+        with self._lock:
+            mine = self.launched | set(self._windows.values())
+            return [pid for pid in self.pids() if pid in mine]
+
+    def pid_for_window(self, window):
+        """PID do cliente dono da janela (None se a janela não for de um cliente conhecido)"""
+        hwnd = getattr(window, '_hWnd', None)
+        if hwnd is None:
+            return None
+        with self._lock:
+            pid = self._windows.get(hwnd)
+        if pid is None:
+            pid = window_pid(window)
+            if pid is None:
+                return None
+            with self._lock:
+                self._windows[hwnd] = pid
+        return pid if pid in self else None
+
+    def terminate(self, pids=None, timeout=3.0, kill_timeout=2.0):
+        """
+        Encerra os clientes (`pids`, padrão: os do bot, veja owned()) em lote: terminate() em
+        todos, espera até `timeout` segundos e mata com kill() os que restarem.
+        Retorna (encerrados, sobreviventes) como listas de PIDs.
+
+        A espera acontece fora da trava, então as consultas de outras threads
+        não ficam bloqueadas enquanto os processos saem.
+        """
+        with self._lock:
+            self._fresh()
+            if pids is None:
+                pids = self.owned()
+            targets = [self.clients[pid] for pid in pids if pid in self.clients]
+        procs, denied = [], []
+        for proc in targets:
+            try:
+                proc.terminate()
+                procs.append(proc)
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                denied.append(proc)
+        gone, alive = psutil.wait_procs(procs, timeout=timeout)
+        if alive:
+            for proc in alive:
+                try:
+                    proc.kill()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+            killed, alive = psutil.wait_procs(alive, timeout=kill_timeout)
+            gone += killed
+        with self._lock:
+            for proc in targets:
+                if proc not in alive and proc not in denied:
+                    self.clients.pop(proc.pid, None)
+                    self.launched.discard(proc.pid)
+        return [proc.pid for proc in gone], [proc.pid for proc in alive + denied]
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(process_names=GAME_PROCESS_NAMES):
+    """Índice compartilhado do processo para os nomes dados"""
+    key = tuple(process_names)
+    with _shared_lock:
+        index = _shared.get(key)
+        if index is None:
+            index = _shared[key] = ProcessIndex(key)
+        return index
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Relatório de precisão x velocidade do modo pirâmide (coarse-to-fine).
+
+Uso: python relatorio_piramide.py screenshot1.png [screenshot2.png ...]
+
+Procura nos screenshots os templates do bot presentes na pasta atual
+(0-9.png, confirmar.png, avatar_pin.png, desconectado.png, ...) com a busca
+em resolução cheia e com pirâmides de 1 a 3 níveis, e mostra o tempo por
+frame e quantas posições coincidem com a busca completa. Use o resultado
+para escolher PYRAMID_LEVELS em main.py / main_gui.py.
+"""
+import os
+import sys
+
+import cv2
+
+from matcher import pyramid_report
+
+TEMPLATES = [str(i) for i in range(10)] + ['confirmar', 'avatar_pin', 'desconectado', 'ragnarok', 'senha', 'jogar']
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python relatorio_piramide.py screenshot1.png [screenshot2.png ...]")
+        sys.exit(1)
+    frames = [cv2.imread(path) for path in sys.argv[1:]]
+    if any(frame is None for frame in frames):
+        print("Erro: não foi possível ler um dos screenshots.")
+        sys.exit(1)
+    templates = {}
+    for name in TEMPLATES:
+        if os.path.exists(f"{name}.png"):
+            templates[name] = cv2.imread(f"{name}.png", cv2.IMREAD_GRAYSCALE)
+    if not templates:
+        print("Erro: nenhum template encontrado na pasta atual.")
+        sys.exit(1)
+
+    print(f"{len(templates)} templates, {len(frames)} frame(s)")
+    print(f"{'níveis':>6} {'ms/frame':>10} {'encontrados':>12} {'coincidem':>10} {'erro máx':>9}")
+    for row in pyramid_report(templates, frames):
+        print(f"{row['depth']:>6} {row['ms']:>10.1f} {row['found']:>5}/{row['expected']:<6} "
+              f"{row['agree']:>10} {row['max_error']:>7}px")
+
+
+if __name__ == "__main__":
+    main()
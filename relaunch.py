@@ -0,0 +1,169 @@
+"""
+Relançamento automático do cliente do jogo.
+
+Quando o cliente fecha (crash) ou precisa ser reiniciado, não existe diálogo
+'desconectado.png' para detectar: o ClientLauncher inicia de novo o
+executável configurado e espera a janela dele aparecer. No Windows a espera
+usa WaitForInputIdle, que retorna assim que o cliente começa a processar
+mensagens (a janela já existe); depois disso, e fora do Windows, a janela é
+procurada com consultas curtas que vão espaçando (login_flow.wait_until), sem
+esperas fixas. A janela encontrada é entregue ao login, que começa direto na
+tela de confirmação.
+
+O RelaunchPool roda vários relançamentos ao mesmo tempo (limitado por
+`max_parallel`): iniciar o executável e esperar a janela acontece em
+paralelo; o login de cada cliente continua passando pela trava de entrada de
+quem chama. Cada janela nova é reservada (sob uma trava comum a todos os
+ClientLaunchers) por quem a encontrou, então dois relançamentos simultâneos
+nunca ficam com a mesma janela.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyautogui
+except Exception:
+    # Sem pyautogui (ou sem display) as janelas vêm de `list_windows`
+    pyautogui = None
+
+import process_index
+from login_flow import wait_until
+
+# Executável do cliente: caminho, argumentos e pasta de trabalho (padrão: a pasta do executável)
+LaunchConfig = namedtuple('LaunchConfig', ['executable', 'args', 'cwd'], defaults=((), None))
+
+# Resultado de um relançamento: PID iniciado, janela encontrada e segundos até ela aparecer
+Launched = namedtuple('Launched', ['pid', 'window', 'seconds'])
+
+_WAIT_TIMEOUT = 0x102
+_PROCESS_QUERY_INFORMATION = 0x0400
+_SYNCHRONIZE = 0x00100000
+
+
+def wait_input_idle(pid, timeout):
+    """
+    Espera (no Windows) o processo ficar pronto para receber entrada, ou seja,
+    com a janela criada. Retorna True se ficou pronto, False no timeout e None
+    se a espera não está disponível (outros sistemas, acesso negado).
+    """
+    if sys.platform != 'win32':
+        return None
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(_PROCESS_QUERY_INFORMATION | _SYNCHRONIZE, False, pid)
+    if not handle:
+        return None
+    try:
+        result = ctypes.windll.user32.WaitForInputIdle(handle, int(timeout * 1000))
+    finally:
+        kernel32.CloseHandle(handle)
+    if result == 0:
+        return True
+    return False if result == _WAIT_TIMEOUT else None
+
+
+def _window_key(window):
+    return getattr(window, '_hWnd', None) or id(window)
+
+
+# Janelas já reservadas por um relançamento (chaves de _window_key)
+_claimed = set()
+_claim_lock = threading.Lock()
+
+
+class ClientLauncher:
+    """
+    Inicia o executável do cliente e espera a janela `window_title` dele.
+
+    - `window_timeout`: segundos máximos até a janela aparecer;
+    - `processes`: ProcessIndex usado para saber se o cliente está rodando e
+      qual processo é dono de cada janela (padrão: o índice compartilhado).
+    """
+
+    def __init__(self, config, window_title, window_timeout=60.0, processes=None,
+                 sleep=time.sleep, clock=time.monotonic, popen=subprocess.Popen, list_windows=None):
+        self.config = config
+        self.window_title = window_title
+        self.window_timeout = window_timeout
+        self.processes = processes or process_index.shared()
+        self.sleep = sleep
+        self.clock = clock
+        self.popen = popen
+        self.list_windows = list_windows
+        self.launches = 0
+
+    def running(self):
+        """True se algum processo do cliente está em execução"""
+        return self.processes.find() is not None
+
+    def launch(self):
+        """Inicia o executável; retorna o PID"""
+        executable = self.config.executable
+        cwd = self.config.cwd or os.path.dirname(os.path.abspath(executable))
+        # Grupo de processos próprio: o cliente não recebe o Ctrl+C do console do bot
+        flags = getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)
+        proc = self.popen([executable, *self.config.args], cwd=cwd, creationflags=flags)
+        self.launches += 1
+        self.processes.track(proc.pid)
+        return proc.pid
+
+    def _windows(self):
+        try:
+            list_windows = self.list_windows or pyautogui.getWindowsWithTitle
+            return list_windows(self.window_title)
+        except Exception:
+            return []
+
+    def _new_window(self, pid, before):
+        """
+        Reserva e retorna a janela nova do jogo: a do processo iniciado ou, se
+        nenhuma é dele (o executável pode ser um launcher, e fora do Windows o
+        dono é desconhecido), uma janela nova que não pertence a outro processo
+        iniciado pelo bot nem foi reservada por outro relançamento.
+        """
+        windows = self._windows()
+        with _claim_lock:
+            _claimed.intersection_update(_window_key(w) for w in windows)  # esquece janelas fechadas
+            new = [w for w in windows if _window_key(w) not in before and _window_key(w) not in _claimed]
+            owners = {_window_key(w): process_index.window_pid(w) for w in new}
+            chosen = next((w for w in new if owners[_window_key(w)] == pid), None)
+            if chosen is None:
+                others = self.processes.launched - {pid}
+                chosen = next((w for w in new if owners[_window_key(w)] not in others), None)
+            if chosen is not None:
+                _claimed.add(_window_key(chosen))
+            return chosen
+
+    def start(self):
+        """Inicia o cliente e espera a janela; retorna Launched ou None se a janela não apareceu"""
+        before = {_window_key(w) for w in self._windows()}
+        started = self.clock()
+        pid = self.launch()
+        wait_input_idle(pid, self.window_timeout)
+        remaining = max(0.0, self.window_timeout - (self.clock() - started))
+        window = wait_until(lambda: self._new_window(pid, before), remaining,
+                            initial_interval=0.05, max_interval=0.5, sleep=self.sleep, clock=self.clock)
+        self.processes.refresh()
+        if window is None:
+            return None
+        return Launched(pid, window, self.clock() - started)
+
+
+class RelaunchPool:
+    """Executa até `max_parallel` relançamentos ao mesmo tempo"""
+
+    def __init__(self, max_parallel=2):
+        self.max_parallel = max_parallel
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_parallel),
+                                            thread_name_prefix='relancamento')
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
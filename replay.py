@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+Harness de replay: roda a detecção e o login do bot sem desktop nem cliente do jogo.
+
+Sequências de telas (sintéticas, montadas com as imagens do próprio bot, ou
+gravadas de um cliente real) são servidas por um backend de captura falso, e
+uma entrada falsa substitui o interception/pyautogui: cada tecla ou clique é
+registrado e pode levar o cenário para outra tela. O código exercitado é o
+mesmo do bot (RegionLocator, verificar_desconexao, DisconnectWatch, máquina de
+estados do login, teclado do PIN). As esperas do fluxo são multiplicadas por
+`--escala-tempo` (0 por padrão), então uma reconexão completa leva
+milissegundos e o tempo medido é só o da detecção e das ações.
+
+O relatório traz o tempo de relógio e de CPU (de todas as threads do processo)
+de cada detector e da reconexão completa, em várias resoluções, para comparar
+desempenho entre versões em uma máquina Linux de CI.
+
+Uso (na pasta das imagens do bot):
+    python replay.py
+    python replay.py --resolucoes 1024x768,2560x1440 --repeticoes 20 --json replay.json
+    python replay.py --cenario pasta_gravada
+
+Uma sequência gravada é uma pasta com os screenshots e um cenario.json
+(regiões em coordenadas da tela: left, top, width, height):
+{
+    "inicio": "desconectado", "final": "em_jogo", "senha": "senha1", "pin": "1234",
+    "telas": [
+        {"nome": "desconectado", "arquivo": "01.png", "teclas": {"enter": "senha"}},
+        {"nome": "senha", "arquivo": "02.png", "teclas": {"enter": "servidor"}},
+        {"nome": "servidor", "arquivo": "03.png", "teclas": {"enter": "pin"}},
+        {"nome": "pin", "arquivo": "04.png",
+         "botoes": {"1": {"regiao": [700, 300, 50, 50]}, "confirmar": {"regiao": [720, 520, 80, 26], "proxima": "selecao"}}},
+        {"nome": "selecao", "arquivo": "05.png", "botoes": {"jogar": {"regiao": [900, 600, 156, 117], "proxima": "em_jogo"}}},
+        {"nome": "em_jogo", "arquivo": "06.png"}
+    ]
+}
+Com os nomes de tela acima, os detectores de cada tela também são medidos. O
+processo termina com código 1 se alguma verificação falhar (reconexão sem
+sucesso, senha ou PIN digitados errado, detector com resultado inesperado,
+tecla ou botão preso depois de um envio de entrada cancelado).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+import capture
+import debug_writer
+import frame_history
+import input_backend
+import funcoes
+import template_registry
+from capture import CaptureBackend, RegionLocator
+from hotspots import HotspotIndex
+
+RESOLUTIONS = ((1280, 720), (1920, 1080))
+DIGITS = [str(i) for i in range(10)]
+
+# Telas do cenário de login (as mesmas etapas da máquina de estados do login)
+DESCONECTADO = 'desconectado'
+SENHA = 'senha'
+SERVIDOR = 'servidor'
+PIN = 'pin'
+SELECAO = 'selecao'
+EM_JOGO = 'em_jogo'
+
+# Um cenário pronto para rodar: backend com as telas, credenciais esperadas e tela final
+Scenario = namedtuple('Scenario', ['name', 'backend', 'senha', 'pin', 'final'])
+
+
+def paste(canvas, image, x, y):
+    """Cola `image` (BGR ou BGRA) em `canvas` com o canto em (x, y); retorna a região ocupada"""
+    height, width = image.shape[:2]
+    target = canvas[y:y + height, x:x + width]
+    if image.ndim == 3 and image.shape[2] == 4:
+        alpha = image[:, :, 3:4].astype(np.float32) / 255.0
+        target[:] = (image[:, :, :3] * alpha + target * (1.0 - alpha)).astype(np.uint8)
+    elif image.ndim == 2:
+        target[:] = image[:, :, None]
+    else:
+        target[:] = image
+    return (x, y, width, height)
+
+
+def background(resolution, rng):
+    """Fundo com gradiente e ruído leve (evita regiões chapadas, que não existem no jogo)"""
+    width, height = resolution
+    base = (np.linspace(40, 90, height, dtype=np.float32)[:, None]
+            + np.linspace(0, 30, width, dtype=np.float32)[None, :])
+    frame = np.dstack([base * 0.8, base, base * 1.2])
+    frame += rng.integers(0, 12, (height, width, 1)).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+class Screen:
+    """Uma tela do cenário: o frame, os botões clicáveis e as teclas que levam a outra tela"""
+
+    def __init__(self, name, frame, buttons=None, keys=None):
+        self.name = name
+        self.frame = frame
+        self.buttons = buttons or {}  # {nome: (região, próxima tela ou None)}
+        self.keys = keys or {}        # {tecla: próxima tela}
+
+    def button_at(self, x, y):
+        for name, ((left, top, width, height), _) in self.buttons.items():
+            if left <= x < left + width and top <= y < top + height:
+                return name
+        return None
+
+
+class ScenarioBackend(CaptureBackend):
+    """
+    Backend de captura que serve a tela atual de um cenário.
+
+    As entradas recebidas (press/click, vindas do RecordingBackend) mudam a tela
+    conforme o cenário; tudo o que foi digitado e clicado fica registrado.
+    """
+
+    name = 'cenario'
+
+    def __init__(self, screens, start):
+        self.screens = {screen.name: screen for screen in screens}
+        self.start = start
+        self.reset()
+
+    def reset(self, screen=None):
+        """Volta para `screen` (padrão: a tela inicial) e limpa o registro de entradas"""
+        self.current = self.screens[screen or self.start]
+        self.visited = [self.current.name]
+        self.keys = []    # (tela, tecla)
+        self.clicks = []  # (tela, botão ou None, x, y)
+        self.grabs = 0
+
+    def show(self, name):
+        if name and name != self.current.name:
+            self.current = self.screens[name]
+            self.visited.append(name)
+
+    def screen_size(self):
+        height, width = self.current.frame.shape[:2]
+        return width, height
+
+    def grab(self, region=None):
+        self.grabs += 1
+        frame = self.current.frame
+        if region is None:
+            return frame
+        left, top, width, height = region
+        return frame[top:top + height, left:left + width]
+
+    def press(self, key):
+        self.keys.append((self.current.name, key))
+        self.show(self.current.keys.get(key))
+
+    def click(self, x, y):
+        screen = self.current
+        button = screen.button_at(x, y)
+        self.clicks.append((screen.name, button, x, y))
+        if button is not None:
+            self.show(screen.buttons[button][1])
+
+    def typed(self, screen):
+        """Teclas pressionadas na tela `screen`, em ordem"""
+        return [key for name, key in self.keys if name == screen]
+
+    def clicked_buttons(self):
+        """Botões clicados (cliques fora de botões são ignorados), em ordem"""
+        return [button for _, button, _, _ in self.clicks if button is not None]
+
+
+class FakeInput:
+    """Substitui o pyautogui em funcoes.py (posição do mouse e exceções); teclado e mouse vão pelo RecordingBackend"""
+
+    class FailSafeException(Exception):
+        pass
+
+    class ImageNotFoundException(Exception):
+        pass
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._position = (0, 0)
+
+    def position(self):
+        return self._position
+
+    def moveTo(self, x, y, *args, **kwargs):
+        self._position = (x, y)
+
+
+class ScaledSleep:
+    """Substitui funcoes.esperar: dorme `segundos * scale` e soma o tempo que o fluxo teria esperado"""
+
+    def __init__(self, scale=0.0):
+        self.scale = scale
+        self.total = 0.0
+
+    def __call__(self, segundos):
+        self.total += max(0.0, segundos)
+        if self.scale > 0:
+            time.sleep(max(0.0, segundos) * self.scale)
+
+
+def use_quiet_log(verbose=False):
+    """Redireciona o log de funcoes.py para um logger próprio, silencioso a menos que `verbose`"""
+    logger = logging.getLogger('replay')
+    logger.propagate = False
+    logger.handlers[:] = [logging.StreamHandler() if verbose else logging.NullHandler()]
+    logger.setLevel(logging.INFO)
+    funcoes.set_gui_logger(logger)
+    return logger
+
+
+def install(backend, time_scale=0.0, workdir=None, verbose=False):
+    """
+    Direciona funcoes.py para o cenário: captura pelo `backend`, entrada falsa,
+    esperas aceleradas e screenshots desligados; pacotes de falha do login vão
+    para `workdir`. Altera o estado global dos módulos do bot, então deve rodar
+    em um processo próprio (CLI/CI). Retorna (FakeInput, ScaledSleep).
+    """
+    fake = FakeInput(backend)
+    sleep = ScaledSleep(time_scale)
+    capture.configure(backend=backend, max_age=0.0)
+    funcoes.pyautogui = fake
+    funcoes.esperar = sleep
+    input_backend.configure(input_backend.RecordingBackend(target=backend))
+
+    use_quiet_log(verbose)
+    debug_writer.configure(mode=debug_writer.OFF)
+    frame_history.configure(folder=os.path.join(workdir or tempfile.gettempdir(), frame_history.HISTORY_FOLDER))
+    return fake, sleep
+
+
+def build_login_scenario(resolution, senha='senha1', pin='1234', seed=0, assets='.'):
+    """
+    Cenário sintético do login completo montado com as imagens do bot em `assets`:
+    desconectado -> senha -> servidor -> PIN (teclado embaralhado) -> seleção -> em jogo.
+    """
+    rng = np.random.default_rng(seed)
+    shuffle = random.Random(seed)
+
+    def load(name):
+        image = cv2.imread(os.path.join(assets, name), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise FileNotFoundError(f"Imagem '{name}' não encontrada em '{assets}'")
+        return image
+
+    width, height = resolution
+    cx, cy = width // 2, height // 2
+    base = background(resolution, rng)
+    paste(base, load('ragnarok.png'), 8, 4)
+
+    def screen(name, placements=(), buttons=None, keys=None):
+        frame = base.copy()
+        regions = {}
+        for key, image, x, y in placements:
+            regions[key] = paste(frame, image, x, y)
+        resolved = {key: (regions[key], next_screen) for key, next_screen in (buttons or {}).items()}
+        return Screen(name, frame, resolved, keys)
+
+    aviso, confirmar = load('desconectado.png'), load('confirmar.png')
+    desconectado = screen(DESCONECTADO, [
+        ('desconectado', aviso, cx - aviso.shape[1] // 2, cy - 60),
+        ('confirmar', confirmar, cx - confirmar.shape[1] // 2, cy),
+    ], buttons={'confirmar': SENHA}, keys={'enter': SENHA})
+
+    tela_senha = screen(SENHA, [('senha', load('senha.png'), cx - 150, cy + 100)], keys={'enter': SERVIDOR})
+    servidor = screen(SERVIDOR, keys={'enter': PIN})
+
+    # Teclado 3x4 embaralhado (10 dígitos e 2 casas vazias) ao lado do avatar, como no cliente
+    cell_w, cell_h = 60, 56
+    left, top = cx - 20, cy - 130
+    cells = list(range(12))
+    shuffle.shuffle(cells)
+    panel = (left - 10, top - 10, 3 * cell_w + 20, 4 * cell_h + 20)
+    placements = [('avatar', load('avatar_pin.png'), cx - 230, cy - 155)]
+    for digit, cell in zip(DIGITS, cells):
+        image = load(f"{digit}.png")
+        col, row = cell % 3, cell // 3
+        placements.append((digit, image, left + col * cell_w + (cell_w - image.shape[1]) // 2,
+                           top + row * cell_h + (cell_h - image.shape[0]) // 2))
+    placements.append(('confirmar', confirmar, left + (3 * cell_w - confirmar.shape[1]) // 2, top + 4 * cell_h + 20))
+    teclado = screen(PIN, placements, buttons=dict({digit: None for digit in DIGITS}, confirmar=SELECAO))
+    px, py, pw, ph = panel
+    teclado.frame[py:py + ph, px:px + pw] //= 2  # painel escuro atrás do teclado
+    for key, image, x, y in placements[1:]:
+        paste(teclado.frame, image, x, y)
+
+    jogar = load('jogar.png')
+    selecao = screen(SELECAO, [('jogar', jogar, min(cx + 200, width - jogar.shape[1] - 10), cy + 100)],
+                     buttons={'jogar': EM_JOGO})
+    em_jogo = screen(EM_JOGO)
+
+    backend = ScenarioBackend([desconectado, tela_senha, servidor, teclado, selecao, em_jogo], DESCONECTADO)
+    return Scenario(f"{width}x{height}", backend, senha, pin, EM_JOGO)
+
+
+def load_scenario(folder):
+    """Cenário gravado: screenshots da pasta descritos em cenario.json (formato no topo do arquivo)"""
+    with open(os.path.join(folder, 'cenario.json'), 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    screens = []
+    for tela in spec['telas']:
+        path = os.path.join(folder, tela['arquivo'])
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise FileNotFoundError(f"Screenshot '{path}' não encontrado ou inválido")
+        buttons = {name: (tuple(button['regiao']), button.get('proxima'))
+                   for name, button in tela.get('botoes', {}).items()}
+        screens.append(Screen(tela['nome'], frame, buttons, tela.get('teclas', {})))
+    backend = ScenarioBackend(screens, spec.get('inicio', screens[0].name))
+    return Scenario(os.path.basename(os.path.normpath(folder)), backend,
+                    spec.get('senha', ''), spec.get('pin', ''), spec.get('final', EM_JOGO))
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(fn, repeat=5, warmup=1):
+    """Executa `fn` (após `warmup` rodadas) e retorna (tempos de relógio, tempos de CPU, último resultado)"""
+    for _ in range(warmup):
+        fn()
+    walls, cpus = [], []
+    result = None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = fn()
+        cpus.append(time.process_time() - cpu)
+        walls.append(time.perf_counter() - wall)
+    return walls, cpus, result
+
+
+def _row(scenario, detector, screen, walls, cpus, ok, **extra):
+    row = {
+        'cenario': scenario.name,
+        'detector': detector,
+        'tela': screen,
+        'execucoes': len(walls),
+        'relogio_ms': round(1000 * sum(walls) / len(walls), 3),
+        'relogio_p95_ms': round(1000 * _percentile(walls, 0.95), 3),
+        'cpu_ms': round(1000 * sum(cpus) / len(cpus), 3),
+        'ok': bool(ok),
+    }
+    row.update(extra)
+    return row
+
+
+def benchmark_detectors(scenario, locator, repeat=5):
+    """Tempo de cada detector do bot na tela em que ele é usado (telas ausentes no cenário são puladas)"""
+    backend = scenario.backend
+    registro = template_registry.registry()
+    teclado = registro.matcher({digit: f"{digit}.png" for digit in DIGITS})
+    watch = funcoes.criar_vigia_desconexao(localizador=locator)
+
+    def keypad():
+        image, origin = capture.grab(locator.window_region())
+        return len(teclado.match_all(image, threshold=0.7, keys=DIGITS, origin=origin))
+
+    def watch_changed():
+        watch.reset()
+        return watch.poll()
+
+    # (nome, tela, função, verificação do resultado)
+    detectors = [
+        ('verificar_desconexao', DESCONECTADO,
+         lambda: funcoes.verificar_desconexao(verbose=False, localizador=locator), lambda r: r is True),
+        ('verificar_desconexao', EM_JOGO,
+         lambda: funcoes.verificar_desconexao(verbose=False, localizador=locator), lambda r: r is False),
+        ('vigia: região mudou', DESCONECTADO, watch_changed, lambda r: r is True),
+        ('vigia: amostra sem mudança', EM_JOGO, watch.poll, lambda r: r is None),
+        ('localizar confirmar.png', DESCONECTADO, lambda: locator.locate('confirmar.png', 0.8), bool),
+        ('localizar senha.png', SENHA, lambda: locator.locate('senha.png', 0.8), bool),
+        ('localizar ragnarok.png', EM_JOGO,
+         lambda: locator.locate('ragnarok.png', 0.8, full_screen_fallback=True), bool),
+        ('localizar avatar_pin.png', PIN, lambda: locator.locate('avatar_pin.png', 0.8), bool),
+        ('teclado do PIN (match_all)', PIN, keypad, lambda r: r == len(DIGITS)),
+        ('localizar jogar.png', SELECAO, lambda: locator.locate('jogar.png', 0.8), bool),
+    ]
+    rows = []
+    with funcoes.usar_localizador(locator):
+        for name, screen, fn, check in detectors:
+            if screen not in backend.screens:
+                continue
+            backend.reset(screen)
+            walls, cpus, result = measure(fn, repeat)
+            rows.append(_row(scenario, name, screen, walls, cpus, check(result)))
+    return rows
+
+
+def run_reconnect(scenario, locator, sleep):
+    """Uma reconexão completa (foco + login), como o runtime faz; retorna (sucesso, detalhes)"""
+    backend = scenario.backend
+    backend.reset()
+    sleep.total = 0.0
+    with funcoes.usar_localizador(locator):
+        ok = (funcoes.clicar_para_focar_jogo(imagem_alvo_foco='ragnarok.png', confianca_imagem=0.8)
+              and funcoes.iniciar_processo_login_completo(senha=scenario.senha, pin=scenario.pin,
+                                                          pasta_imagens_pin=''))
+    senha = ''.join(key for key in backend.typed(SENHA) if key not in ('tab', 'enter'))
+    pin = ''.join(button for button in backend.clicked_buttons() if button in DIGITS)
+    details = {
+        'tela_final': backend.current.name,
+        'telas': backend.visited,
+        'senha_ok': senha == scenario.senha,
+        'pin_digitado': pin,
+        'capturas': backend.grabs,
+        'espera_simulada_s': round(sleep.total, 2),
+    }
+    success = bool(ok) and backend.current.name == scenario.final and details['senha_ok'] and pin == scenario.pin
+    return success, details
+
+
+def benchmark_reconnect(scenario, locator, sleep, repeat=5):
+    results = []
+
+    def run():
+        results.append(run_reconnect(scenario, locator, sleep))
+        return results[-1]
+
+    walls, cpus, _ = measure(run, repeat)
+    success = all(ok for ok, _ in results)
+    details = next((d for ok, d in results if not ok), results[-1][1])
+    return _row(scenario, 'reconexão completa', scenario.backend.start, walls, cpus, success, **details)
+
+
+def run_cancelled_input(actions):
+    """
+    Interrompe o envio de `actions` em cada espera entre eventos, como o
+    Parar/Reiniciar do bot (OperacaoCancelada); retorna quantas interrupções
+    deixaram tecla, shift ou botão do mouse pressionado.
+    """
+    stuck = 0
+    cancel_at = 1
+    while True:
+        backend = input_backend.RecordingBackend()
+        backend.key_hold = backend.key_gap = backend.move_settle = 0.001  # força uma espera entre eventos
+        backend.shift_wrap = True
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            if len(waits) == cancel_at:
+                raise funcoes.OperacaoCancelada()
+
+        try:
+            input_backend.InputSender(backend, sleep=sleep).send(actions)
+            return stuck  # chegou ao fim sem interrupção: todas as esperas foram testadas
+        except funcoes.OperacaoCancelada:
+            stuck += bool(backend.held())
+        cancel_at += 1
+
+
+def benchmark_cancelled_input(scenario, repeat=5):
+    actions = [input_backend.Click(10, 10), input_backend.Text(scenario.senha + 'A!'), input_backend.Key('enter')]
+    walls, cpus, stuck = measure(lambda: run_cancelled_input(actions), repeat)
+    return _row(scenario, 'entrada cancelada', '-', walls, cpus, stuck == 0, presas=stuck)
+
+
+def run_scenario(scenario, sleep, repeat=5):
+    """Mede os detectores e a reconexão completa de um cenário (com hotspots novos, em memória)"""
+    locator = RegionLocator(hotspots=HotspotIndex(path=None), window_provider=capture.screen_region)
+    rows = benchmark_detectors(scenario, locator, repeat)
+    rows.append(benchmark_reconnect(scenario, locator, sleep, repeat))
+    rows.append(benchmark_cancelled_input(scenario, repeat))
+    return rows
+
+
+def print_rows(rows):
+    print(f"{'cenário':<10} {'detector':<30} {'tela':<13} {'ms':>9} {'p95 ms':>9} {'cpu ms':>9}  ok")
+    for row in rows:
+        print(f"{row['cenario']:<10} {row['detector']:<30} {row['tela']:<13} {row['relogio_ms']:>9.2f} "
+              f"{row['relogio_p95_ms']:>9.2f} {row['cpu_ms']:>9.2f}  {'sim' if row['ok'] else 'NÃO'}")
+        if 'capturas' in row:
+            print(f"{'':<10}   {row['capturas']} capturas, {row['espera_simulada_s']}s de espera simulada, "
+                  f"telas: {' -> '.join(row['telas'])}")
+
+
+def _resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay headless da detecção e do login do bot")
+    parser.add_argument('--resolucoes', default=','.join(f"{w}x{h}" for w, h in RESOLUTIONS),
+                        help="resoluções do cenário sintético, ex: 1280x720,1920x1080")
+    parser.add_argument('--cenario', action='append', default=[],
+                        help="pasta com uma sequência gravada (cenario.json); pode repetir")
+    parser.add_argument('--repeticoes', type=int, default=5, help="execuções medidas por detector")
+    parser.add_argument('--semente', type=int, default=0, help="semente do embaralhamento do teclado")
+    parser.add_argument('--escala-tempo', type=float, default=0.0,
+                        help="fração das esperas do fluxo que é realmente dormida (1 = tempo real)")
+    parser.add_argument('--json', help="grava os resultados neste arquivo")
+    parser.add_argument('--verbose', action='store_true', help="mostra o log do bot")
+    args = parser.parse_args(argv)
+
+    if args.cenario:
+        scenarios = [load_scenario(folder) for folder in args.cenario]
+    else:
+        scenarios = [build_login_scenario(_resolution(text), seed=args.semente)
+                     for text in args.resolucoes.split(',') if text]
+
+    # Pacotes de falha do login (frame_history) ficam aqui; a pasta só é apagada se tudo passar
+    workdir = tempfile.mkdtemp(prefix='replay_')
+    rows = []
+    for scenario in scenarios:
+        _, sleep = install(scenario.backend, args.escala_tempo, workdir, args.verbose)
+        rows.extend(run_scenario(scenario, sleep, args.repeticoes))
+
+    print_rows(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'resultados': rows}, f, ensure_ascii=False, indent=2)
+    failed = [row for row in rows if not row['ok']]
+    if failed:
+        print(f"Erro: {len(failed)} verificação(ões) falharam. Frames das falhas em '{workdir}'.")
+        return 1
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""
+Orquestração assíncrona do monitoramento e da reconexão.
+
+O monitoramento, o login e os comandos (atalho Ctrl+N, botão Parar, fechar a
+janela) rodam como tarefas de um único loop asyncio. Tudo que bloqueia
+(captura, template matching, cliques) é executado em uma thread auxiliar, e as
+esperas entre amostras e tentativas são `asyncio.sleep`, que podem ser
+canceladas a qualquer momento. Parar ou reiniciar o ciclo interrompe também as
+esperas dentro de funcoes.py (veja `funcoes.esperar`), então o efeito é
+imediato em vez de aguardar o fim de um sleep de vários segundos.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyautogui
+
+import funcoes
+import metrics
+from funcoes import OperacaoCancelada, cancelar_operacoes, liberar_operacoes
+from liveness import Escalation, REFOCAR, VIVO
+from scheduler import RetryBackoff
+
+# Comandos aceitos pela fila do runtime
+RESET = 'reset'
+STOP = 'stop'
+
+
+class ReconnectRuntime:
+    """
+    Monitora a desconexão e reconecta o jogo, controlado por comandos thread-safe.
+
+    Uso no console: `asyncio.run(runtime.run())`. Na GUI: `start_in_thread()`,
+    e depois `request_stop()` / `join()`. `request_reset()` reinicia o ciclo de
+    verificação, cancelando um login em andamento.
+    """
+
+    def __init__(self, senha, pin, image_disconnect='desconectado.png', confidence=0.9,
+                 image_focus='ragnarok.png', confidence_focus=0.8, sample_interval=0.5,
+                 max_check_interval=10.0, retry_base=20.0, retry_max=300.0, error_delay=30.0,
+                 cancel_timeout=5.0, login_kwargs=None, net_watch=None, launcher=None,
+                 liveness=None, liveness_interval=1.0, escalation_cooldown=20.0,
+                 log_info=None, log_error=None):
+        self.senha = senha
+        self.pin = pin
+        self.image_disconnect = image_disconnect
+        self.confidence = confidence
+        self.image_focus = image_focus
+        self.confidence_focus = confidence_focus
+        self.sample_interval = sample_interval
+        self.max_check_interval = max_check_interval
+        self.error_delay = error_delay
+        self.cancel_timeout = cancel_timeout
+        self.login_kwargs = login_kwargs or {}
+        self.log_info = log_info or funcoes.log_info
+        self.log_error = log_error or funcoes.log_error
+        self.backoff = RetryBackoff(base=retry_base, max_delay=retry_max)
+        self.watch = None
+        # Vigia opcional das conexões TCP do cliente (net_watch.ConnectionWatch): acusa a
+        # queda sem captura de tela; a vigia por imagem continua rodando como garantia
+        self.net_watch = net_watch
+        # Relançador opcional (relaunch.ClientLauncher): sem processo do cliente, inicia o
+        # executável de novo e faz o login a partir da tela de confirmação
+        self.launcher = launcher
+        # Vigia opcional de travamento (liveness.LivenessMonitor), amostrada a cada
+        # `liveness_interval`; um cliente travado é refocado e, se não voltar, reiniciado
+        # (sem PID, o travamento vem só da imagem e não passa do refoco)
+        self.liveness = liveness
+        self.liveness_interval = liveness_interval
+        self.escalation = Escalation(cooldown=escalation_cooldown)
+        self._last_liveness = None
+        self._restart_warned = False  # erro de "não dá para reiniciar" já registrado neste travamento
+        self.source = None
+        self._loop = None
+        self._commands = None
+        self._executor = None
+        self._inflight = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def running(self):
+        return self._ready.is_set()
+
+    # --- Comandos (podem ser chamados de qualquer thread) ---
+
+    def _send(self, command):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            loop.call_soon_threadsafe(self._commands.put_nowait, command)
+        except RuntimeError:  # loop encerrado entre a verificação e a chamada
+            return False
+        return True
+
+    def request_reset(self):
+        """Reinicia o ciclo de verificação, interrompendo um login em andamento"""
+        cancelar_operacoes()
+        return self._send(RESET)
+
+    def request_stop(self):
+        """Encerra o runtime; as esperas em andamento são interrompidas na hora"""
+        cancelar_operacoes()
+        return self._send(STOP)
+
+    # --- Execução em thread (GUI) ---
+
+    def _run_thread(self):
+        try:
+            asyncio.run(self.run())
+        except Exception as e:
+            self.log_error(f"❌ Erro fatal no runtime: {type(e).__name__} - {e}")
+
+    def start_in_thread(self, timeout=5.0):
+        """Roda o loop asyncio em uma thread própria e retorna quando ele estiver aceitando comandos"""
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run_thread, name='runtime', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        return self._thread
+
+    def join(self, timeout=None):
+        """Aguarda a thread do runtime terminar; retorna True se terminou"""
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    # --- Loop principal ---
+
+    async def _offload(self, fn, *args, **kwargs):
+        """Executa uma chamada bloqueante na thread de automação sem travar o loop"""
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._inflight = future
+        return await asyncio.wrap_future(future)
+
+    async def _interrupt(self, task):
+        """Cancela a tarefa de monitoramento e espera a chamada bloqueante em andamento terminar"""
+        inflight = self._inflight
+        cancelar_operacoes()
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, OperacaoCancelada):
+            pass
+        if inflight is not None and not inflight.done():
+            _, pending = await asyncio.wait([asyncio.wrap_future(inflight)], timeout=self.cancel_timeout)
+            if pending:
+                funcoes.log_aviso("Operação em andamento não terminou em %ss após o cancelamento.", self.cancel_timeout)
+        liberar_operacoes()
+
+    def _reconnect(self):
+        """Foca o jogo e executa o login completo (roda na thread de automação)"""
+        if self.source == 'processo':
+            return funcoes.relancar_cliente(self.launcher, self.senha, self.pin, **self.login_kwargs)
+        if not funcoes.clicar_para_focar_jogo(imagem_alvo_foco=self.image_focus,
+                                              confianca_imagem=self.confidence_focus):
+            self.log_error(f"❌ Falha ao focar no jogo com '{self.image_focus}'.")
+            return False
+        return funcoes.iniciar_processo_login_completo(senha=self.senha, pin=self.pin, **self.login_kwargs)
+
+    def _poll(self):
+        """Confere se o cliente está rodando, depois a sessão TCP (se houver vigia) e a região da imagem"""
+        if self.launcher is not None and not self.launcher.running():
+            self.source = 'processo'
+            return True
+        if self.net_watch is not None and self.net_watch.poll():
+            self.source = 'socket'
+            return True
+        self.source = 'imagem'
+        return self.watch.poll()
+
+    def _check_liveness(self):
+        """Amostra a vigia de travamento (se for a hora); retorna (estado, ação da escalada)"""
+        now = time.monotonic()
+        if self._last_liveness is not None and now - self._last_liveness < self.liveness_interval:
+            return VIVO, None
+        self._last_liveness = now
+        state = self.liveness.sample()
+        if state == VIVO:
+            self._restart_warned = False
+        return state, self.escalation.next(state, self.liveness.confirmed)
+
+    def _recover(self, state, action):
+        """Executa a ação da escalada para um cliente travado (roda na thread de automação)"""
+        if action != REFOCAR and self.launcher is None:
+            # Sem executável não há o que fazer além de refocar: avisa uma vez por travamento
+            if not self._restart_warned:
+                self._restart_warned = True
+                self.log_error("❌ Cliente continua travado e não há executável configurado para reiniciá-lo.")
+            return False
+        funcoes.log_evento('travamento', f"⚠️ Cliente {state.replace('_', ' ')}. Ação: {action}.",
+                           nivel=logging.WARNING, estado=state, acao=action, **self.liveness.stats())
+        metrics.metrics().inc('ragnarok_liveness_actions_total', estado=state, acao=action)
+        if action == REFOCAR:
+            return funcoes.focar_janela_jogo()
+        funcoes.encerrar_aplicativo_jogo(self.launcher.window_title)
+        self.liveness.reset()
+        return funcoes.relancar_cliente(self.launcher, self.senha, self.pin, **self.login_kwargs)
+
+    async def _liveness_step(self):
+        state, action = await self._offload(self._check_liveness)
+        if action is None:
+            return
+        ok = await self._offload(self._recover, state, action)
+        if ok and action != REFOCAR:
+            self._reset_watches()  # cliente reiniciado: vigias começam do zero
+
+    def _reset_watches(self):
+        self.watch.reset()
+        if self.net_watch is not None:
+            self.net_watch.reset()
+        if self.liveness is not None:
+            self.liveness.reset()
+            self.escalation.reset()
+
+    async def _monitor(self):
+        if self.watch is None:
+            self.watch = await self._offload(
+                funcoes.criar_vigia_desconexao, image_path=self.image_disconnect, confidence=self.confidence,
+                sample_interval=self.sample_interval, max_check_interval=self.max_check_interval)
+        self._reset_watches()
+        ultimo_status = 0.0
+
+        while True:
+            try:
+                # Template matching só quando a região muda (ou a cada max_check_interval)
+                desconectado = await self._offload(self._poll)
+                if desconectado:
+                    self.log_info(f"🔌 Desconexão detectada ({self.source})! Iniciando processo de reconexão...")
+                    m = metrics.metrics()
+                    if self.source == 'socket':
+                        detect_gap = time.monotonic() - self.net_watch.dropped_at
+                    elif self.source == 'processo':
+                        detect_gap = None
+                    else:
+                        detect_gap = self.watch.check_gap
+                    if detect_gap is not None:
+                        m.observe('ragnarok_detect_seconds', detect_gap, fonte=self.source)
+                    inicio = time.monotonic()
+                    login_sucesso = await self._offload(self._reconnect)
+                    duracao = time.monotonic() - inicio
+                    resultado = 'sucesso' if login_sucesso else 'falha'
+                    m.observe('ragnarok_reconnect_seconds', duracao, resultado=resultado)
+                    m.inc('ragnarok_reconnects_total', resultado=resultado)
+                    m.event('reconnect', ok=bool(login_sucesso), duration_s=round(duracao, 3),
+                            detect_gap_s=detect_gap, source=self.source, failures=self.backoff.failures)
+                    self._reset_watches()
+                    if login_sucesso:
+                        self.log_info("✅ Reconexão realizada com sucesso!")
+                        self.backoff.reset()
+                    else:
+                        espera = self.backoff.next_delay()
+                        self.log_error(f"❌ Falha na reconexão ({self.backoff.failures}ª seguida). "
+                                       f"Tentando novamente em {espera:.0f}s...")
+                        await asyncio.sleep(espera)
+                        continue
+                else:
+                    if self.liveness is not None:
+                        await self._liveness_step()
+                    vivo = self.liveness is None or self.liveness.state == VIVO
+                    if desconectado is False and vivo and time.monotonic() - ultimo_status >= self.max_check_interval:
+                        ultimo_status = time.monotonic()
+                        funcoes.log_status("Jogo aparentemente conectado. Amostrando a região de desconexão "
+                                           "a cada %ss.", self.sample_interval)
+                await asyncio.sleep(self.sample_interval)
+            except pyautogui.FailSafeException:
+                self.log_error("Fail-safe do PyAutoGUI ativado (mouse no canto superior esquerdo). Encerrando.")
+                self._commands.put_nowait(STOP)
+                return
+            except Exception as e:
+                self.log_error(f"❌ Erro no loop de monitoramento: {type(e).__name__} - {e}. "
+                               f"Aguardando {self.error_delay:.0f}s...")
+                await asyncio.sleep(self.error_delay)
+
+    async def run(self):
+        """Executa o monitoramento até receber STOP"""
+        self._loop = asyncio.get_running_loop()
+        self._commands = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='automacao')
+        liberar_operacoes()
+        monitor = asyncio.create_task(self._monitor())
+        self._ready.set()
+        self.log_info("🔍 Iniciando monitoramento de desconexão...")
+        try:
+            while True:
+                command = await self._commands.get()
+                if command == STOP:
+                    break
+                if command == RESET:
+                    started = time.monotonic()
+                    await self._interrupt(monitor)
+                    self.log_info(f"🔄 Ciclo de verificação reiniciado em {(time.monotonic() - started) * 1000:.0f}ms.")
+                    monitor = asyncio.create_task(self._monitor())
+        finally:
+            await self._interrupt(monitor)
+            self._executor.shutdown(wait=False)
+            self._ready.clear()
+            self._loop = None
+            self.log_info("⏹️ Loop de monitoramento finalizado")
@@ -0,0 +1,110 @@
+"""
+Cadência adaptativa do monitoramento de desconexão.
+
+Em vez de rodar o template matching a cada 10 segundos, a vigia amostra a
+região do diálogo de desconexão várias vezes por segundo comparando apenas uma
+miniatura da região. O matching completo só roda quando a região muda (ou a
+cada `max_check_interval` como garantia). Depois de falhas de login seguidas,
+o tempo até a próxima tentativa cresce exponencialmente, com jitter.
+"""
+import random
+import time
+
+import numpy as np
+
+from capture import grab as grab_region
+from matcher import region_signature
+
+
+class RetryBackoff:
+    """Atraso exponencial com jitter entre tentativas de login que falharam"""
+
+    def __init__(self, base=20.0, factor=2.0, max_delay=300.0, jitter=0.25, rng=random.random):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.rng = rng
+        self.failures = 0
+
+    def next_delay(self):
+        """Registra uma falha e retorna quantos segundos esperar antes da próxima tentativa"""
+        delay = min(self.base * (self.factor ** self.failures), self.max_delay)
+        self.failures += 1
+        return max(0.0, delay * (1.0 + self.jitter * (2.0 * self.rng() - 1.0)))
+
+    def reset(self):
+        self.failures = 0
+
+
+class DisconnectWatch:
+    """
+    Vigia barata da região onde o diálogo de desconexão aparece.
+
+    poll() retorna True (desconectado), False (verificado e conectado) ou None
+    (região sem mudança, nenhuma verificação feita nesta amostra).
+
+    Enquanto `learned()` retornar False (ainda não se sabe onde o diálogo
+    aparece, então a região amostrada é só uma aproximação e muda com o jogo),
+    as verificações disparadas por mudança ficam espaçadas por
+    `cold_check_interval` em vez de `min_check_interval`.
+    """
+
+    def __init__(self, check, region_provider, sample_interval=0.5, min_check_interval=0.5,
+                 max_check_interval=10.0, tolerance=2.0, signature_size=16,
+                 cold_check_interval=None, learned=None, grab=grab_region, clock=time.monotonic):
+        self.check = check
+        self.region_provider = region_provider
+        self.sample_interval = sample_interval
+        self.min_check_interval = min_check_interval
+        self.max_check_interval = max_check_interval
+        self.cold_check_interval = cold_check_interval
+        self.learned = learned
+        self.tolerance = tolerance
+        self.signature_size = signature_size
+        self.grab = grab
+        self.clock = clock
+        self.samples = 0
+        self.checks = 0
+        self.check_gap = None  # segundos desde a verificação anterior, na última verificação
+        self.reset()
+
+    def reset(self):
+        """Esquece o estado da região (força uma verificação na próxima amostra)"""
+        self._signature = None
+        self._region = None
+        self._pending = True
+        self._last_check = None
+
+    def _changed(self, region, signature):
+        if self._signature is None or region != self._region or signature.shape != self._signature.shape:
+            return True
+        return float(np.abs(signature - self._signature).mean()) > self.tolerance
+
+    def _min_interval(self):
+        if self.cold_check_interval is None or self.learned is None or self.learned():
+            return self.min_check_interval
+        return self.cold_check_interval
+
+    def poll(self):
+        now = self.clock()
+        region = self.region_provider()
+        image, _ = self.grab(region)
+        signature = region_signature(image, self.signature_size)
+        self.samples += 1
+
+        if self._changed(region, signature):
+            self._pending = True
+        self._signature, self._region = signature, region
+
+        since_check = None if self._last_check is None else now - self._last_check
+        due = since_check is None or since_check >= self.max_check_interval
+        allowed = since_check is None or since_check >= self._min_interval()
+        if not (due or (self._pending and allowed)):
+            return None
+
+        self._pending = False
+        self.check_gap = since_check
+        self._last_check = now
+        self.checks += 1
+        return bool(self.check())
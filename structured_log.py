@@ -0,0 +1,145 @@
+"""
+Logging estruturado do bot, compartilhado por console, arquivo e GUI.
+
+Todas as mensagens passam pelo logger 'ragnarok' (e seus filhos, ex:
+'ragnarok.metrics'), que tem um único QueueHandler: quem registra só coloca o
+registro em uma fila em memória, sem nunca bloquear em I/O. Um QueueListener
+em outra thread formata e entrega cada registro ao console, ao arquivo
+rotativo e/ou ao arquivo JSON lines. Níveis desligados são descartados pelo
+próprio logging antes de qualquer formatação (use argumentos no estilo
+`log.info("... %s", valor)` em caminhos quentes para adiar também a
+interpolação).
+
+Eventos podem levar campos tipados (passo, template, confiança, duração...),
+passados em `extra={'fields': {...}}` ou por `event()`: no console e no
+arquivo de texto eles aparecem como `chave=valor` depois da mensagem; no
+arquivo JSON lines cada campo mantém seu tipo.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOGGER_NAME = 'ragnarok'
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CONSOLE_FORMAT = '[%(asctime)s] [%(levelname)s] %(message)s'
+
+
+def logger(name=None):
+    """Logger do bot (ou o filho `name`, ex: 'metrics' -> 'ragnarok.metrics')"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def event(log, name, message=None, level=logging.INFO, **fields):
+    """Registra o evento `name` com campos tipados; nada é montado se o nível estiver desligado"""
+    if log.isEnabledFor(level):
+        fields['event'] = name
+        log.log(level, message or name, extra={'fields': fields})
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    text = str(value)
+    return f'"{text}"' if ' ' in text else text
+
+
+class FieldFormatter(logging.Formatter):
+    """Formato de texto com os campos do registro no fim: `mensagem | chave=valor ...`"""
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' | ' + ' '.join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos tipados no nível de cima"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _Pipeline:
+    """Fila + listener ativos (um por processo)"""
+
+    def __init__(self):
+        self.queue = None
+        self.handler = None
+        self.listener = None
+        self.outputs = ()
+
+    def stop(self):
+        if self.handler is not None:
+            logger().removeHandler(self.handler)
+            self.handler = None
+        if self.listener is not None:
+            self.listener.stop()  # entrega o que ainda estiver na fila
+            self.listener = None
+        for handler in self.outputs:
+            handler.close()
+        self.outputs = ()
+
+
+_pipeline = _Pipeline()
+atexit.register(_pipeline.stop)
+
+
+def setup(level=logging.INFO, console=True, file=None, json_file=None, max_bytes=10 * 1024 * 1024,
+          backups=5, handlers=()):
+    """
+    (Re)configura as saídas do logger 'ragnarok'.
+
+    - `console`: mensagens no terminal;
+    - `file`: arquivo de texto rotativo (`max_bytes`, `backups`);
+    - `json_file`: arquivo JSON lines com os campos tipados;
+    - `handlers`: outras saídas (logging.Handler); rodam na thread do listener.
+    Retorna o logger.
+    """
+    _pipeline.stop()
+    outputs = []
+    if console:
+        stream = logging.StreamHandler()
+        stream.setFormatter(FieldFormatter(CONSOLE_FORMAT, datefmt='%H:%M:%S'))
+        outputs.append(stream)
+    for path, formatter in ((file, FieldFormatter(TEXT_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')),
+                            (json_file, JsonFormatter())):
+        if not path:
+            continue
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        output = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        output.setFormatter(formatter)
+        outputs.append(output)
+    outputs.extend(handlers)
+
+    log = logger()
+    log.setLevel(level)
+    log.propagate = False
+    _pipeline.queue = queue.SimpleQueue()  # sem limite: put() nunca bloqueia quem registra
+    _pipeline.handler = QueueHandler(_pipeline.queue)
+    _pipeline.outputs = tuple(outputs)
+    _pipeline.listener = QueueListener(_pipeline.queue, *outputs, respect_handler_level=True)
+    log.addHandler(_pipeline.handler)
+    _pipeline.listener.start()
+    return log
+
+
+def shutdown():
+    """Para o listener depois de entregar os registros pendentes (chamado também na saída)"""
+    _pipeline.stop()
+
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Supervisor de vários clientes do Ragnarok em um único processo.
+
+Enumera todas as janelas com o título do jogo, associa a cada uma suas
+próprias credenciais e estado, e vigia todas a partir de um único loop de
+captura. As reconexões rodam em threads, mas passam por uma única trava de
+entrada (mouse/teclado), então dois clientes nunca disputam o mouse.
+Como a captura lê os pixels da tela, as janelas não devem se sobrepor.
+
+Uso: python supervisor.py clientes.json
+
+Formato de clientes.json:
+{
+    "titulo_janela": "Ragnarok",
+    "clientes": [
+        {"nome": "Loja 1", "senha": "senha1", "pin": "1234"},
+        {"nome": "Loja 2", "senha": "senha2", "pin": "5678", "titulo": "Ragnarok - Loja 2"},
+        {"nome": "Loja 3", "senha": "senha3", "pin": "9012", "executavel": "C:\\Gravity\\Ragexe.exe"}
+    ],
+    "relancamentos_paralelos": 2
+}
+Clientes com "titulo" ficam com a janela de título exatamente igual; os
+demais são associados às janelas restantes na ordem em que são enumeradas.
+
+Clientes com "executavel" (e, opcionalmente, "argumentos") são relançados
+quando o processo deles fecha ou a janela não existe: até
+"relancamentos_paralelos" (padrão 2) clientes são iniciados ao mesmo tempo, e
+o login de cada um começa na tela de confirmação assim que a janela aparece.
+
+O centro de cada janela também é amostrado a cada `liveness_interval`
+segundos (um frame para todos os clientes) para detectar clientes travados:
+congelados ou com tela preta/branca são refocados e, se não voltarem,
+encerrados e relançados.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pyautogui
+
+import funcoes
+from batch_detector import BatchDisconnectDetector, union_region
+from capture import RegionLocator, crop_view, grab
+from hotspots import HotspotIndex
+from liveness import Escalation, LivenessMonitor, REFOCAR, VIVO, central_region
+from login_flow import CONFIRMAR
+from relaunch import RelaunchPool
+from scheduler import RetryBackoff
+from funcoes import log_info, log_error, log_aviso
+
+# Estados de cada cliente
+CONECTADO = 'conectado'
+RECONECTANDO = 'reconectando'
+AGUARDANDO = 'aguardando'  # login falhou, esperando o backoff para tentar de novo
+
+ClientConfig = namedtuple('ClientConfig', ['nome', 'senha', 'pin', 'titulo', 'executavel', 'argumentos'],
+                          defaults=(None, None, ()))
+
+
+def window_id(window):
+    """Identificador estável de uma janela (hWnd no Windows)"""
+    return getattr(window, '_hWnd', None) or id(window)
+
+
+class GameClient:
+    """Uma janela do jogo com suas credenciais, localizador e estado"""
+
+    def __init__(self, window, config, hotspots, retry_base, retry_max):
+        self.id = window_id(window)
+        self.window = window
+        self.config = config
+        # Só a janela deste cliente: um acerto fora dela seria a tela de outro cliente
+        self.locator = RegionLocator(hotspots=hotspots, window_provider=self.region, full_screen=False)
+        self.backoff = RetryBackoff(base=retry_base, max_delay=retry_max)
+        self.state = CONECTADO
+        self.next_attempt = 0.0
+        self.future = None
+        self.pid = funcoes.processos_jogo().pid_for_window(window)  # None fora do Windows
+        self.liveness = LivenessMonitor(lambda: central_region(self.region()), pid_provider=lambda: self.pid)
+        self.escalation = Escalation()
+        self.restart_warned = False  # erro de "não dá para reiniciar" já registrado neste travamento
+
+    @property
+    def nome(self):
+        return self.config.nome
+
+    def region(self):
+        """Retângulo atual da janela, ou None se ela estiver minimizada/fechada"""
+        try:
+            if getattr(self.window, 'isMinimized', False) or self.window.width <= 0:
+                return None
+            return (self.window.left, self.window.top, self.window.width, self.window.height)
+        except Exception:
+            return None
+
+    def activate(self):
+        try:
+            self.window.activate()
+        except Exception as e:
+            log_aviso("[%s] Não foi possível ativar a janela: %s", self.nome, e)
+
+
+class ClientSupervisor:
+    """
+    Vigia todos os clientes em um loop e serializa as reconexões pela trava de entrada.
+
+    A cada passada, um único frame cobrindo todas as janelas é analisado pelo
+    BatchDisconnectDetector, então verificar N clientes custa quase o mesmo que
+    verificar um.
+    """
+
+    def __init__(self, window_title, configs, image_disconnect='desconectado.png', confidence=0.9,
+                 sample_interval=0.5, max_check_interval=10.0, retry_base=20.0, retry_max=300.0,
+                 discover_interval=30.0, login_kwargs=None, max_relaunches=2, window_timeout=60.0,
+                 liveness_interval=1.0):
+        self.window_title = window_title
+        self.configs = list(configs)
+        self.image_disconnect = image_disconnect
+        self.confidence = confidence
+        self.sample_interval = sample_interval
+        self.max_check_interval = max_check_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.discover_interval = discover_interval
+        self.login_kwargs = login_kwargs or {}
+        self.hotspots = HotspotIndex()  # posições relativas à janela valem para todos os clientes
+        self.detector = BatchDisconnectDetector(image_disconnect, confidence, hotspots=self.hotspots,
+                                                full_check_interval=max_check_interval,
+                                                min_check_interval=sample_interval)
+        self.input_lock = threading.Lock()
+        self.clients = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.configs)),
+                                            thread_name_prefix='reconexao')
+        self._last_discover = None
+        self.window_timeout = window_timeout
+        self.relaunch_pool = RelaunchPool(max_relaunches)
+        self.relaunches = {}       # nome -> future do relançamento em andamento
+        self.relaunch_backoff = {}  # nome -> RetryBackoff entre relançamentos que falharam
+        self.relaunch_after = {}   # nome -> instante mínimo do próximo relançamento
+        self.liveness_interval = liveness_interval
+        self._last_liveness = None
+        # Executáveis configurados contam como clientes (PID das janelas, detecção de crash)
+        funcoes.processos_jogo().add_names(*(os.path.basename(c.executavel) for c in self.configs if c.executavel))
+
+    def _assign(self, windows):
+        """
+        Associa configurações às janelas: janelas já supervisionadas mantêm a
+        sua; as novas ficam primeiro com o título exato, depois por ordem.
+        """
+        assigned = {}
+        free = []
+        in_use = set()
+        for window in windows:
+            client = self.clients.get(window_id(window))
+            if client:
+                assigned[client.id] = (window, client.config)
+                in_use.add(client.nome)
+        by_title = {c.titulo: c for c in self.configs if c.titulo and c.nome not in in_use}
+        for window in windows:
+            if window_id(window) in assigned:
+                continue
+            config = by_title.pop(getattr(window, 'title', None), None)
+            if config:
+                assigned[window_id(window)] = (window, config)
+            else:
+                free.append(window)
+        remaining = [c for c in self.configs if not c.titulo and c.nome not in in_use]
+        for window, config in zip(free, remaining):
+            assigned[window_id(window)] = (window, config)
+        for window in free[len(remaining):]:
+            log_aviso("Janela '%s' sem credenciais configuradas. Ignorada.", getattr(window, 'title', '?'))
+        return assigned
+
+    def discover(self):
+        """Atualiza a lista de clientes a partir das janelas abertas"""
+        self._last_discover = time.monotonic()
+        try:
+            windows = pyautogui.getWindowsWithTitle(self.window_title)
+        except Exception as e:
+            log_error("Erro ao enumerar janelas '%s': %s", self.window_title, e)
+            return
+        assigned = self._assign(windows)
+
+        for cid in [cid for cid in self.clients if cid not in assigned]:
+            client = self.clients[cid]
+            if client.state != RECONECTANDO:
+                log_aviso("[%s] Janela fechada. Cliente removido da supervisão.", client.nome)
+                self.detector.unregister(cid)
+                del self.clients[cid]
+
+        # Enquanto há relançamentos em andamento, a janela nova é registrada por quem a relançou
+        for cid, (window, config) in assigned.items():
+            if cid not in self.clients and not self.relaunches:
+                self._register(GameClient(window, config, self.hotspots, self.retry_base, self.retry_max))
+
+        active = {c.nome for c in self.clients.values()}
+        for config in self.configs:
+            if config.executavel and config.nome not in active:
+                self._schedule_relaunch(config)
+
+    def _register(self, client):
+        self.clients[client.id] = client
+        self.detector.register(client.id, client.region)
+        log_info("[%s] Cliente registrado (janela %s).", client.nome, client.id)
+
+    def _drop(self, client):
+        self.detector.unregister(client.id)
+        self.clients.pop(client.id, None)
+
+    def _schedule_relaunch(self, config):
+        """Agenda o relançamento do cliente (no máximo um por configuração)"""
+        if config.nome in self.relaunches or time.monotonic() < self.relaunch_after.get(config.nome, 0.0):
+            return
+        log_aviso("[%s] Cliente sem processo/janela. Relançando '%s'...", config.nome, config.executavel)
+        self.relaunches[config.nome] = self.relaunch_pool.submit(self._relaunch, config)
+
+    def _relaunch(self, config):
+        """Inicia o cliente (em paralelo com outros) e faz o login pela trava de entrada"""
+        launcher = funcoes.criar_relancador(config.executavel, config.argumentos,
+                                            titulo_janela=config.titulo or self.window_title,
+                                            tempo_janela=self.window_timeout)
+        launched = launcher.start()
+        if launched is None:
+            log_error("[%s] A janela do cliente não apareceu em %.0fs.", config.nome, self.window_timeout)
+            return None, False
+        log_info("[%s] Janela pronta em %.1fs (PID %s).", config.nome, launched.seconds, launched.pid)
+        client = GameClient(launched.window, config, self.hotspots, self.retry_base, self.retry_max)
+        with self.input_lock:
+            client.activate()
+            with funcoes.usar_localizador(client.locator):
+                ok = funcoes.iniciar_processo_login_completo(
+                    senha=config.senha, pin=config.pin, pasta_imagens_pin='',
+                    estado_inicial=CONFIRMAR, **self.login_kwargs)
+        return client, ok
+
+    def _finish_relaunch(self, nome, future):
+        """Registra o cliente relançado ou agenda uma nova tentativa"""
+        backoff = self.relaunch_backoff.setdefault(nome, RetryBackoff(base=self.retry_base, max_delay=self.retry_max))
+        try:
+            client, ok = future.result()
+        except Exception as e:
+            log_error("[%s] Erro inesperado no relançamento: %s - %s", nome, type(e).__name__, e)
+            client, ok = None, False
+        if client is None:
+            espera = backoff.next_delay()
+            log_error("[%s] ❌ Falha ao relançar o cliente. Nova tentativa em %.0fs.", nome, espera)
+            self.relaunch_after[nome] = time.monotonic() + espera
+            return
+        backoff.reset()
+        self._register(client)
+        if ok:
+            log_info("[%s] ✅ Cliente relançado e conectado!", nome)
+        else:
+            espera = client.backoff.next_delay()
+            log_error("[%s] ❌ Login após o relançamento falhou. Nova tentativa em %.0fs.", nome, espera)
+            client.next_attempt = time.monotonic() + espera
+            client.state = AGUARDANDO
+
+    def _reconnect(self, client):
+        """Reconecta um cliente; só um cliente usa mouse/teclado por vez"""
+        with self.input_lock:
+            log_info("[%s] Iniciando reconexão...", client.nome)
+            client.activate()
+            with funcoes.usar_localizador(client.locator):
+                if not funcoes.clicar_para_focar_jogo(imagem_alvo_foco='ragnarok.png', confianca_imagem=0.8):
+                    return False
+                return funcoes.iniciar_processo_login_completo(
+                    senha=client.config.senha, pin=client.config.pin,
+                    pasta_imagens_pin='', **self.login_kwargs)
+
+    def _finish(self, client):
+        """Processa o resultado de uma reconexão terminada"""
+        try:
+            ok = client.future.result()
+        except Exception as e:
+            log_error("[%s] Erro inesperado na reconexão: %s - %s", client.nome, type(e).__name__, e)
+            ok = False
+        client.future = None
+        if ok:
+            log_info("[%s] ✅ Reconexão realizada com sucesso!", client.nome)
+            client.backoff.reset()
+            client.state = CONECTADO
+        else:
+            espera = client.backoff.next_delay()
+            log_error("[%s] ❌ Falha na reconexão. Nova tentativa em %.0fs.", client.nome, espera)
+            client.next_attempt = time.monotonic() + espera
+            client.state = AGUARDANDO
+
+    def _sample_liveness(self, clients):
+        """Amostra o centro de todas as janelas a partir de um único frame e escala os travados"""
+        regions = {c.id: central_region(c.region()) for c in clients}
+        regions = {cid: region for cid, region in regions.items() if region}
+        if not regions:
+            return
+        frame, origin = grab(union_region(list(regions.values())))
+        for client in clients:
+            region = regions.get(client.id)
+            view = crop_view(frame, origin, region)[0] if region else None
+            if view is None:
+                continue
+            state = client.liveness.sample(view)
+            if state == VIVO:
+                client.restart_warned = False
+            action = client.escalation.next(state, client.liveness.confirmed)
+            if action:
+                self._recover(client, state, action)
+
+    def _recover(self, client, state, action):
+        if action != REFOCAR and (not client.config.executavel or client.pid is None):
+            # Sem como reiniciar, só o refoco já feito: avisa uma vez por travamento
+            if not client.restart_warned:
+                client.restart_warned = True
+                log_error("[%s] Cliente continua travado e não pode ser reiniciado "
+                          "(sem 'executavel' configurado ou PID desconhecido).", client.nome)
+            return
+        log_aviso("[%s] ⚠️ Cliente %s (%s). Ação: %s.",
+                  client.nome, state.replace('_', ' '), client.liveness.stats(), action)
+        if action == REFOCAR:
+            # Sem disputar o mouse/teclado com um login em andamento
+            if self.input_lock.acquire(blocking=False):
+                try:
+                    client.activate()
+                finally:
+                    self.input_lock.release()
+            return
+        self._drop(client)
+        self.relaunches[client.nome] = self.relaunch_pool.submit(self._restart, client)
+
+    def _restart(self, client):
+        """Encerra o processo travado e relança o cliente"""
+        _, alive = funcoes.processos_jogo().terminate([client.pid])
+        if alive:
+            log_error("[%s] Não foi possível encerrar o processo travado (PID %s).", client.nome, client.pid)
+        return self._relaunch(client.config)
+
+    def tick(self):
+        """Uma passada do loop: verifica todos os clientes que não estão reconectando"""
+        for nome, future in list(self.relaunches.items()):
+            if future.done():
+                del self.relaunches[nome]
+                self._finish_relaunch(nome, future)
+        if self._last_discover is None or time.monotonic() - self._last_discover >= self.discover_interval:
+            self.discover()
+
+        # Processo do cliente encerrado (crash): O(1) pelo índice de processos, sem esperar o discover
+        processos = funcoes.processos_jogo()
+        for client in list(self.clients.values()):
+            if client.pid is not None and client.state != RECONECTANDO and client.pid not in processos:
+                log_aviso("[%s] Processo do cliente (PID %s) encerrado.", client.nome, client.pid)
+                self._drop(client)
+                if client.config.executavel:
+                    self._schedule_relaunch(client.config)
+        now = time.monotonic()
+        idle = []
+        retry = []
+        for client in list(self.clients.values()):
+            if client.state == RECONECTANDO:
+                if client.future.done():
+                    self._finish(client)
+                continue
+            if client.state == AGUARDANDO:
+                if now >= client.next_attempt:
+                    retry.append(client)
+                continue
+            idle.append(client)
+
+        # Um frame, uma conversão para cinza e uma busca por janela para todos os clientes ociosos
+        disconnected = self.detector.detect([c.id for c in idle]) if idle else set()
+        if self._last_liveness is None or now - self._last_liveness >= self.liveness_interval:
+            self._last_liveness = now
+            self._sample_liveness([c for c in idle if c.id not in disconnected])
+        for client in [c for c in idle if c.id in disconnected] + retry:
+            if client.region() is None:
+                continue
+            log_info("[%s] 🔌 Desconexão detectada. Reconexão agendada.", client.nome)
+            client.state = RECONECTANDO
+            client.future = self._executor.submit(self._reconnect, client)
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        log_info("Supervisor iniciado para janelas '%s' (%s clientes configurados).",
+                 self.window_title, len(self.configs))
+        try:
+            while not stop_event.is_set():
+                try:
+                    self.tick()
+                except Exception as e:
+                    # Um erro em uma passada não derruba a supervisão dos demais clientes
+                    log_error("Erro inesperado no loop do supervisor: %s - %s", type(e).__name__, e)
+                stop_event.wait(self.sample_interval)
+        finally:
+            self._executor.shutdown(wait=False)
+            self.relaunch_pool.shutdown(wait=False)
+            log_info("Supervisor finalizado.")
+
+
+def load_config(path):
+    """Lê o arquivo de clientes e retorna (titulo_janela, [ClientConfig], relancamentos_paralelos)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    configs = [ClientConfig(c['nome'], c['senha'], str(c['pin']), c.get('titulo'),
+                            c.get('executavel'), tuple(c.get('argumentos', ())))
+               for c in data.get('clientes', [])]
+    return data.get('titulo_janela', 'Ragnarok'), configs, data.get('relancamentos_paralelos', 2)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python supervisor.py clientes.json")
+        sys.exit(1)
+    window_title, configs, max_relaunches = load_config(sys.argv[1])
+    for config in configs:
+        if not (config.pin.isdigit() and len(config.pin) == 4):
+            log_error("[%s] PIN inválido: deve ter 4 dígitos numéricos.", config.nome)
+            sys.exit(1)
+
+    # Necessário para que os cliques do PIN funcionem corretamente
+    try:
+        import interception
+        interception.auto_capture_devices(keyboard=True, mouse=True)
+        log_info("Interception inicializado com sucesso!")
+    except ImportError:
+        log_aviso("Interception não disponível. Usando PyAutoGUI como fallback.")
+    except Exception as e:
+        log_error("Erro ao inicializar Interception: %s", e)
+    # Sem janela global: cada cliente busca pela própria janela
+    funcoes.configurar_runtime(idade_frame=0.25)
+    try:
+        ClientSupervisor(window_title, configs, max_relaunches=max_relaunches).run()
+    except KeyboardInterrupt:
+        log_info("Supervisor interrompido pelo usuário (Ctrl+C).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Gerador de frames sintéticos rotulados e benchmark de precisão/revocação do matching.
+
+Cada frame é uma tela inteira montada com as imagens do bot (0-9.png,
+confirmar.png, avatar_pin.png, desconectado.png, senha.png, jogar.png,
+ragnarok.png): a janela do jogo fica em uma posição sorteada dentro da área
+de trabalho, o diálogo (teclado do PIN embaralhado, aviso de desconexão, tela
+de senha, botão Jogar ou nenhum) em uma posição sorteada dentro da janela, e a
+interface pode ser escalada, receber ruído e artefatos de JPEG. Cada frame vem
+com a posição verdadeira (centro e tamanho) de cada imagem colada.
+
+O benchmark roda sobre esses frames, para cada limiar de confiança:
+- find_all_template_matches com os templates do teclado (dígitos e Confirmar),
+  na janela do jogo, como a digitação do PIN faz;
+- as buscas de tela do login (RegionLocator.locate), uma por template;
+e mostra verdadeiros/falsos positivos, falsos negativos, precisão, revocação e
+tempo por frame. Uma detecção só conta como acerto se o centro estiver a até
+um quarto do lado menor do template da posição verdadeira.
+
+Uso (na pasta das imagens do bot):
+    python synthetic.py
+    python synthetic.py --quantidade 100 --resolucoes 1280x720,2560x1440 --escalas 0.9,1.0,1.1 --jpeg 0,60
+    python synthetic.py --gerar frames_sinteticos --quantidade 500   # só grava os frames e rotulos.jsonl
+    python synthetic.py --pasta frames_sinteticos --limiares 0.65,0.7,0.75 --json resultado.json
+    python synthetic.py --cinza    # buscas de tela em tons de cinza, para comparar com as em cores
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+import capture
+import funcoes
+import template_registry
+from capture import RegionLocator, ReplayBackend, crop_view
+from hotspots import HotspotIndex
+from replay import DIGITS, background, paste, use_quiet_log
+
+RESOLUTIONS = ((1280, 720), (1920, 1080), (2560, 1440))
+KINDS = ('pin', 'desconectado', 'senha', 'selecao', 'em_jogo')
+THRESHOLDS = (0.6, 0.7, 0.8, 0.9)
+KEYPAD = DIGITS + ['confirmar']
+PROBES = ('desconectado', 'confirmar', 'senha', 'avatar_pin', 'jogar', 'ragnarok')
+LABELS_FILE = 'rotulos.jsonl'
+
+# Posição verdadeira de uma imagem no frame: centro e tamanho, em coordenadas de tela
+Label = namedtuple('Label', ['key', 'x', 'y', 'width', 'height'])
+# Frame gerado: imagem BGR, rótulos e parâmetros sorteados (tipo, resolução, janela, escala, ruído, jpeg)
+SyntheticFrame = namedtuple('SyntheticFrame', ['image', 'labels', 'params'])
+
+
+class FrameGenerator:
+    """
+    Sorteia frames de tela inteira a partir das imagens do bot em `assets`.
+
+    - `resolutions`: resoluções da área de trabalho;
+    - `kinds`: telas possíveis ('pin', 'desconectado', 'senha', 'selecao', 'em_jogo');
+    - `scales`: escalas da interface do jogo (1.0 = tamanho dos templates);
+    - `noise`: faixa (mín, máx) do desvio padrão do ruído gaussiano;
+    - `jpeg_qualities`: qualidades JPEG sorteadas (None = sem compressão).
+    """
+
+    def __init__(self, assets='.', resolutions=RESOLUTIONS, kinds=KINDS, scales=(1.0,), noise=(0.0, 6.0),
+                 jpeg_qualities=(None, 90, 70), seed=0):
+        self.assets = assets
+        self.resolutions = list(resolutions)
+        self.kinds = list(kinds)
+        self.scales = list(scales)
+        self.noise = noise
+        self.jpeg_qualities = list(jpeg_qualities)
+        self.rng = np.random.default_rng(seed)
+        self._images = {}
+
+    def _choice(self, options):
+        return options[int(self.rng.integers(len(options)))]
+
+    def _image(self, key, scale):
+        cached = self._images.get((key, scale))
+        if cached is None:
+            path = os.path.join(self.assets, f"{key}.png")
+            cached = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if cached is None:
+                raise FileNotFoundError(f"Imagem '{path}' não encontrada ou inválida")
+            if scale != 1.0:
+                height, width = cached.shape[:2]
+                cached = cv2.resize(cached, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                    interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+            self._images[(key, scale)] = cached
+        return cached
+
+    def _layout(self, kind, scale):
+        """Imagens do diálogo com posições relativas ao seu canto, e painéis escuros (x, y, w, h)"""
+        def size(value):
+            return int(round(value * scale))
+
+        items, panels = [], []
+        if kind == 'desconectado':
+            aviso, confirmar = self._image('desconectado', scale), self._image('confirmar', scale)
+            items.append(('desconectado', aviso, 0, 0))
+            items.append(('confirmar', confirmar, (aviso.shape[1] - confirmar.shape[1]) // 2,
+                          aviso.shape[0] + size(30)))
+        elif kind == 'senha':
+            items.append(('senha', self._image('senha', scale), 0, 0))
+        elif kind == 'selecao':
+            items.append(('jogar', self._image('jogar', scale), 0, 0))
+        elif kind == 'pin':
+            avatar = self._image('avatar_pin', scale)
+            items.append(('avatar_pin', avatar, 0, 0))
+            cell_w, cell_h = size(60), size(56)
+            left, top = avatar.shape[1] + size(40), size(25)
+            cells = self.rng.permutation(12)  # 10 dígitos e 2 casas vazias, embaralhados
+            panels.append((left - size(10), top - size(10), 3 * cell_w + size(20), 4 * cell_h + size(20)))
+            for digit, cell in zip(DIGITS, cells):
+                image = self._image(digit, scale)
+                col, row = int(cell) % 3, int(cell) // 3
+                items.append((digit, image, left + col * cell_w + (cell_w - image.shape[1]) // 2,
+                              top + row * cell_h + (cell_h - image.shape[0]) // 2))
+            confirmar = self._image('confirmar', scale)
+            items.append(('confirmar', confirmar, left + (3 * cell_w - confirmar.shape[1]) // 2,
+                          top + 4 * cell_h + size(20)))
+        return items, panels
+
+    def _window(self, resolution):
+        """Janela do jogo: tela cheia ou um retângulo de 70-100% da área de trabalho em posição sorteada"""
+        width, height = resolution
+        if self.rng.random() < 0.5:
+            return (0, 0, width, height)
+        window_w = int(width * self.rng.uniform(0.7, 1.0))
+        window_h = int(height * self.rng.uniform(0.7, 1.0))
+        return (int(self.rng.integers(0, width - window_w + 1)), int(self.rng.integers(0, height - window_h + 1)),
+                window_w, window_h)
+
+    def frame(self, kind=None):
+        """Gera um frame (do tipo `kind` ou sorteado) com seus rótulos"""
+        kind = kind or self._choice(self.kinds)
+        resolution = self._choice(self.resolutions)
+        scale = float(self._choice(self.scales))
+        sigma = float(self.rng.uniform(*self.noise))
+        quality = self._choice(self.jpeg_qualities)
+
+        image = background(resolution, self.rng) // 3  # área de trabalho fora da janela
+        window = self._window(resolution)
+        left, top, window_w, window_h = window
+        image[top:top + window_h, left:left + window_w] = background((window_w, window_h), self.rng)
+
+        # Ícone/título da janela, sempre presente (é a imagem usada para focar o jogo)
+        placements = [('ragnarok', self._image('ragnarok', scale), left + 8, top + 4)]
+        items, panels = self._layout(kind, scale)
+        if items:
+            group_w = max(x + item.shape[1] for _, item, x, _ in items)
+            group_h = max(y + item.shape[0] for _, item, _, y in items)
+            title_h = placements[0][1].shape[0] + 12
+            span_x, span_y = window_w - group_w, window_h - group_h - title_h
+            if span_x < 0 or span_y < 0:
+                raise ValueError(f"Diálogo '{kind}' (escala {scale}) não cabe na janela {window_w}x{window_h}")
+            anchor_x = left + int(self.rng.integers(0, span_x + 1))
+            anchor_y = top + title_h + int(self.rng.integers(0, span_y + 1))
+            for px, py, pw, ph in panels:
+                image[anchor_y + py:anchor_y + py + ph, anchor_x + px:anchor_x + px + pw] //= 2
+            placements += [(key, item, anchor_x + x, anchor_y + y) for key, item, x, y in items]
+
+        labels = []
+        for key, item, x, y in placements:
+            paste(image, item, x, y)
+            height, width = item.shape[:2]
+            labels.append(Label(key, x + width // 2, y + height // 2, width, height))
+
+        if sigma > 0:
+            noisy = image.astype(np.float32) + self.rng.normal(0.0, sigma, image.shape).astype(np.float32)
+            image = np.clip(noisy, 0, 255).astype(np.uint8)
+        if quality:
+            ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+            if ok:
+                image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+        params = {'kind': kind, 'resolution': list(resolution), 'window': list(window),
+                  'scale': scale, 'noise': round(sigma, 2), 'jpeg': quality}
+        return SyntheticFrame(image, labels, params)
+
+    def frames(self, count, kind=None):
+        for _ in range(count):
+            yield self.frame(kind)
+
+
+def write_frames(frames, folder):
+    """Grava os frames como PNG e os rótulos/parâmetros em rotulos.jsonl; retorna quantos foram gravados"""
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    with open(os.path.join(folder, LABELS_FILE), 'w', encoding='utf-8') as f:
+        for index, frame in enumerate(frames):
+            name = f"frame_{index:05d}.png"
+            cv2.imwrite(os.path.join(folder, name), frame.image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            f.write(json.dumps({'file': name, 'params': frame.params,
+                                'labels': [label._asdict() for label in frame.labels]}) + '\n')
+            count += 1
+    return count
+
+
+def load_frames(folder):
+    """Lê os frames gravados por write_frames"""
+    with open(os.path.join(folder, LABELS_FILE), 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            image = cv2.imread(os.path.join(folder, entry['file']), cv2.IMREAD_COLOR)
+            if image is None:
+                raise FileNotFoundError(f"Frame '{entry['file']}' não encontrado em '{folder}'")
+            yield SyntheticFrame(image, [Label(**label) for label in entry['labels']], entry['params'])
+
+
+def _near(label, x, y):
+    tolerance = max(3, min(label.width, label.height) // 4)
+    return abs(label.x - x) <= tolerance and abs(label.y - y) <= tolerance
+
+
+def score(detections, labels, keys):
+    """
+    Compara detecções {chave: (x, y)} com os rótulos das chaves em `keys`.
+    Retorna (verdadeiros positivos, falsos positivos, falsos negativos); uma
+    detecção na posição errada conta como falso positivo e falso negativo.
+    """
+    truth = {label.key: label for label in labels if label.key in keys}
+    true_positives = false_positives = 0
+    for key, (x, y) in detections.items():
+        label = truth.get(key)
+        if label is not None and _near(label, x, y):
+            true_positives += 1
+        else:
+            false_positives += 1
+    return true_positives, false_positives, len(truth) - true_positives
+
+
+class _Tally:
+    def __init__(self):
+        self.tp = self.fp = self.fn = 0
+        self.seconds = 0.0
+        self.frames = 0
+
+    def add(self, counts, seconds):
+        tp, fp, fn = counts
+        self.tp += tp
+        self.fp += fp
+        self.fn += fn
+        self.seconds += seconds
+        self.frames += 1
+
+    def row(self, detector, threshold):
+        return {
+            'detector': detector,
+            'limiar': threshold,
+            'vp': self.tp,
+            'fp': self.fp,
+            'fn': self.fn,
+            'precisao': round(self.tp / (self.tp + self.fp), 4) if self.tp + self.fp else 1.0,
+            'revocacao': round(self.tp / (self.tp + self.fn), 4) if self.tp + self.fn else 1.0,
+            'ms_por_frame': round(1000 * self.seconds / self.frames, 3) if self.frames else 0.0,
+            'frames_por_s': round(self.frames / self.seconds, 2) if self.seconds else 0.0,
+        }
+
+
+def benchmark(frames, thresholds=THRESHOLDS, probes=PROBES, assets='.', color=True):
+    """
+    Precisão, revocação e tempo por frame do teclado do PIN (find_all_template_matches)
+    e de cada busca de tela (RegionLocator.locate, em cores ou, com `color=False`, em
+    tons de cinza), para cada limiar. Retorna as linhas do relatório.
+    """
+    registro = template_registry.registry()
+    keypad = registro.matcher({key: os.path.join(assets, f"{key}.png") for key in KEYPAD})
+    probe_paths = {key: os.path.join(assets, f"{key}.png") for key in probes}
+    registro.preload(probe_paths.values())
+
+    tallies = {}
+
+    def tally(detector, threshold):
+        return tallies.setdefault((detector, threshold), _Tally())
+
+    for frame in frames:
+        window = tuple(frame.params['window'])
+        window_image, window_origin = crop_view(frame.image, (0, 0), window)
+        capture.configure(backend=ReplayBackend([frame.image]), max_age=0.0)
+        for threshold in thresholds:
+            started = time.perf_counter()
+            found = funcoes.find_all_template_matches(window_image, keypad, threshold=threshold,
+                                                      keys=KEYPAD, origin=window_origin)
+            elapsed = time.perf_counter() - started
+            detections = {key: (x, y) for key, (x, y, _) in found.items()}
+            tally('find_all_template_matches', threshold).add(score(detections, frame.labels, KEYPAD), elapsed)
+
+            # Hotspots novos a cada frame: as posições sorteadas não se repetem entre frames
+            locator = RegionLocator(hotspots=HotspotIndex(path=None), window_provider=lambda: window, color=color)
+            for key, path in probe_paths.items():
+                started = time.perf_counter()
+                match = locator.locate(path, confidence=threshold)
+                elapsed = time.perf_counter() - started
+                detections = {key: (match.x, match.y)} if match else {}
+                tally(f"localizar {key}.png", threshold).add(score(detections, frame.labels, [key]), elapsed)
+
+    return [tallies[key].row(*key) for key in sorted(tallies, key=lambda k: (k[0] != 'find_all_template_matches', k))]
+
+
+def print_rows(rows):
+    print(f"{'detector':<32} {'limiar':>6} {'vp':>6} {'fp':>5} {'fn':>5} {'precisão':>9} {'revocação':>10} "
+          f"{'ms/frame':>9} {'frames/s':>9}")
+    for row in rows:
+        print(f"{row['detector']:<32} {row['limiar']:>6.2f} {row['vp']:>6} {row['fp']:>5} {row['fn']:>5} "
+              f"{row['precisao']:>9.3f} {row['revocacao']:>10.3f} {row['ms_por_frame']:>9.2f} "
+              f"{row['frames_por_s']:>9.1f}")
+
+
+def _floats(text):
+    return [float(value) for value in text.split(',') if value]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frames sintéticos rotulados e benchmark de precisão do matching")
+    parser.add_argument('--quantidade', type=int, default=20, help="frames gerados")
+    parser.add_argument('--resolucoes', default=','.join(f"{w}x{h}" for w, h in RESOLUTIONS),
+                        help="resoluções da área de trabalho, ex: 1280x720,1920x1080")
+    parser.add_argument('--escalas', default='1.0', help="escalas da interface, ex: 0.9,1.0,1.1")
+    parser.add_argument('--ruido', default='0,6', help="desvio padrão mínimo e máximo do ruído")
+    parser.add_argument('--jpeg', default='0,90,70', help="qualidades JPEG sorteadas (0 = sem JPEG)")
+    parser.add_argument('--limiares', default=','.join(str(t) for t in THRESHOLDS), help="limiares de confiança")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--gerar', metavar='PASTA', help="só grava os frames e os rótulos nesta pasta")
+    parser.add_argument('--pasta', help="usa os frames gravados nesta pasta em vez de gerar novos")
+    parser.add_argument('--json', help="grava os resultados neste arquivo")
+    parser.add_argument('--cinza', action='store_true',
+                        help="buscas de tela em tons de cinza (para comparar os limiares com a busca em cores)")
+    args = parser.parse_args(argv)
+
+    if args.pasta:
+        frames = list(load_frames(args.pasta))
+    else:
+        resolutions = [tuple(int(v) for v in text.lower().split('x')) for text in args.resolucoes.split(',') if text]
+        generator = FrameGenerator(resolutions=resolutions, scales=_floats(args.escalas),
+                                   noise=tuple(_floats(args.ruido)[:2]),
+                                   jpeg_qualities=[int(q) or None for q in _floats(args.jpeg)], seed=args.semente)
+        frames = generator.frames(args.quantidade)
+        if args.gerar:
+            count = write_frames(frames, args.gerar)
+            print(f"{count} frames gravados em '{args.gerar}' ({LABELS_FILE} com os rótulos).")
+            return 0
+        frames = list(frames)
+
+    use_quiet_log()
+    rows = benchmark(frames, _floats(args.limiares), color=not args.cinza)
+    print(f"{len(frames)} frames")
+    print_rows(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'frames': len(frames), 'resultados': rows}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
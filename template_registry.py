@@ -0,0 +1,292 @@
+"""
+Registro de templates decodificados uma única vez.
+
+Cada imagem (.png) usada pelo bot é lida do disco uma vez e guardada já
+pré-processada: colorida (BGR), tons de cinza e níveis da pirâmide (o canal
+alfa é descartado: nenhuma busca usa máscara). Os arrays são somente leitura e
+compartilhados por todos os detectores. O registro pode ser salvo em um único arquivo de pacote,
+que na próxima inicialização é mapeado em memória (np.memmap) em vez de
+decodificar os PNGs de novo.
+
+Formato do pacote: 8 bytes mágicos, tamanho do cabeçalho (uint64), cabeçalho
+JSON e os arrays brutos, cada um alinhado em 64 bytes. O cabeçalho guarda a
+data de modificação e o tamanho de cada PNG; entradas cujo PNG mudou são
+decodificadas de novo. Um pacote corrompido, de outra versão ou gerado com
+outro número de níveis é ignorado: os PNGs são decodificados e o pacote é
+regravado.
+"""
+import contextlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from matcher import TemplateMatcher, build_pyramid, to_bgr, to_gray
+
+PACK_FILE = 'templates.pack'
+PYRAMID_LEVELS = 3
+_MAGIC = b'RRTPACK1'
+_ALIGN = 64
+_VERSION = 2  # 2: sem a máscara do canal alfa
+
+# Versões pré-processadas de um template; `pyramid` não inclui o nível 0 (o próprio `gray`)
+TemplateAsset = namedtuple('TemplateAsset', ['color', 'gray', 'pyramid'])
+
+
+def _readonly(array):
+    if array is not None:
+        array.setflags(write=False)
+    return array
+
+
+def decode_template(path, levels=PYRAMID_LEVELS):
+    """Lê um PNG e gera todas as versões pré-processadas (somente leitura)"""
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED) if os.path.exists(path) else None
+    if image is None:
+        raise FileNotFoundError(f"Imagem '{path}' não encontrada ou inválida")
+    color = to_bgr(image)
+    gray = to_gray(color)
+    pyramid = tuple(_readonly(level) for level in build_pyramid(gray, levels)[1:])
+    return TemplateAsset(_readonly(color), _readonly(gray), pyramid)
+
+
+def _source_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class TemplateRegistry:
+    """
+    Templates indexados pelo caminho do PNG, decodificados no primeiro uso.
+
+    Depois de carregado, `get` não acessa mais o disco. Entradas novas marcam
+    o registro como alterado (`dirty`), para que o pacote seja salvo de novo.
+    """
+
+    def __init__(self, pack_path=None, levels=PYRAMID_LEVELS):
+        self.pack_path = pack_path
+        self.levels = levels
+        self.dirty = False
+        self._assets = {}
+        self._sources = {}
+        self._mapped = None  # (caminho do pacote mapeado, chaves que apontam para ele)
+        self._lock = threading.Lock()
+        if pack_path and os.path.exists(pack_path):
+            self.load_pack(pack_path)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.normpath(path))
+
+    def get(self, path):
+        """TemplateAsset do PNG em `path` (decodificado apenas na primeira vez)"""
+        key = self._key(path)
+        asset = self._assets.get(key)
+        if asset is not None:
+            return asset
+        with self._lock:
+            asset = self._assets.get(key)
+            if asset is None:
+                asset = decode_template(path, self.levels)
+                self._assets[key] = asset
+                self._sources[key] = _source_stat(path)
+                self.dirty = True
+        return asset
+
+    def gray(self, path):
+        return self.get(path).gray
+
+    def color(self, path):
+        return self.get(path).color
+
+    def preload(self, paths):
+        """Decodifica (ou confirma no pacote) cada caminho; retorna os que não puderam ser lidos"""
+        missing = []
+        for path in paths:
+            try:
+                self.get(path)
+            except FileNotFoundError:
+                missing.append(path)
+        return missing
+
+    def matcher(self, paths, **kwargs):
+        """
+        TemplateMatcher para {chave: caminho}, reaproveitando os arrays e as pirâmides
+        do registro (com `color=True`, as versões BGR; a pirâmide é calculada no uso)
+        """
+        matcher = TemplateMatcher({}, **kwargs)
+        for key, path in paths.items():
+            asset = self.get(path)
+            if matcher.color:
+                matcher.add_template(key, asset.color)
+            else:
+                matcher.add_template(key, asset.gray, pyramid=asset.pyramid)
+        return matcher
+
+    def __contains__(self, path):
+        return self._key(path) in self._assets
+
+    def __len__(self):
+        return len(self._assets)
+
+    def load_pack(self, path):
+        """
+        Carrega as entradas ainda válidas do pacote; retorna quantas foram aproveitadas.
+
+        Um pacote ilegível (corrompido, truncado, de outra versão ou com outro
+        número de níveis) não é usado: retorna 0 e marca o registro como
+        alterado, para que os PNGs sejam decodificados e o pacote regravado.
+        """
+        try:
+            return self._load_pack(path)
+        except (OSError, ValueError, KeyError, TypeError, IndexError, AttributeError):
+            self.dirty = True
+            return 0
+
+    def _load_pack(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"'{path}' não é um pacote de templates")
+            header_size = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            if header_size > os.fstat(f.fileno()).st_size:
+                raise ValueError(f"pacote '{path}' truncado")
+            header = json.loads(f.read(header_size).decode('utf-8'))
+        if header.get('version') != _VERSION or header.get('levels') != self.levels:
+            raise ValueError(f"pacote '{path}' de outra versão ou com outro número de níveis")
+        data_start = header['data_start']
+        entries = header['assets']
+        fresh = {key: entry for key, entry in entries.items() if _source_stat(key) == entry['source']}
+
+        # Com entradas desatualizadas o pacote será reescrito: lê para a memória em vez de
+        # mapear, para não manter o arquivo aberto (no Windows ele não poderia ser substituído)
+        if len(fresh) == len(entries):
+            data = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            data = np.fromfile(path, dtype=np.uint8)
+            data.setflags(write=False)
+
+        def array(spec):
+            if spec is None:
+                return None
+            offset, shape, dtype = spec
+            count = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            start = data_start + offset
+            # Um pacote truncado gera uma fatia menor e o reshape falha (ValueError)
+            return data[start:start + count].view(dtype).reshape(shape)
+
+        # Monta todas as entradas antes de usar qualquer uma: um erro no meio não deixa o registro pela metade
+        assets = {}
+        for key, entry in fresh.items():
+            arrays = entry['arrays']
+            pyramid = tuple(array(spec) for spec in arrays['pyramid'])
+            assets[key] = TemplateAsset(array(arrays['color']), array(arrays['gray']), pyramid)
+
+        with self._lock:
+            for key, asset in assets.items():
+                self._assets[key] = asset
+                self._sources[key] = fresh[key]['source']
+            if isinstance(data, np.memmap):
+                self._mapped = (os.path.abspath(path), set(assets))
+            if len(fresh) != len(entries):
+                self.dirty = True
+        return len(fresh)
+
+    def _release_pack(self, path):
+        """
+        Copia para a memória as entradas mapeadas do pacote `path`, para que o
+        arquivo possa ser substituído (no Windows um arquivo mapeado não pode).
+        """
+        with self._lock:
+            if self._mapped is None or self._mapped[0] != os.path.abspath(path):
+                return
+            _, keys = self._mapped
+            self._mapped = None
+            for key in keys:
+                asset = self._assets.get(key)
+                if asset is None:
+                    continue
+                self._assets[key] = TemplateAsset(
+                    _readonly(np.array(asset.color)), _readonly(np.array(asset.gray)),
+                    tuple(_readonly(np.array(level)) for level in asset.pyramid))
+
+    def save_pack(self, path=None):
+        """Grava todos os templates do registro em um único arquivo (escrita atômica)"""
+        path = path or self.pack_path or PACK_FILE
+        tmp_path = f"{path}.tmp"
+        try:
+            self._write_pack(tmp_path)
+            # Solta o mapeamento do pacote antigo antes de substituí-lo
+            self._release_pack(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        self.dirty = False
+        return path
+
+    def _write_pack(self, path):
+        with self._lock:
+            items = list(self._assets.items())
+            sources = dict(self._sources)
+
+        blobs = []
+        offset = 0
+
+        def add(array):
+            nonlocal offset
+            if array is None:
+                return None
+            array = np.ascontiguousarray(array)
+            spec = [offset, list(array.shape), array.dtype.str]
+            blobs.append((offset, array))
+            offset += -(-array.nbytes // _ALIGN) * _ALIGN
+            return spec
+
+        entries = {}
+        for key, asset in items:
+            entries[key] = {
+                'source': sources.get(key),
+                'arrays': {
+                    'color': add(asset.color),
+                    'gray': add(asset.gray),
+                    'pyramid': [add(level) for level in asset.pyramid],
+                },
+            }
+
+        header = {'version': _VERSION, 'levels': self.levels, 'assets': entries, 'data_start': 0}
+        # data_start depende do tamanho do próprio cabeçalho: reserva espaço e alinha
+        encoded = json.dumps(header).encode('utf-8')
+        data_start = -(-(len(_MAGIC) + 8 + len(encoded) + 32) // _ALIGN) * _ALIGN
+        header['data_start'] = data_start
+        encoded = json.dumps(header).encode('utf-8')
+        encoded += b' ' * (data_start - len(_MAGIC) - 8 - len(encoded))
+
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(np.array([len(encoded)], dtype='<u8').tobytes())
+            f.write(encoded)
+            for blob_offset, array in blobs:
+                f.seek(data_start + blob_offset)
+                f.write(array.tobytes())
+
+
+_registry = TemplateRegistry()
+
+
+def registry():
+    """Registro compartilhado por todos os detectores"""
+    return _registry
+
+
+def configure(pack_path=PACK_FILE, levels=PYRAMID_LEVELS):
+    """Substitui o registro compartilhado por um carregado do pacote `pack_path` (se existir)"""
+    global _registry
+    _registry = TemplateRegistry(pack_path, levels)
+    return _registry
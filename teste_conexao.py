@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Teste da vigia de conexão (net_watch.ConnectionWatch) contra um servidor local.
+
+Uso: python teste_conexao.py
+
+Sobe um servidor TCP em 127.0.0.1 no lugar do servidor do jogo e um processo
+"cliente" que se conecta a ele (e a um serviço auxiliar, que fecha logo).
+A vigia acompanha só a porta do servidor e deve:
+- ignorar a conexão auxiliar e armar só depois da sessão durar `ARMAR_APOS`;
+- não acusar queda quando o servidor derruba a sessão e o cliente reconecta
+  em menos de `TOLERANCIA` (troca de char/mapa);
+- acusar a queda, uma única vez, quando o servidor sai do ar.
+Não precisa do jogo nem de tela; termina com código 1 se algo falhar.
+"""
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from net_watch import ConnectionWatch
+
+ARMAR_APOS = 1.0
+TOLERANCIA = 1.5
+INTERVALO = 0.1
+
+# Cliente falso: conecta no servidor e no serviço auxiliar, fecha o auxiliar e
+# reconecta ao servidor sempre que a sessão cai (enquanto o servidor aceitar)
+CLIENTE = """
+import socket, sys, time
+porta, auxiliar = int(sys.argv[1]), int(sys.argv[2])
+aux = socket.create_connection(('127.0.0.1', auxiliar))
+while True:
+    try:
+        sessao = socket.create_connection(('127.0.0.1', porta))
+    except OSError:
+        time.sleep(60)
+        break
+    if aux is not None:
+        time.sleep(0.5)
+        aux.close()
+        aux = None
+    while sessao.recv(64):
+        pass
+    sessao.close()
+    time.sleep(0.3)
+"""
+
+
+class ServidorFalso:
+    """Aceita conexões em uma porta local e permite derrubá-las"""
+
+    def __init__(self):
+        self.escuta = socket.create_server(('127.0.0.1', 0))
+        self.escuta.settimeout(0.05)
+        self.porta = self.escuta.getsockname()[1]
+        self.conexoes = []
+        self.no_ar = True
+        self._thread = threading.Thread(target=self._aceitar, daemon=True)
+        self._thread.start()
+
+    def _aceitar(self):
+        while self.no_ar:
+            try:
+                conexao, _ = self.escuta.accept()
+            except socket.timeout:
+                continue
+            self.conexoes.append(conexao)
+
+    def derrubar(self):
+        for conexao in self.conexoes:
+            conexao.close()
+        self.conexoes.clear()
+
+    def sair_do_ar(self):
+        self.no_ar = False
+        self._thread.join()
+        self.escuta.close()
+        self.derrubar()
+
+
+def acompanhar(vigia, segundos, quedas):
+    """Consulta a vigia por `segundos`; guarda em `quedas` o instante de cada queda informada"""
+    fim = time.monotonic() + segundos
+    while time.monotonic() < fim:
+        if vigia.poll():
+            quedas.append(time.monotonic())
+        time.sleep(INTERVALO)
+
+
+def main():
+    servidor = ServidorFalso()
+    auxiliar = ServidorFalso()
+    cliente = subprocess.Popen([sys.executable, '-c', CLIENTE, str(servidor.porta), str(auxiliar.porta)])
+    vigia = ConnectionWatch(pid=cliente.pid, ports=[servidor.porta], grace=TOLERANCIA, arm_after=ARMAR_APOS)
+    falhas = []
+    quedas = []
+    try:
+        acompanhar(vigia, ARMAR_APOS / 2, quedas)
+        if vigia.armed:
+            falhas.append("vigia armou antes da sessão durar ARMAR_APOS")
+        acompanhar(vigia, ARMAR_APOS + 0.5, quedas)
+        if not vigia.armed:
+            falhas.append("vigia não armou com a sessão estabelecida")
+
+        print("Servidor derruba a sessão; o cliente reconecta (troca de mapa)...")
+        servidor.derrubar()
+        acompanhar(vigia, TOLERANCIA + 1.0, quedas)
+        if quedas:
+            falhas.append("queda acusada durante a troca de servidor")
+
+        print("Servidor sai do ar...")
+        inicio = time.monotonic()
+        servidor.sair_do_ar()
+        acompanhar(vigia, TOLERANCIA + 1.5, quedas)
+        if len(quedas) != 1:
+            falhas.append(f"esperada 1 queda, informadas {len(quedas)}")
+        else:
+            print(f"Queda informada {quedas[0] - inicio:.2f}s depois do servidor sair do ar "
+                  f"({vigia.polls} consultas).")
+    finally:
+        cliente.kill()
+        auxiliar.sair_do_ar()
+
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("OK" if not falhas else f"{len(falhas)} falha(s)")
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()